@@ -0,0 +1,89 @@
+"""
+Compare the build time, latency and recall@k of the IVF index with the exact local search.
+
+The embeddings are written to the binary .npy file, the index is built for every number of lists,
+saved next to it and loaded memory-mapped, as by the application. Every index is queried with
+every nprobe, the number of the lists scanned by a query, and recall@k is measured against the
+exact search as in benchmarks/quantization_recall.py. The scanned share is the average share of
+the embeddings scored by a query.
+
+    python benchmarks/ann_recall.py --synthetic-rows 1000000 --dimensions 256 --lists 1000,4000 --nprobe 8,32,128
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api.ann_index import IVFIndex  # noqa: E402
+from api.embeddings_store import Embeddings, load_embeddings, save_embeddings  # noqa: E402
+from api.local_search import LocalSearchIndex  # noqa: E402
+from quantization_recall import measure, synthetic_embeddings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--embeddings-file", default=str(SRC_DIR / "api" / "data" / "embeddings.csv"),
+        help="The embeddings file to search.")
+    parser.add_argument("--synthetic-rows", type=int, default=0, help="The number of the synthetic embeddings.")
+    parser.add_argument("--dimensions", type=int, default=1536, help="The dimensions of the synthetic embeddings.")
+    parser.add_argument("--k", type=int, default=5, help="The number of results.")
+    parser.add_argument("--queries", type=int, default=500, help="The number of queries.")
+    parser.add_argument(
+        "--lists", default=None, help="The numbers of the IVF lists, comma separated, 4 * sqrt(rows) by default.")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="The numbers of the scanned lists, comma separated.")
+    args = parser.parse_args()
+
+    if args.synthetic_rows:
+        matrix = synthetic_embeddings(args.synthetic_rows, args.dimensions)
+    else:
+        matrix = np.array(load_embeddings(args.embeddings_file).vectors, dtype=np.float32)
+    rng = np.random.default_rng(1)
+    queries = matrix[rng.integers(0, len(matrix), args.queries)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as d:
+        embeddings_file = os.path.join(d, "embeddings.npy")
+        save_embeddings(Embeddings([""] * len(matrix), [""] * len(matrix), matrix), embeddings_file)
+        del matrix
+        exact_index = LocalSearchIndex.from_file(embeddings_file, model="")
+        exact = [[score for _, score in exact_index.query(query, top_k=args.k)] for query in queries]
+        results = [dict({"index": "exact"}, **measure(exact_index, queries, exact, args.k))]
+
+        lists = [int(n) for n in args.lists.split(",")] if args.lists else [IVFIndex.default_lists(len(exact_index))]
+        for list_count in lists:
+            start = time.perf_counter()
+            IVFIndex.build(exact_index.embeddings, list_count).save(embeddings_file)
+            build_time = time.perf_counter() - start
+            start = time.perf_counter()
+            ivf = IVFIndex.load(embeddings_file)
+            load_time = time.perf_counter() - start
+            for nprobe in [int(n) for n in args.nprobe.split(",")]:
+                index = LocalSearchIndex.from_file(embeddings_file, model="", ann_index=ivf, nprobe=nprobe)
+                scanned = np.mean([len(ivf.candidates(query, nprobe)) for query in queries[:50]]) / len(ivf)
+                result = {
+                    "index": "ivf",
+                    "lists": list_count,
+                    "nprobe": nprobe,
+                    "build_s": round(build_time, 2),
+                    "load_ms": round(load_time * 1000, 2),
+                    "scanned_share": round(float(scanned), 4),
+                }
+                result.update(measure(index, queries, exact, args.k))
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+        documents, dimensions = exact_index.embeddings.shape
+        del exact_index, index, ivf
+    print(json.dumps({"documents": documents, "dimensions": dimensions, "k": args.k, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare load time and memory of the csv and the binary embeddings formats.
+
+Each format is loaded in a fresh process, which reports the time to load the embeddings
+into the LocalSearchIndex and the resident set size growth after loading and after the first query.
+Use --scale to replicate the rows of the bundled file and emulate a larger catalog.
+
+    python benchmarks/embeddings_load.py --scale 100
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api import embeddings_store  # noqa: E402
+from api.embeddings_store import Embeddings  # noqa: E402
+from api.local_search import LocalSearchIndex  # noqa: E402
+
+
+def rss_mb() -> float:
+    """Return the current resident set size of the process in megabytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # The peak size is the best approximation on the platforms without procfs.
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
+
+
+def measure(embeddings_file: str, queue: multiprocessing.Queue) -> None:
+    baseline = rss_mb()
+    start = time.perf_counter()
+    index = LocalSearchIndex.from_file(embeddings_file, model="")
+    load_time = time.perf_counter() - start
+    after_load = rss_mb()
+    index.query(np.ones(index.embeddings.shape[1], dtype=np.float32))
+    queue.put({
+        "documents": len(index),
+        "file_mb": round(os.path.getsize(embeddings_file) / 2**20, 2),
+        "load_ms": round(load_time * 1000, 2),
+        "rss_load_mb": round(after_load - baseline, 2),
+        "rss_query_mb": round(rss_mb() - baseline, 2),
+    })
+
+
+def run_isolated(embeddings_file: str) -> Dict[str, float]:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=measure, args=(embeddings_file, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--embeddings-file", default=str(SRC_DIR / "api" / "data" / "embeddings.csv"),
+        help="The csv embeddings file.")
+    parser.add_argument("--scale", type=int, default=1, help="The number of times to replicate the rows.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        source = embeddings_store.read_csv(args.embeddings_file)
+        embeddings = Embeddings(
+            list(source.tokens) * args.scale,
+            list(source.titles) * args.scale,
+            np.tile(source.vectors, (args.scale, 1)))
+        csv_file = os.path.join(d, "embeddings.csv")
+        embeddings_store.write_csv(embeddings, csv_file)
+        npy_file = embeddings_store.convert_csv(csv_file)
+        results = {
+            "csv": run_isolated(csv_file),
+            "npy": run_isolated(npy_file),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
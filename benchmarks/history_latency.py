@@ -0,0 +1,136 @@
+"""
+Compare the response time of the full chat history with the paginated one.
+
+The agents client is stubbed: the message list pages and the file lookups sleep for the
+configured latency, so no Azure resources are needed. For each thread size the benchmark
+measures reading the whole thread, formatting one message at a time, as /chat/history used to do,
+reading it in the pages with get_history, as /chat/history does without the limit, and reading
+the first page with get_history_page. The file name cache is cleared before each run.
+
+    python benchmarks/history_latency.py --sizes 10 100 1000 --limit 20
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+from azure.core.async_paging import AsyncItemPaged, AsyncList
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api import routes  # noqa: E402
+
+
+class Citation:
+    def __init__(self, file_id: str):
+        self._file_id = file_id
+
+    def as_dict(self) -> Dict:
+        return {'file_citation': {'file_id': self._file_id}}
+
+
+def make_message(i: int, files: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"msg_{i}",
+        role="user" if i % 2 == 0 else "assistant",
+        created_at=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc),
+        text_messages=[SimpleNamespace(text=SimpleNamespace(value=f"message {i} " * 20))],
+        file_citation_annotations=[] if i % 2 == 0 else [Citation(f"file_{i % files}")],
+        url_citation_annotations=[],
+    )
+
+
+class StubAgentsClient:
+    """The agents client with the thread of synthetic messages and the simulated latency."""
+
+    def __init__(self, messages: List[SimpleNamespace], list_latency: float, file_latency: float):
+        self._messages = list(reversed(messages))
+        self._list_latency = list_latency
+        self._file_latency = file_latency
+        self.messages = SimpleNamespace(list=self._list)
+        self.files = SimpleNamespace(get=self._get_file)
+
+    def _list(self, thread_id, limit=None, order=None, before=None):
+        limit = limit or 20
+        ids = [m.id for m in self._messages]
+
+        async def get_next(continuation_token=None):
+            await asyncio.sleep(self._list_latency)
+            start = ids.index(continuation_token) + 1 if continuation_token else 0
+            return self._messages[start:start + limit]
+
+        async def extract_data(page):
+            return (page[-1].id if page else None), AsyncList(page)
+
+        return AsyncItemPaged(get_next, extract_data)
+
+    async def _get_file(self, file_id):
+        await asyncio.sleep(self._file_latency)
+        return SimpleNamespace(id=file_id, filename=f"{file_id}.md")
+
+
+async def full_history(agent_client: StubAgentsClient, thread_id: str) -> List[Dict]:
+    """Read the whole thread sequentially, as the endpoint did before pagination."""
+    content = []
+    async for message in agent_client.messages.list(thread_id=thread_id):
+        formatted_message = await routes.get_message_and_annotations(agent_client, message)
+        formatted_message['role'] = message.role
+        formatted_message['created_at'] = message.created_at.astimezone().strftime("%m/%d/%y, %I:%M %p")
+        content.append(formatted_message)
+    return content
+
+
+async def first_page(agent_client: StubAgentsClient, thread_id: str, limit: int) -> List[Dict]:
+    content, _ = await routes.get_history_page(agent_client, thread_id, limit)
+    return content
+
+
+async def measure(coroutine_factory, iterations: int) -> Dict[str, float]:
+    times = []
+    for _ in range(iterations):
+        routes.file_name_cache.clear()
+        start = time.perf_counter()
+        messages = await coroutine_factory()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "messages": len(messages),
+        "p50_ms": round(times[len(times) // 2] * 1000, 2),
+        "max_ms": round(times[-1] * 1000, 2),
+    }
+
+
+async def run(args) -> Dict[str, Dict]:
+    results = {}
+    for size in args.sizes:
+        client = StubAgentsClient(
+            [make_message(i, args.files) for i in range(size)],
+            args.list_latency / 1000, args.file_latency / 1000)
+        results[str(size)] = {
+            "full": await measure(lambda: full_history(client, "thread_1"), args.iterations),
+            "paged_full": await measure(lambda: routes.get_history(client, "thread_1"), args.iterations),
+            "page": await measure(lambda: first_page(client, "thread_1", args.limit), args.iterations),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="The thread sizes.")
+    parser.add_argument("--limit", type=int, default=20, help="The page size.")
+    parser.add_argument("--files", type=int, default=50, help="The number of distinct cited files.")
+    parser.add_argument("--list-latency", type=float, default=30.0, help="The latency of a message page in ms.")
+    parser.add_argument("--file-latency", type=float, default=10.0, help="The latency of a file lookup in ms.")
+    parser.add_argument("--iterations", type=int, default=5, help="The number of runs per measurement.")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
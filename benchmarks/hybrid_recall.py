@@ -0,0 +1,190 @@
+"""
+Compare recall@k and latency of the vector, the full text and the hybrid search of SearchIndexManager.
+
+The queries are read from evals/eval-queries.json. A query may list the embedId of its relevant
+chunks in "relevant"; otherwise its relevant chunks are the top k of the semantic ranker over
+the chunks, pooled by the exhaustive vector and the full text queries, so the reranker is used
+as the judge. Needs the existing index: AZURE_AI_SEARCH_ENDPOINT, AZURE_AI_SEARCH_INDEX_NAME
+and AZURE_AI_EMBED_DIMENSIONS.
+
+With --offline, the synthetic corpus of benchmarks/retrieval_suite.py is uploaded to the in-process
+stand-in for Azure AI Search and embedded by the fake embedding client of benchmarks/search_stubs.py,
+so no Azure resources are needed. The queries are drawn from the words of random chunks, and the chunk
+of a query is its relevant chunk. The stand-in has no semantic ranker, so the recall compares
+the vector, full text and hybrid queries only against these synthetic judgements.
+
+    python benchmarks/hybrid_recall.py --k 5 --iterations 10
+    python benchmarks/hybrid_recall.py --offline --corpus-size 2000 --offline-queries 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Set
+
+import numpy as np
+from dotenv import load_dotenv
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api.search_index_manager import SearchIndexManager  # noqa: E402
+from retrieval_suite import Corpus, create_manager, use_service, write_embeddings_file  # noqa: E402
+from search_stubs import FakeEmbeddingClient, FakeSearchService  # noqa: E402
+
+QUERIES_FILE = Path(__file__).parent.parent / "evals" / "eval-queries.json"
+
+
+async def get_judged_relevant(search_mgr: SearchIndexManager, query: str, k: int) -> Set[str]:
+    """Return the top k chunks of the semantic ranker over the pooled candidates."""
+    from azure.search.documents.models import VectorizableTextQuery
+    results = await search_mgr._search_documents(
+        search_text=query,
+        vector_queries=[VectorizableTextQuery(text=query, k_nearest_neighbors=50, fields="embedding", exhaustive=True)],
+        query_type="semantic",
+        semantic_configuration_name=SearchIndexManager._SEMANTIC_CONFIG,
+        select=['embedId'],
+        top=50,
+    )
+    results.sort(key=lambda result: -(result.get('@search.reranker_score') or 0.0))
+    return {result['embedId'] for result in results[:k]}
+
+
+async def measure(
+        search: Callable[[str], Awaitable[List[Dict]]],
+        queries: List[Dict],
+        relevant: List[Set[str]],
+        k: int,
+        iterations: int
+) -> Dict[str, float]:
+    latencies = []
+    recalls = []
+    for _ in range(iterations):
+        for query, query_relevant in zip(queries, relevant):
+            start = time.perf_counter()
+            documents = await search(query["query"])
+            latencies.append(time.perf_counter() - start)
+            found = {document['embedId'] for document in documents[:k]}
+            recalls.append(len(found & query_relevant) / max(1, min(k, len(query_relevant))))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 3),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+    }
+
+
+async def measure_modes(
+        search_mgr: SearchIndexManager,
+        queries: List[Dict],
+        relevant: List[Set[str]],
+        args: argparse.Namespace
+) -> Dict:
+    from azure.search.documents.models import VectorizableTextQuery
+
+    k = args.k
+    select = ['embedId', 'token', 'title']
+    # The query cache is not set, so every search is sent to the service.
+    modes = {
+        "vector": lambda q: search_mgr._search_documents(
+            vector_queries=[VectorizableTextQuery(text=q, k_nearest_neighbors=k, fields="embedding")],
+            select=select, top=k),
+        "full_text": lambda q: search_mgr._search_documents(
+            search_text=q, query_type="full", search_fields=['token', 'title'], select=select, top=k),
+        "hybrid": lambda q: search_mgr.hybrid_search_documents(q, k, args.candidates),
+        "hybrid_combined": lambda q: search_mgr.hybrid_search_documents(q, k, args.candidates, combined=True),
+    }
+    results = {"k": k, "queries": len(queries), "candidates": args.candidates}
+    for name, search in modes.items():
+        results[name] = await measure(search, queries, relevant, k, args.iterations)
+    return results
+
+
+async def benchmark_offline(args: argparse.Namespace) -> Dict:
+    corpus = Corpus(args.seed)
+    service = FakeSearchService(latency=args.latency / 1000, semantic_latency=args.semantic_latency / 1000)
+    with tempfile.TemporaryDirectory() as work_dir, use_service(service):
+        embeddings_file = os.path.join(work_dir, "embeddings.npy")
+        tokens = write_embeddings_file(corpus, args.corpus_size, args.dimensions, embeddings_file)
+        search_mgr = create_manager(args.dimensions, FakeEmbeddingClient(args.dimensions))
+        await search_mgr.create_index()
+        await search_mgr.upload_documents(embeddings_file)
+        await search_mgr.wait_until_consistent()
+        # upload_documents sets embedId to the row of the chunk in the embeddings file.
+        rows = np.random.default_rng(args.seed + 1).integers(0, args.corpus_size, args.offline_queries)
+        queries = [{"query": corpus.query(tokens[row])} for row in rows]
+        relevant = [{str(row)} for row in rows]
+        results = await measure_modes(search_mgr, queries, relevant, args)
+        await search_mgr.close()
+    return dict(
+        results, documents=args.corpus_size, latency_ms=args.latency, semantic_latency_ms=args.semantic_latency)
+
+
+async def benchmark(args: argparse.Namespace) -> Dict:
+    from azure.identity.aio import DefaultAzureCredential
+
+    with open(args.queries) as f:
+        queries = json.load(f)
+    embedding = os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME")
+    k = args.k
+    async with DefaultAzureCredential(exclude_shared_token_cache_credential=True) as creds:
+        search_mgr = SearchIndexManager(
+            endpoint=os.environ["AZURE_AI_SEARCH_ENDPOINT"],
+            credential=creds,
+            index_name=os.environ["AZURE_AI_SEARCH_INDEX_NAME"],
+            dimensions=None,
+            model=embedding,
+            deployment_name=embedding,
+            embedding_endpoint="",
+            embed_api_key=None,
+        )
+        # The index already exists, create_index only fetches its definition.
+        await search_mgr.create_index(vector_index_dimensions=int(os.environ["AZURE_AI_EMBED_DIMENSIONS"]))
+        relevant = [
+            set(query["relevant"]) if query.get("relevant")
+            else await get_judged_relevant(search_mgr, query["query"], k)
+            for query in queries]
+        results = await measure_modes(search_mgr, queries, relevant, args)
+        await search_mgr.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=SearchIndexManager.DEFAULT_TOP_K, help="The number of chunks.")
+    parser.add_argument(
+        "--candidates", type=int, default=SearchIndexManager.DEFAULT_HYBRID_CANDIDATES,
+        help="The number of chunks, retrieved by each query of the hybrid search.")
+    parser.add_argument("--iterations", type=int, default=10, help="The number of runs over the queries.")
+    parser.add_argument("--queries", default=str(QUERIES_FILE), help="The JSON file with the queries.")
+    parser.add_argument(
+        "--offline", action="store_true", help="Search the synthetic corpus in the in-process stand-in for Azure.")
+    parser.add_argument("--corpus-size", type=int, default=2000, help="The number of the synthetic chunks, offline.")
+    parser.add_argument("--offline-queries", type=int, default=50, help="The number of the synthetic queries.")
+    parser.add_argument("--dimensions", type=int, default=256, help="The number of dimensions, offline.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the synthetic corpus.")
+    parser.add_argument("--latency", type=float, default=20.0, help="The latency of a search request in ms, offline.")
+    parser.add_argument(
+        "--semantic-latency", type=float, default=50.0,
+        help="The additional latency of the semantic ranker in ms, offline.")
+    args = parser.parse_args()
+
+    if args.offline:
+        print(json.dumps(asyncio.run(benchmark_offline(args)), indent=2))
+        return
+
+    load_dotenv(dotenv_path=SRC_DIR / ".env")
+    if not all(os.getenv(v) for v in (
+            "AZURE_AI_SEARCH_ENDPOINT", "AZURE_AI_SEARCH_INDEX_NAME", "AZURE_AI_EMBED_DIMENSIONS")):
+        print("Azure AI Search is not configured, set AZURE_AI_SEARCH_ENDPOINT, AZURE_AI_SEARCH_INDEX_NAME "
+              "and AZURE_AI_EMBED_DIMENSIONS.", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(asyncio.run(benchmark(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
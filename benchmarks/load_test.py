@@ -0,0 +1,221 @@
+"""
+Find the number of workers and the concurrent streams per worker, which serve the chat load best.
+
+gunicorn runs the application with the stub agent of benchmarks/stubs.py: each chat creates
+a thread and a message and streams the message deltas at the configured interval, so the workers
+are I/O bound as in production. For every workers x connections combination, the client keeps
+the connections busy with chats for the duration and reports the completed chats per second,
+the time to the first event and to the end of the stream, the chats rejected over
+MAX_CONCURRENT_STREAMS and the memory (PSS) of gunicorn. The recommendation is the combination with
+the most chats per second, whose p95 time to the first event is within the SLO, which rejects
+few chats and whose memory is within the budget. The client runs in this process and takes
+a share of the cores.
+
+    python benchmarks/load_test.py --workers 1,2,4 --connections 50,200 --stream-limit 100
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+
+BENCHMARKS_DIR = Path(__file__).parent
+SRC_DIR = BENCHMARKS_DIR.parent / "src"
+
+
+def stub_app():
+    """The application factory for gunicorn, with the stub project client and credential."""
+    sys.path.insert(0, str(SRC_DIR))
+    from api import main
+    from stubs import StubCredential, make_stub_client
+
+    latency = float(os.environ["STUB_LATENCY_MS"]) / 1000
+    main.AIProjectClient = make_stub_client(
+        latency,
+        deltas=int(os.environ["STUB_DELTAS"]),
+        delta_interval=float(os.environ["STUB_DELTA_INTERVAL_MS"]) / 1000)
+    main.DefaultAzureCredential = lambda **kwargs: StubCredential(latency)
+    return main.create_app()
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_pss_mb(pid: int) -> float:
+    """Return the proportional set size of the process, so the memory shared after the fork is counted once."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def get_children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The parent PID is the second field after the parenthesized command.
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return children
+
+
+def start_gunicorn(workers: int, port: int, args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([str(SRC_DIR), str(BENCHMARKS_DIR)]),
+        RUNNING_IN_PRODUCTION="true",
+        AZURE_EXISTING_AGENT_ID="asst_stub",
+        ENABLE_AZURE_MONITOR_TRACING="false",
+        MAX_CONCURRENT_STREAMS=str(args.stream_limit),
+        STUB_LATENCY_MS=str(args.latency),
+        STUB_DELTAS=str(args.deltas),
+        STUB_DELTA_INTERVAL_MS=str(args.delta_interval),
+    )
+    # Started in the benchmarks directory, so gunicorn does not load src/gunicorn.conf.py.
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "load_test:stub_app()",
+         "--worker-class", "uvicorn.workers.UvicornWorker", "--workers", str(workers),
+         "--bind", f"127.0.0.1:{port}", "--preload", "--log-level", "warning"],
+        cwd=BENCHMARKS_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/agent") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"gunicorn did not start at {url}")
+
+
+async def run_load(url: str, connections: int, duration: float) -> Dict[str, List[float]]:
+    results: Dict[str, List[float]] = {"first_event": [], "stream": [], "rejected": [], "errors": []}
+    deadline = time.monotonic() + duration
+
+    async def client(session: aiohttp.ClientSession) -> None:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/chat", json={"message": "What is the warranty?"}) as response:
+                    if response.status == 503:
+                        await response.read()
+                        results["rejected"].append(start)
+                        await asyncio.sleep(0.05)
+                        continue
+                    first = None
+                    async for _ in response.content.iter_any():
+                        if first is None:
+                            first = time.perf_counter()
+                    end = time.perf_counter()
+                if response.status != 200 or first is None:
+                    results["errors"].append(start)
+                    continue
+                results["first_event"].append(first - start)
+                results["stream"].append(end - start)
+            except aiohttp.ClientError:
+                results["errors"].append(start)
+
+    connector = aiohttp.TCPConnector(limit=connections)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as session:
+        await asyncio.gather(*(client(session) for _ in range(connections)))
+    return results
+
+
+def percentile_ms(values: List[float], percent: int) -> Optional[float]:
+    if len(values) < 2:
+        return round(values[0] * 1000, 1) if values else None
+    return round(statistics.quantiles(values, n=100)[percent - 1] * 1000, 1)
+
+
+def measure(workers: int, connections: int, args: argparse.Namespace) -> Dict:
+    port = get_free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = start_gunicorn(workers, port, args)
+    try:
+        asyncio.run(wait_ready(url))
+        results = asyncio.run(run_load(url, connections, args.duration))
+        memory = get_pss_mb(server.pid) + sum(get_pss_mb(pid) for pid in get_children(server.pid))
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return {
+        "workers": workers,
+        "connections": connections,
+        "chats_per_sec": round(len(results["stream"]) / args.duration, 1),
+        "first_event_p50_ms": percentile_ms(results["first_event"], 50),
+        "first_event_p95_ms": percentile_ms(results["first_event"], 95),
+        "stream_p50_ms": percentile_ms(results["stream"], 50),
+        "stream_p95_ms": percentile_ms(results["stream"], 95),
+        "rejected": len(results["rejected"]),
+        "rejected_percent": round(
+            len(results["rejected"]) / max(1, len(results["rejected"]) + len(results["stream"])) * 100, 1),
+        "errors": len(results["errors"]),
+        "memory_mb": round(memory, 1),
+    }
+
+
+def recommend(results: List[Dict], args: argparse.Namespace) -> Optional[Dict]:
+    candidates = [
+        r for r in results
+        if r["first_event_p95_ms"] is not None and r["first_event_p95_ms"] <= args.slo_ms
+        and r["rejected_percent"] <= args.max_rejected_percent and r["errors"] == 0
+        and (args.memory_budget_mb is None or r["memory_mb"] <= args.memory_budget_mb)]
+    # The most chats per second, with fewer workers for the same throughput.
+    return max(candidates, key=lambda r: (r["chats_per_sec"], -r["workers"]), default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="The numbers of gunicorn workers, comma separated.")
+    parser.add_argument("--connections", default="50,200", help="The numbers of client connections, comma separated.")
+    parser.add_argument(
+        "--stream-limit", type=int, default=0, help="MAX_CONCURRENT_STREAMS of a worker, 0 for no limit.")
+    parser.add_argument("--duration", type=float, default=10.0, help="The duration of a measurement in seconds.")
+    parser.add_argument("--latency", type=float, default=50.0, help="The latency of a remote call in ms.")
+    parser.add_argument("--deltas", type=int, default=50, help="The number of the message deltas of a chat.")
+    parser.add_argument("--delta-interval", type=float, default=20.0, help="The time between the deltas in ms.")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="The p95 time to the first event in ms.")
+    parser.add_argument("--max-rejected-percent", type=float, default=1.0, help="The share of the rejected chats.")
+    parser.add_argument("--memory-budget-mb", type=float, default=None, help="The memory of gunicorn in MB.")
+    args = parser.parse_args()
+
+    results = []
+    for workers, connections in itertools.product(
+            [int(w) for w in args.workers.split(",")], [int(c) for c in args.connections.split(",")]):
+        results.append(measure(workers, connections, args))
+        print(json.dumps(results[-1]), file=sys.stderr)
+    print(json.dumps({
+        "cpus": os.cpu_count(),
+        "stream_limit": args.stream_limit,
+        "results": results,
+        "recommendation": recommend(results, args),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compare the memory, latency and recall@k of the exact local search and the quantized first pass.
+
+For every quantization and rerank factor, the index is built over the embeddings and queried with
+the embeddings sampled from the matrix with a little noise. recall@k is the share of the exact top k,
+found by the quantized search; the rows with the same score as the k-th exact result count as found,
+since the bundled file has duplicate chunks. The memory is the one of the first pass: the codes and
+the quantizer parameters against the float32 matrix. Use --synthetic-rows to emulate a larger catalog
+with the clustered random embeddings.
+
+    python benchmarks/quantization_recall.py --rerank 1,4,10
+    python benchmarks/quantization_recall.py --synthetic-rows 1000000 --dimensions 1536 --queries 100
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api.embeddings_store import load_embeddings  # noqa: E402
+from api.local_search import LocalSearchIndex  # noqa: E402
+
+
+def synthetic_embeddings(rows: int, dimensions: int, clusters: int = 1000, seed: int = 0) -> np.ndarray:
+    """Return the normalized embeddings around the random centers, as the chunks of the related topics."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+    matrix = np.empty((rows, dimensions), dtype=np.float32)
+    for start in range(0, rows, 65536):
+        end = min(start + 65536, rows)
+        matrix[start:end] = centers[rng.integers(0, clusters, end - start)]
+        matrix[start:end] += rng.standard_normal((end - start, dimensions), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix
+
+
+def build(matrix: np.ndarray, quantization: Optional[str], rerank: int, subspaces: Optional[int]):
+    start = time.perf_counter()
+    index = LocalSearchIndex(
+        [""] * len(matrix), [""] * len(matrix), matrix, model="",
+        quantization=quantization, rerank=rerank, pq_subspaces=subspaces)
+    return index, time.perf_counter() - start
+
+
+def measure(index: LocalSearchIndex, queries: np.ndarray, exact: List[List[float]], k: int) -> Dict[str, float]:
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, exact):
+        start = time.perf_counter()
+        hits = index.query(query, top_k=k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(sum(score >= expected[-1] - 1e-5 for _, score in hits) / len(expected))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--embeddings-file", default=str(SRC_DIR / "api" / "data" / "embeddings.csv"),
+        help="The embeddings file to search.")
+    parser.add_argument("--synthetic-rows", type=int, default=0, help="The number of the synthetic embeddings.")
+    parser.add_argument("--dimensions", type=int, default=1536, help="The dimensions of the synthetic embeddings.")
+    parser.add_argument("--k", type=int, default=5, help="The number of results.")
+    parser.add_argument("--queries", type=int, default=500, help="The number of queries.")
+    parser.add_argument("--rerank", default="1,4,10", help="The rerank factors, comma separated.")
+    parser.add_argument(
+        "--subspaces", default=None,
+        help="The numbers of the product quantization subspaces, comma separated, "
+             "a quarter of the dimensions by default.")
+    args = parser.parse_args()
+
+    if args.synthetic_rows:
+        matrix = synthetic_embeddings(args.synthetic_rows, args.dimensions)
+    else:
+        matrix = np.array(load_embeddings(args.embeddings_file).vectors, dtype=np.float32)
+    rng = np.random.default_rng(1)
+    queries = matrix[rng.integers(0, len(matrix), args.queries)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+
+    exact_index, build_time = build(matrix, None, 1, None)
+    exact = [[score for _, score in exact_index.query(query, top_k=args.k)] for query in queries]
+    float_bytes = exact_index.nbytes
+    results = [dict({"quantization": "none", "mb": round(float_bytes / 2**20, 2), "build_s": round(build_time, 2)},
+                    **measure(exact_index, queries, exact, args.k))]
+
+    configurations = [("int8", None)]
+    subspaces = [int(s) for s in args.subspaces.split(",")] if args.subspaces else [None]
+    configurations += [("pq", s) for s in subspaces]
+    for quantization, subspace_count in configurations:
+        for rerank in [int(r) for r in args.rerank.split(",")]:
+            index, build_time = build(matrix, quantization, rerank, subspace_count)
+            result = {
+                "quantization": quantization,
+                "subspaces": subspace_count or (max(1, matrix.shape[1] // 4) if quantization == "pq" else None),
+                "rerank": rerank,
+                "mb": round(index.nbytes / 2**20, 2),
+                "memory_savings_percent": round((1 - index.nbytes / float_bytes) * 100, 1),
+                "build_s": round(build_time, 2),
+            }
+            result.update(measure(index, queries, exact, args.k))
+            result["recall_loss"] = round(1 - result["recall_at_k"], 4)
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+    print(json.dumps({"documents": len(matrix), "dimensions": matrix.shape[1], "k": args.k, "results": results},
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Benchmark SearchIndexManager offline against the in-process stand-in for Azure AI Search.
+
+The service and the embedding client of benchmarks/search_stubs.py answer with the configured
+latency, so the suite runs without Azure resources and its results are comparable between runs.
+The synthetic corpus is generated from the fixed seed. The scenarios are:
+
+- upload: the documents per second of upload_documents for every corpus size and upload concurrency;
+- query: the queries per second and the latency of search, semantic_search and hybrid_search
+  for every number of the concurrent queries, with no query cache;
+- build: the time of build_embeddings_file for every number of the documents, cold and then
+  rebuilt from the cache of the previous run. It needs nltk with its punkt_tab data and is skipped
+  without them.
+
+The results are printed or written as JSON, to be compared with the results of the previous run.
+
+    python benchmarks/retrieval_suite.py --corpus-sizes 1000,10000 --concurrency 1,8,32 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+from unittest import mock
+
+import numpy as np
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api import search_index_manager  # noqa: E402
+from api.embeddings_store import Embeddings, save_embeddings  # noqa: E402
+from api.search_index_manager import SearchIndexManager  # noqa: E402
+from search_stubs import FakeEmbeddingClient, FakeSearchService, embed_text  # noqa: E402
+
+INDEX_NAME = "benchmark-index"
+
+
+class Corpus:
+    """
+    The synthetic corpus: the sentences of the random words of the fixed vocabulary.
+
+    :param seed: The seed of the generator.
+    :param vocabulary: The number of the distinct words.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary: int = 5000) -> None:
+        self._rng = np.random.default_rng(seed)
+        letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+        self.words = sorted({"".join(self._rng.choice(letters, self._rng.integers(3, 10))) for _ in range(vocabulary)})
+
+    def sentence(self) -> str:
+        words = self._rng.choice(self.words, self._rng.integers(6, 16))
+        return " ".join(words).capitalize() + "."
+
+    def chunk(self, sentences: int = 4) -> str:
+        return " ".join(self.sentence() for _ in range(sentences))
+
+    def query(self, chunk: str, words: int = 6) -> str:
+        """Return the query of the words of the chunk, so that the chunk is relevant to it."""
+        chunk_words = chunk.rstrip(".").lower().replace(".", "").split()
+        return " ".join(self._rng.choice(chunk_words, min(words, len(chunk_words)), replace=False))
+
+
+def write_embeddings_file(corpus: Corpus, size: int, dimensions: int, output_file: str) -> List[str]:
+    """
+    Write the embeddings file of the synthetic chunks, embedded as by the fake embedding client.
+
+    :return: The chunks.
+    """
+    tokens = [corpus.chunk() for _ in range(size)]
+    titles = [f"document{i // 20}.md" for i in range(size)]
+    vectors = np.array([embed_text(token, dimensions) for token in tokens], dtype=np.float32)
+    save_embeddings(Embeddings(tokens, titles, vectors), output_file)
+    return tokens
+
+
+def create_manager(dimensions: int, embedding_client: FakeEmbeddingClient = None) -> SearchIndexManager:
+    return SearchIndexManager(
+        endpoint="https://benchmark.search.windows.net",
+        credential=None,
+        index_name=INDEX_NAME,
+        dimensions=dimensions,
+        model="text-embedding-3-small",
+        deployment_name="text-embedding-3-small",
+        embedding_endpoint="https://benchmark.openai.azure.com",
+        embed_api_key=None,
+        embedding_client=embedding_client,
+    )
+
+
+def new_service(args: argparse.Namespace) -> FakeSearchService:
+    return FakeSearchService(
+        latency=args.latency / 1000,
+        latency_per_document=args.latency_per_document / 1000,
+        semantic_latency=args.semantic_latency / 1000,
+        max_concurrency=args.service_concurrency)
+
+
+def use_service(service: FakeSearchService):
+    """Replace the Azure AI Search clients of SearchIndexManager with the stand-in."""
+    return mock.patch.multiple(
+        search_index_manager, SearchClient=service.search_client, SearchIndexClient=service.index_client)
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "queries": len(latencies),
+        "qps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+    }
+
+
+async def benchmark_upload(args: argparse.Namespace, corpus: Corpus, work_dir: str) -> List[Dict]:
+    results = []
+    for size in args.corpus_sizes:
+        embeddings_file = os.path.join(work_dir, f"upload_{size}.npy")
+        write_embeddings_file(corpus, size, args.dimensions, embeddings_file)
+        for concurrency in args.upload_concurrency:
+            service = new_service(args)
+            with use_service(service):
+                search_mgr = create_manager(args.dimensions)
+                await search_mgr.create_index()
+                start = time.perf_counter()
+                await search_mgr.upload_documents(
+                    embeddings_file, batch_size=args.batch_size, max_concurrency=concurrency)
+                elapsed = time.perf_counter() - start
+                await search_mgr.wait_until_consistent()
+                await search_mgr.close()
+            results.append({
+                "documents": size,
+                "batch_size": args.batch_size,
+                "concurrency": concurrency,
+                "seconds": round(elapsed, 3),
+                "docs_per_sec": round(size / elapsed, 1),
+                "requests": service.requests,
+            })
+    return results
+
+
+async def run_queries(search: Callable[[str], Awaitable[str]], queries: List[str], concurrency: int) -> Dict:
+    latencies = []
+    pending = iter(queries)
+
+    async def client() -> None:
+        for query in pending:
+            start = time.perf_counter()
+            await search(query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def benchmark_query(args: argparse.Namespace, corpus: Corpus, work_dir: str) -> Dict:
+    size = args.query_corpus_size
+    embeddings_file = os.path.join(work_dir, f"query_{size}.npy")
+    tokens = write_embeddings_file(corpus, size, args.dimensions, embeddings_file)
+    queries = [corpus.query(tokens[i]) for i in np.random.default_rng(1).integers(0, size, args.queries)]
+    service = new_service(args)
+    results = {"documents": size, "modes": []}
+    with use_service(service):
+        search_mgr = create_manager(args.dimensions)
+        await search_mgr.create_index()
+        await search_mgr.upload_documents(embeddings_file)
+        await search_mgr.wait_until_consistent()
+        modes = {
+            "search": search_mgr.search,
+            "semantic_search": search_mgr.semantic_search,
+            "hybrid_search": search_mgr.hybrid_search,
+        }
+        for name, search in modes.items():
+            for concurrency in args.concurrency:
+                result = await run_queries(search, queries, concurrency)
+                results["modes"].append(dict({"mode": name, "concurrency": concurrency}, **result))
+        await search_mgr.close()
+    return results
+
+
+def write_documents(corpus: Corpus, files: int, sentences: int, input_dir: str) -> None:
+    os.makedirs(input_dir)
+    for i in range(files):
+        with open(os.path.join(input_dir, f"document{i}.md"), "w") as f:
+            f.write("\n".join(corpus.sentence() for _ in range(sentences)))
+
+
+async def benchmark_build(args: argparse.Namespace, corpus: Corpus, work_dir: str) -> Dict:
+    try:
+        import nltk
+    except ImportError:
+        return {"skipped": "nltk is not installed."}
+    # build_embeddings_file downloads the sentence tokenizer data, the download fails without the network.
+    try:
+        nltk.download("punkt_tab", quiet=True)
+        from nltk.tokenize import sent_tokenize
+        sent_tokenize("The tokenizer is loaded. It splits the sentences.")
+    except (LookupError, OSError) as e:
+        return {"skipped": f"The punkt_tab data of nltk cannot be loaded: {e}"}
+    results = []
+    for files in args.build_files:
+        input_dir = os.path.join(work_dir, f"documents_{files}")
+        write_documents(corpus, files, args.sentences_per_document, input_dir)
+        output_file = os.path.join(work_dir, f"build_{files}.npy")
+        result = {"files": files}
+        # The first build embeds all the chunks, the second one reuses them from the output file.
+        for run in ("cold", "cached"):
+            embedding_client = FakeEmbeddingClient(
+                args.dimensions, args.embed_latency / 1000, args.embed_latency_per_input / 1000)
+            search_mgr = create_manager(args.dimensions, embedding_client)
+            start = time.perf_counter()
+            await search_mgr.build_embeddings_file(input_dir, output_file)
+            result[f"{run}_seconds"] = round(time.perf_counter() - start, 3)
+            result[f"{run}_embedded_chunks"] = embedding_client.inputs
+        with open(output_file[:-len(".npy")] + ".json") as f:
+            result["chunks"] = len(json.load(f)["tokens"])
+        results.append(result)
+    return {"sentences_per_document": args.sentences_per_document, "results": results}
+
+
+SCENARIOS = {"upload": benchmark_upload, "query": benchmark_query, "build": benchmark_build}
+
+
+async def benchmark(args: argparse.Namespace) -> Dict:
+    results = {
+        "config": {
+            "dimensions": args.dimensions,
+            "latency_ms": args.latency,
+            "latency_per_document_ms": args.latency_per_document,
+            "semantic_latency_ms": args.semantic_latency,
+            "service_concurrency": args.service_concurrency,
+            "embed_latency_ms": args.embed_latency,
+            "embed_latency_per_input_ms": args.embed_latency_per_input,
+        },
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in args.scenarios:
+            start = time.perf_counter()
+            results[name] = await SCENARIOS[name](args, Corpus(args.seed), work_dir)
+            print(f"{name}: {time.perf_counter() - start:.1f} seconds", file=sys.stderr)
+    return results
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def scenario_list(value: str) -> List[str]:
+    names = value.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown scenarios: {', '.join(unknown)}, expected some of: {', '.join(SCENARIOS)}")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--scenarios", type=scenario_list, default=list(SCENARIOS),
+        help=f"The scenarios to run, comma separated: {', '.join(SCENARIOS)}.")
+    parser.add_argument("--dimensions", type=int, default=256, help="The number of dimensions of the embeddings.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the synthetic corpus.")
+    parser.add_argument("--latency", type=float, default=20.0, help="The latency of a search request in ms.")
+    parser.add_argument(
+        "--latency-per-document", type=float, default=0.05, help="The latency per uploaded document in ms.")
+    parser.add_argument(
+        "--semantic-latency", type=float, default=50.0, help="The additional latency of the semantic ranker in ms.")
+    parser.add_argument(
+        "--service-concurrency", type=int, default=16, help="The number of the requests the service serves at once.")
+    parser.add_argument(
+        "--corpus-sizes", type=int_list, default=[1000, 10000], help="The numbers of the uploaded documents.")
+    parser.add_argument(
+        "--upload-concurrency", type=int_list, default=[1, 4, 16], help="The numbers of concurrent upload requests.")
+    parser.add_argument(
+        "--batch-size", type=int, default=SearchIndexManager.DEFAULT_UPLOAD_BATCH_SIZE,
+        help="The number of documents in one upload request.")
+    parser.add_argument("--query-corpus-size", type=int, default=2000, help="The number of the searched documents.")
+    parser.add_argument("--queries", type=int, default=200, help="The number of queries of a measurement.")
+    parser.add_argument(
+        "--concurrency", type=int_list, default=[1, 8, 32, 128], help="The numbers of concurrent queries.")
+    parser.add_argument(
+        "--build-files", type=int_list, default=[10, 100], help="The numbers of the documents to embed.")
+    parser.add_argument("--sentences-per-document", type=int, default=40, help="The number of sentences of a document.")
+    parser.add_argument("--embed-latency", type=float, default=100.0, help="The latency of an embedding request in ms.")
+    parser.add_argument(
+        "--embed-latency-per-input", type=float, default=0.5, help="The latency per embedded chunk in ms.")
+    parser.add_argument("--output", default=None, help="The JSON file to write the results to, stdout by default.")
+    args = parser.parse_args()
+
+    results = json.dumps(asyncio.run(benchmark(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(results)
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
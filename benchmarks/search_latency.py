@@ -0,0 +1,107 @@
+"""
+Compare the latency of the local in-process vector search with the Azure AI Search round trip.
+
+The local search is always measured on the bundled embeddings with the query vectors, sampled
+from the file itself, so that the embedding call is not included. If AZURE_AI_SEARCH_ENDPOINT,
+AZURE_AI_SEARCH_INDEX_NAME and AZURE_AI_EMBED_DIMENSIONS are set, the remote vector search of
+SearchIndexManager is measured on the queries from evals/eval-queries.json as well.
+
+    python benchmarks/search_latency.py --iterations 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from dotenv import load_dotenv
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api.local_search import LocalSearchIndex  # noqa: E402
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Return p50 and p99 latency in milliseconds."""
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+    }
+
+
+def benchmark_local(embeddings_file: str, iterations: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    index = LocalSearchIndex.from_file(embeddings_file, model="")
+    load_time = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    queries = index.embeddings[rng.integers(0, len(index), iterations)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.query(query, top_k=5)
+        latencies.append(time.perf_counter() - start)
+    result = summarize(latencies)
+    result["load_ms"] = round(load_time * 1000, 2)
+    result["documents"] = len(index)
+    return result
+
+
+async def benchmark_remote(iterations: int) -> Dict[str, float]:
+    from azure.identity.aio import DefaultAzureCredential
+    from api.search_index_manager import SearchIndexManager
+
+    with open(Path(__file__).parent.parent / "evals" / "eval-queries.json") as f:
+        queries = [q["query"] for q in json.load(f)]
+    embedding = os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME")
+    async with DefaultAzureCredential(exclude_shared_token_cache_credential=True) as creds:
+        search_mgr = SearchIndexManager(
+            endpoint=os.environ["AZURE_AI_SEARCH_ENDPOINT"],
+            credential=creds,
+            index_name=os.environ["AZURE_AI_SEARCH_INDEX_NAME"],
+            dimensions=None,
+            model=embedding,
+            deployment_name=embedding,
+            embedding_endpoint="",
+            embed_api_key=None,
+        )
+        # The index already exists, create_index only fetches its definition.
+        await search_mgr.create_index(vector_index_dimensions=int(os.environ["AZURE_AI_EMBED_DIMENSIONS"]))
+        latencies = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            await search_mgr.search(queries[i % len(queries)])
+            latencies.append(time.perf_counter() - start)
+        await search_mgr.close()
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000, help="The number of local queries.")
+    parser.add_argument("--remote-iterations", type=int, default=20, help="The number of remote queries.")
+    parser.add_argument(
+        "--embeddings-file", default=str(SRC_DIR / "api" / "data" / "embeddings.csv"),
+        help="The embeddings file to load into the local index.")
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=SRC_DIR / ".env")
+    results = {"local": benchmark_local(args.embeddings_file, args.iterations)}
+    if all(os.getenv(v) for v in (
+            "AZURE_AI_SEARCH_ENDPOINT", "AZURE_AI_SEARCH_INDEX_NAME", "AZURE_AI_EMBED_DIMENSIONS")):
+        results["remote"] = asyncio.run(benchmark_remote(args.remote_iterations))
+    else:
+        print("Azure AI Search is not configured, skipping the remote benchmark.", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+The in-process stand-in for Azure AI Search and the embedding client, to benchmark SearchIndexManager offline.
+
+FakeSearchService keeps the indexes in memory and answers with the configured latency: the base
+latency of a request, the time per uploaded document and the additional latency of the semantic
+ranker. At most max_concurrency requests are served at once, the others wait, as on a service with
+a limited number of replicas. The vector queries are answered with the exact cosine similarity
+over the documents, the full text queries with the number of the matched query terms, and the
+hybrid queries with the reciprocal rank fusion of both.
+
+FakeEmbeddingClient is deterministic: the embedding of a text is the normalized sum of the random
+vectors of its words, seeded by the hash of the word, so the texts sharing words are similar.
+"""
+import asyncio
+import collections
+import functools
+import hashlib
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+from api.search_index_manager import reciprocal_rank_fusion
+
+_WORD = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_vector(word: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dimensions, dtype=np.float32)
+
+
+def embed_text(text: str, dimensions: int) -> np.ndarray:
+    """Return the deterministic float32 unit vector of the text."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vector += _word_vector(word, dimensions)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeEmbeddingClient:
+    """
+    The embedding client with the latency per request and per input text.
+
+    :param dimensions: The number of dimensions, used if the request does not set them.
+    :param latency: The latency of the request in seconds.
+    :param latency_per_input: The additional latency per input text in seconds.
+    """
+
+    def __init__(self, dimensions: int = 100, latency: float = 0.0, latency_per_input: float = 0.0) -> None:
+        self.dimensions = dimensions
+        self.latency = latency
+        self.latency_per_input = latency_per_input
+        self.requests = 0
+        self.inputs = 0
+
+    async def embed(self, input: List[str], dimensions: Optional[int] = None, model: Optional[str] = None) -> Dict:
+        self.requests += 1
+        self.inputs += len(input)
+        await asyncio.sleep(self.latency + self.latency_per_input * len(input))
+        return {"data": [{"embedding": embed_text(text, dimensions or self.dimensions).tolist()} for text in input]}
+
+    async def close(self) -> None:
+        pass
+
+
+class _Index:
+    def __init__(self, definition: Any, dimensions: int) -> None:
+        self.definition = definition
+        self.dimensions = dimensions
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        # The inverted index of the words of token and title, so the full text query does not scan the documents.
+        self._postings: Dict[str, set] = collections.defaultdict(set)
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+
+    def upsert(self, documents: List[Dict[str, Any]]) -> None:
+        for document in documents:
+            key = document['embedId']
+            self.documents[key] = document
+            for word in set(_WORD.findall(f"{document.get('token', '')} {document.get('title', '')}".lower())):
+                self._postings[word].add(key)
+        self._matrix = None
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._keys = list(self.documents)
+            vectors = np.array([self.documents[key]['embedding'] for key in self._keys], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True) if len(vectors) else 1
+            self._matrix = vectors / np.where(norms == 0, 1, norms)
+        return self._matrix
+
+    def vector_search(self, text: str, k: int) -> List[Dict[str, Any]]:
+        if not self.documents:
+            return []
+        scores = self.matrix() @ embed_text(text, self.dimensions)
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [dict(self.documents[self._keys[i]], **{'@search.score': float(scores[i])}) for i in best]
+
+    def text_search(self, text: str, top: int) -> List[Dict[str, Any]]:
+        scores = collections.Counter()
+        for term in set(_WORD.findall(text.lower())):
+            scores.update(self._postings.get(term, ()))
+        return [dict(self.documents[key], **{'@search.score': float(score)}) for key, score in scores.most_common(top)]
+
+
+class _Results:
+    """The lazily fetched results, as AsyncSearchItemPaged, the request is sent on the iteration."""
+
+    def __init__(self, service: "FakeSearchService", fetch, latency: float) -> None:
+        self._service = service
+        self._fetch = fetch
+        self._latency = latency
+
+    async def __aiter__(self):
+        results = await self._service.request(self._latency, self._fetch)
+        for result in results:
+            yield result
+
+
+class FakeSearchService:
+    """
+    The in-memory search service.
+
+    :param latency: The latency of a request in seconds.
+    :param latency_per_document: The additional latency per uploaded document in seconds.
+    :param semantic_latency: The additional latency of the semantic ranker in seconds.
+    :param max_concurrency: The maximal number of the requests served at once.
+    """
+
+    def __init__(
+            self,
+            latency: float = 0.02,
+            latency_per_document: float = 0.00005,
+            semantic_latency: float = 0.05,
+            max_concurrency: int = 16
+    ) -> None:
+        self.latency = latency
+        self.latency_per_document = latency_per_document
+        self.semantic_latency = semantic_latency
+        self.max_concurrency = max_concurrency
+        self.indexes: Dict[str, _Index] = {}
+        self.requests = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def request(self, latency: float, fetch):
+        # The semaphore is bound to the event loop, it is created in the running one.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.requests += 1
+            await asyncio.sleep(latency)
+            return fetch()
+
+    def search_client(self, endpoint: str, index_name: str, credential: Any) -> "FakeSearchClient":
+        """The replacement of the SearchClient constructor."""
+        return FakeSearchClient(self, index_name)
+
+    def index_client(self, endpoint: str, credential: Any) -> "FakeSearchIndexClient":
+        """The replacement of the SearchIndexClient constructor."""
+        return FakeSearchIndexClient(self)
+
+
+class FakeSearchClient:
+    def __init__(self, service: FakeSearchService, index_name: str) -> None:
+        self._service = service
+        self._index_name = index_name
+
+    def _index(self) -> _Index:
+        if self._index_name not in self._service.indexes:
+            raise ResourceNotFoundError(f"No index {self._index_name}")
+        return self._service.indexes[self._index_name]
+
+    async def upload_documents(self, documents: List[Dict[str, Any]]) -> List[SimpleNamespace]:
+        index = self._index()
+
+        def upload():
+            index.upsert(documents)
+            return [SimpleNamespace(key=d['embedId'], succeeded=True, status_code=201) for d in documents]
+
+        latency = self._service.latency + self._service.latency_per_document * len(documents)
+        return await self._service.request(latency, upload)
+
+    async def get_document_count(self) -> int:
+        return await self._service.request(self._service.latency, lambda: len(self._index().documents))
+
+    async def search(
+            self,
+            search_text: Optional[str] = None,
+            vector_queries: Optional[List[Any]] = None,
+            top: Optional[int] = None,
+            select: Optional[List[str]] = None,
+            semantic_configuration_name: Optional[str] = None,
+            query_type: Optional[str] = None,
+            **kwargs: Any
+    ) -> _Results:
+        index = self._index()
+        top = top or 50
+
+        def fetch():
+            rankings = []
+            for query in vector_queries or []:
+                rankings.append(index.vector_search(query.text, query.k_nearest_neighbors or top))
+            if search_text is not None:
+                rankings.append(index.text_search(search_text, top))
+            results = rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(rankings)
+            results = results[:top]
+            if select:
+                results = [{key: r[key] for key in list(select) + ['@search.score'] if key in r} for r in results]
+            return results
+
+        latency = self._service.latency
+        if query_type == "semantic" or (semantic_configuration_name and search_text is not None):
+            latency += self._service.semantic_latency
+        return _Results(self._service, fetch, latency)
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeSearchIndexClient:
+    def __init__(self, service: FakeSearchService) -> None:
+        self._service = service
+
+    async def __aenter__(self) -> "FakeSearchIndexClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def create_index(self, index: Any) -> Any:
+        def create():
+            if index.name in self._service.indexes:
+                raise HttpResponseError(f"Index {index.name} already exists.")
+            embedding = next(field for field in index.fields if field.name == 'embedding')
+            self._service.indexes[index.name] = _Index(index, embedding.vector_search_dimensions)
+            return index
+
+        return await self._service.request(self._service.latency, create)
+
+    async def get_index(self, name: str) -> Any:
+        return await self._service.request(self._service.latency, lambda: self._service.indexes[name].definition)
+
+    async def delete_index(self, name: str) -> None:
+        await self._service.request(self._service.latency, lambda: self._service.indexes.pop(name, None))
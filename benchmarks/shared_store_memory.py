@@ -0,0 +1,113 @@
+"""
+Compare the memory of the forked workers, which load the embeddings each, with the shared store.
+
+For every corpus size, the synthetic embeddings with the chunks of about 500 characters are written
+to the binary .npy file. In the per_worker mode, each worker, forked as by gunicorn with preload_app,
+loads the file into LocalSearchIndex; in the shared mode, the master creates the store before the fork
+and the workers attach to it. Each worker runs the queries and reads the found chunks, then all the
+workers measure their memory at once: the growth of the private memory, which is not shared with any
+other process, and the proportional set size (PSS), in which the shared pages are divided between
+the processes. The private memory of a worker on the shared store does not grow with the corpus.
+
+    python benchmarks/shared_store_memory.py --rows 10000,100000 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api.embeddings_store import Embeddings, load_embeddings, save_embeddings  # noqa: E402
+from api.local_search import LocalSearchIndex  # noqa: E402
+from api.shared_store import create_shared_store, read_shared_store, remove_shared_store  # noqa: E402
+
+
+def memory_mb() -> Dict[str, float]:
+    """Return the private memory and PSS of this process from /proc/self/smaps_rollup."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == "kB":
+                values[fields[0].rstrip(":")] = int(fields[1]) / 1024
+    return {
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+        "pss": values.get("Pss", 0),
+    }
+
+
+def worker(mode: str, embeddings_file: str, queries: np.ndarray, barrier, queue) -> None:
+    baseline = memory_mb()
+    if mode == "shared":
+        embeddings = read_shared_store(os.environ["LOCAL_SEARCH_SHARED_STORE"])
+    else:
+        embeddings = load_embeddings(embeddings_file)
+    index = LocalSearchIndex(embeddings.tokens, embeddings.titles, embeddings.vectors, model="")
+    for query in queries:
+        index.get_documents(index.query(query))
+    barrier.wait()
+    memory = memory_mb()
+    queue.put({"private_mb": memory["private"] - baseline["private"], "pss_mb": memory["pss"]})
+    # The other workers measure while this one is alive.
+    barrier.wait()
+
+
+def measure(mode: str, embeddings_file: str, workers: int, queries: np.ndarray) -> Dict[str, float]:
+    ctx = multiprocessing.get_context("fork")
+    store = create_shared_store(embeddings_file) if mode == "shared" else None
+    try:
+        barrier = ctx.Barrier(workers)
+        queue = ctx.Queue()
+        processes = [
+            ctx.Process(target=worker, args=(mode, embeddings_file, queries, barrier, queue)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        remove_shared_store(store)
+        os.environ.pop("LOCAL_SEARCH_SHARED_STORE", None)
+    return {
+        "private_mb_per_worker": round(max(r["private_mb"] for r in results), 1),
+        "pss_mb_total": round(sum(r["pss_mb"] for r in results), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000", help="The numbers of the embeddings, comma separated.")
+    parser.add_argument("--dimensions", type=int, default=256, help="The dimensions of the embeddings.")
+    parser.add_argument("--workers", type=int, default=4, help="The number of the forked workers.")
+    parser.add_argument("--queries", type=int, default=100, help="The number of queries of a worker.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for rows in [int(r) for r in args.rows.split(",")]:
+        with tempfile.TemporaryDirectory() as d:
+            embeddings_file = os.path.join(d, "embeddings.npy")
+            vectors = rng.standard_normal((rows, args.dimensions), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=-1, keepdims=True)
+            tokens = [f"Chunk {i}. " + "x" * 490 for i in range(rows)]
+            titles = [f"document{i // 20}.md" for i in range(rows)]
+            save_embeddings(Embeddings(tokens, titles, vectors), embeddings_file)
+            queries = vectors[rng.integers(0, rows, args.queries)]
+            del vectors, tokens
+            for mode in ("per_worker", "shared"):
+                result = dict({"rows": rows, "mode": mode}, **measure(mode, embeddings_file, args.workers, queries))
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+    print(json.dumps({"workers": args.workers, "dimensions": args.dimensions, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
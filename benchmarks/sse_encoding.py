@@ -0,0 +1,82 @@
+"""
+Measure the single core throughput of the SSE encoding of the message deltas.
+
+The "before" variant reproduces the previous code path: the event dictionary, json.dumps and
+the INFO log record with the f-string for every yielded event. The "after" variant is the current
+MyEventHandler.on_message_delta with the debug-gated logging of get_result. The logger writes to
+an in-memory stream at the INFO level, as in production. The JSON backend of the other events
+is reported as well.
+
+    python benchmarks/sse_encoding.py --events 200000
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from api import sse  # noqa: E402
+from api.routes import MyEventHandler, logger  # noqa: E402
+
+
+def make_deltas(count: int) -> List[SimpleNamespace]:
+    words = ["The", " tent", " is", " water", "proof", ",", " see", " \"Specs\"", " 😀", "\n"]
+    return [SimpleNamespace(text=words[i % len(words)]) for i in range(count)]
+
+
+async def before(deltas: List[SimpleNamespace]) -> None:
+    for delta in deltas:
+        stream_data = {'content': delta.text, 'type': "message"}
+        event = f"data: {json.dumps(stream_data)}\n\n"
+        logger.debug(f"Received event: {event}")
+        logger.info(f"Yielding event: {event}")
+
+
+async def after(deltas: List[SimpleNamespace]) -> None:
+    handler = MyEventHandler(SimpleNamespace(agents=None), None)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for delta in deltas:
+        event = await handler.on_message_delta(delta)
+        if debug:
+            logger.debug("Received event: %s", event)
+            logger.debug("Yielding event: %s", event)
+
+
+def measure(func: Callable, deltas: List[SimpleNamespace], repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        asyncio.run(func(deltas))
+        best = min(best, time.perf_counter() - start)
+    return {"events_per_sec": round(len(deltas) / best), "us_per_event": round(best / len(deltas) * 1e6, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200000, help="The number of message deltas.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of runs, the best one is reported.")
+    args = parser.parse_args()
+
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    deltas = make_deltas(args.events)
+
+    results = {
+        "before": measure(before, deltas, args.repeat),
+        "after": measure(after, deltas, args.repeat),
+        "json_backend": sse.JSON_BACKEND,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
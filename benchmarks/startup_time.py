@@ -0,0 +1,132 @@
+"""
+Measure the cold start of a worker: the import time and the time to the first served request.
+
+The project client is replaced with a stub, which answers every call after the configured latency,
+and the credential with a stub, which acquires its first token with the same latency,
+so no Azure resources are needed; the tracing is configured for real with a fake connection string.
+Each worker runs in a new process, which starts uvicorn with the application and sends GET /agent.
+Two process models are measured:
+
+- fresh: the worker imports the application itself, as uvicorn without preloading does;
+- preloaded: the worker is forked from the parent, which has imported the application, called
+  preload_modules and shared the resolved agent and the token, as the gunicorn master does with preload_app.
+
+Both are measured with the startup tasks awaited in the lifespan (DEFER_STARTUP_TASKS=false)
+and deferred (the default).
+
+    python benchmarks/startup_time.py --workers 5 --latency 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+
+def worker(started: float, import_app: bool, latency: float, queue: multiprocessing.Queue) -> None:
+    """Run the worker and report the startup timings in milliseconds."""
+    begin = time.perf_counter()
+    from api import main
+    imported = time.perf_counter()
+    import aiohttp
+    import uvicorn
+    from stubs import StubCredential, make_stub_client
+
+    main.AIProjectClient = make_stub_client(latency)
+    main.DefaultAzureCredential = lambda **kwargs: StubCredential(latency)
+    app = main.create_app() if import_app else preloaded_app
+    for name in ("azure", "opentelemetry", "azureaiapp"):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    async def serve() -> Dict[str, float]:
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="critical"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.001)
+        lifespan_done = time.perf_counter()
+        port = server.servers[0].sockets[0].getsockname()[1]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/agent") as response:
+                await response.read()
+        served = time.perf_counter()
+        server.should_exit = True
+        await serving
+        return {
+            "import_ms": round((imported - begin) * 1000, 1) if import_app else 0.0,
+            "ready_ms": round((lifespan_done - started) * 1000, 1),
+            "first_request_ms": round((served - started) * 1000, 1),
+        }
+
+    queue.put(asyncio.run(serve()))
+    queue.close()
+    queue.join_thread()
+    # Do not wait for the telemetry exporters to flush to the fake endpoint.
+    os._exit(0)
+
+
+preloaded_app = None
+
+
+def run_workers(mode: str, count: int, latency: float) -> Dict[str, float]:
+    ctx = multiprocessing.get_context("spawn" if mode == "fresh" else "fork")
+    results: List[Dict[str, float]] = []
+    for _ in range(count):
+        queue = ctx.Queue()
+        if mode == "fresh":
+            # The clock of the new interpreter is not comparable, the worker starts measuring itself.
+            process = ctx.Process(target=fresh_worker, args=(latency, queue))
+        else:
+            process = ctx.Process(target=worker, args=(time.perf_counter(), False, latency, queue))
+        process.start()
+        results.append(queue.get(timeout=120))
+        process.join()
+    return {key: round(statistics.median(r[key] for r in results), 1) for key in results[0]}
+
+
+def fresh_worker(latency: float, queue: multiprocessing.Queue) -> None:
+    worker(time.perf_counter(), True, latency, queue)
+
+
+def main():
+    global preloaded_app
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=5, help="The number of workers per measurement.")
+    parser.add_argument("--latency", type=float, default=50.0, help="The latency of a remote call in ms.")
+    parser.add_argument("--no-tracing", action="store_true", help="Do not enable the tracing.")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "RUNNING_IN_PRODUCTION": "true",
+        "AZURE_EXISTING_AGENT_ID": "asst_stub",
+        "ENABLE_AZURE_MONITOR_TRACING": "false" if args.no_tracing else "true",
+        "APPLICATIONINSIGHTS_STATSBEAT_DISABLED_ALL": "true",
+    })
+    from api import main as app_main
+    from api.preload import PROJECT_SCOPE, share_agent, share_token
+    from azure.ai.agents.models import Agent
+    from stubs import StubCredential
+    app_main.preload_modules()
+    share_agent(Agent(id="asst_stub", name="agent", model="gpt-4o-mini"))
+    share_token(PROJECT_SCOPE, StubCredential(0).get_token(PROJECT_SCOPE))
+    preloaded_app = app_main.create_app()
+
+    results = {}
+    for defer in ("false", "true"):
+        os.environ["DEFER_STARTUP_TASKS"] = defer
+        key = "deferred" if defer == "true" else "awaited"
+        results[key] = {
+            mode: run_workers(mode, args.workers, args.latency / 1000) for mode in ("fresh", "preloaded")}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+The stubs of the Azure clients for the benchmarks, which run the application without Azure resources.
+
+Every remote call of the stub project client is answered after the configured latency, and the
+run stream yields the message deltas at the configured interval through the real event handler.
+"""
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+from azure.ai.agents.models import (
+    Agent,
+    MessageDelta,
+    MessageDeltaChunk,
+    MessageDeltaTextContent,
+    MessageDeltaTextContentObject,
+    MessageTextContent,
+    MessageTextDetails,
+    ThreadMessage,
+    ThreadRun,
+)
+from azure.core.credentials import AccessToken
+
+CONNECTION_STRING = (
+    "InstrumentationKey=00000000-0000-0000-0000-000000000000;IngestionEndpoint=http://127.0.0.1:9/")
+PROJECT_SCOPE = "https://ai.azure.com/.default"
+
+
+class StubCredential:
+    """The credential, which acquires the token with the latency once and then returns it from its cache."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.token = None
+
+    def get_token(self, *scopes, **kwargs) -> AccessToken:
+        if self.token is None:
+            time.sleep(self.latency)
+            self.token = AccessToken("token", int(time.time()) + 3600)
+        return self.token
+
+    def close(self) -> None:
+        pass
+
+
+class StubStream:
+    """The run stream, yielding the deltas and the completed message and run through the event handler."""
+
+    def __init__(self, handler, thread_id: str, deltas: int, delta_interval: float, latency: float) -> None:
+        self.handler = handler
+        self.thread_id = thread_id
+        self.deltas = deltas
+        self.delta_interval = delta_interval
+        self.latency = latency
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.latency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        words = []
+        for i in range(self.deltas):
+            await asyncio.sleep(self.delta_interval)
+            word = f" word{i}"
+            words.append(word)
+            delta = MessageDeltaChunk(id="msg_1", delta=MessageDelta(role="assistant", content=[
+                MessageDeltaTextContent(index=0, text=MessageDeltaTextContentObject(value=word))]))
+            yield "thread.message.delta", delta, await self.handler.on_message_delta(delta)
+        message = ThreadMessage(
+            id="msg_1", thread_id=self.thread_id, status="completed", role="assistant",
+            content=[MessageTextContent(text=MessageTextDetails(value="".join(words), annotations=[]))])
+        yield "thread.message.completed", message, await self.handler.on_thread_message(message)
+        run = ThreadRun(id="run_1", thread_id=self.thread_id, status="completed")
+        yield "thread.run.completed", run, await self.handler.on_thread_run(run)
+        yield "done", "[DONE]", await self.handler.on_done()
+
+
+def make_stub_client(latency: float, deltas: int = 50, delta_interval: float = 0.02):
+    """
+    Return the AIProjectClient replacement.
+
+    :param latency: The latency of every remote call in seconds.
+    :param deltas: The number of the message deltas of a run.
+    :param delta_interval: The time between the deltas in seconds.
+    """
+    ids = itertools.count(1)
+
+    class StubProjectClient:
+        def __init__(self, credential, **kwargs):
+            self.credential = credential
+            self.telemetry = SimpleNamespace(get_connection_string=lambda: self.remote(CONNECTION_STRING))
+            self.agents = SimpleNamespace(
+                get_agent=lambda agent_id: self.remote(Agent(id=agent_id, name="agent", model="gpt-4o-mini")),
+                files=SimpleNamespace(list=lambda purpose: self.remote(SimpleNamespace(data=[]))),
+                threads=SimpleNamespace(
+                    create=lambda: self.remote(SimpleNamespace(id=f"thread_{next(ids)}")),
+                    get=lambda thread_id: self.remote(SimpleNamespace(id=thread_id))),
+                messages=SimpleNamespace(
+                    create=lambda **kwargs: self.remote(SimpleNamespace(id=f"msg_{next(ids)}"))),
+                runs=SimpleNamespace(
+                    stream=lambda thread_id, agent_id, event_handler: self.remote(StubStream(
+                        event_handler, thread_id, deltas, delta_interval, latency))))
+
+        async def remote(self, result):
+            # As the bearer token policy of the client, get the token from the event loop.
+            await self.credential.get_token(PROJECT_SCOPE)
+            await asyncio.sleep(latency)
+            return result
+
+        async def close(self):
+            pass
+
+    return StubProjectClient
@@ -0,0 +1,156 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Dict, Optional
+
+import json
+import logging
+import os
+import tempfile
+
+from azure.ai.agents.aio import AgentsClient
+from azure.ai.agents.models import Agent
+
+logger = logging.getLogger("azureaiapp")
+
+DEFAULT_AGENT_CACHE_FILE = os.path.join(tempfile.gettempdir(), "azureaiapp_agents.json")
+
+
+class AgentResolutionCache:
+    """
+    The agent IDs by the project endpoint and the agent name, persisted in the JSON file.
+
+    The gunicorn master writes the file once in on_starting and the workers read it, so a restarted
+    worker finds the agent with one get_agent call instead of listing all the agents of the project.
+    The file is replaced atomically, so the readers never see a partial write.
+
+    :param path: The path to the JSON file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Constructor."""
+        self.path = path
+
+    @staticmethod
+    def _key(endpoint: str, name: str) -> str:
+        return f"{endpoint}|{name}"
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring the unreadable agent cache {self.path}: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self, entries: Dict[str, str]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".agents-", suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write the agent cache {self.path}: {e}")
+
+    def get(self, endpoint: str, name: str) -> Optional[str]:
+        """
+        Return the cached agent ID.
+
+        :param endpoint: The project endpoint.
+        :param name: The agent name.
+        :return: The agent ID or None if it is not cached.
+        """
+        return self._load().get(self._key(endpoint, name))
+
+    def set(self, endpoint: str, name: str, agent_id: str) -> None:
+        """
+        Save the agent ID.
+
+        :param endpoint: The project endpoint.
+        :param name: The agent name.
+        :param agent_id: The agent ID.
+        """
+        entries = self._load()
+        if entries.get(self._key(endpoint, name)) != agent_id:
+            entries[self._key(endpoint, name)] = agent_id
+            self._save(entries)
+
+    def invalidate(self, endpoint: str, name: str) -> None:
+        """
+        Remove the stale agent ID.
+
+        :param endpoint: The project endpoint.
+        :param name: The agent name.
+        """
+        entries = self._load()
+        if entries.pop(self._key(endpoint, name), None) is not None:
+            self._save(entries)
+
+
+def get_agent_cache() -> Optional[AgentResolutionCache]:
+    """
+    Return the agent cache, configured by AGENT_CACHE_FILE.
+
+    :return: The cache or None if AGENT_CACHE_FILE is set to the empty string.
+    """
+    path = os.getenv("AGENT_CACHE_FILE", DEFAULT_AGENT_CACHE_FILE)
+    return AgentResolutionCache(path) if path else None
+
+
+async def _get_agent(agents_client: AgentsClient, agent_id: str) -> Optional[Agent]:
+    try:
+        return await agents_client.get_agent(agent_id)
+    except Exception as e:
+        logger.warning(f"Could not retrieve agent {agent_id}: {e}")
+        return None
+
+
+async def resolve_agent(
+        agents_client: AgentsClient,
+        endpoint: str,
+        agent_name: Optional[str],
+        agent_id: Optional[str] = None,
+        cache: Optional[AgentResolutionCache] = None
+) -> Optional[Agent]:
+    """
+    Find the agent by its ID, by the cached ID for its name or by listing the agents.
+
+    The configured ID is used as is. The cached ID is validated with one get_agent call and must
+    belong to the agent with the same name; otherwise it is removed from the cache, and the agents
+    are listed to find the agent by name, which is then cached.
+
+    :param agents_client: The agents client.
+    :param endpoint: The project endpoint, the cache key together with the name.
+    :param agent_name: The agent name, None to find the agent only by the configured ID.
+    :param agent_id: The configured agent ID.
+    :param cache: The agent cache.
+    :return: The agent or None if it was not found.
+    """
+    if agent_id:
+        agent = await _get_agent(agents_client, agent_id)
+        if agent:
+            return agent
+    if not agent_name:
+        return None
+
+    cached_id = cache.get(endpoint, agent_name) if cache else None
+    if cached_id and cached_id != agent_id:
+        agent = await _get_agent(agents_client, cached_id)
+        if agent and agent.name == agent_name:
+            logger.info(f"Found agent by the cached ID, ID={agent.id}")
+            return agent
+    if cached_id:
+        logger.info(f"The cached ID of agent '{agent_name}' is stale, listing the agents")
+        cache.invalidate(endpoint, agent_name)
+
+    async for agent_object in agents_client.list_agents():
+        if agent_object.name == agent_name:
+            logger.info(f"Found agent by name '{agent_name}', ID={agent_object.id}")
+            if cache:
+                cache.set(endpoint, agent_name, agent_object.id)
+            return agent_object
+    return None
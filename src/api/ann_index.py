@@ -0,0 +1,165 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import List, Optional
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from .embeddings_store import fingerprint, load_embeddings, matches_fingerprint, normalize
+from .quantization import kmeans, sample_rows
+
+logger = logging.getLogger("azureaiapp")
+
+# The parts of the index are stored in the .npy files next to the embeddings file
+# with the fingerprint of the embeddings file, it was built for.
+_PARTS = ('centroids', 'rows', 'offsets')
+_FINGERPRINT = 'fingerprint'
+# The number of the row x centroid distances computed at once while the rows are assigned to the lists.
+_ASSIGN_BLOCK = 2 ** 24
+
+
+def index_path(embeddings_file: str, part: str) -> str:
+    """Return the path of the part of the index, built for the embeddings file."""
+    return f"{os.path.splitext(embeddings_file)[0]}.ivf_{part}.npy"
+
+
+class IVFIndex:
+    """
+    The inverted file index for the approximate nearest neighbour search.
+
+    The normalized embeddings are clustered with k-means into lists, and the query scans only the rows
+    of the nprobe lists, whose centroids are nearest to it, instead of the whole matrix. The larger
+    nprobe, the higher the recall and the longer the query, as efSearch of the HNSW index of
+    Azure AI Search. The index is built offline and saved next to the embeddings file as the row
+    numbers, ordered by list, the offsets of the lists and their centroids, which are memory-mapped
+    at load time, and the fingerprint of the embeddings file, so the index of the rebuilt file is ignored.
+
+    :param centroids: The float32 matrix of the centroids of the lists.
+    :param rows: The row numbers of the embeddings, ordered by list.
+    :param offsets: The start of every list in rows and the number of rows at the end.
+    """
+
+    DEFAULT_NPROBE = 16
+
+    def __init__(self, centroids: np.ndarray, rows: np.ndarray, offsets: np.ndarray) -> None:
+        """Constructor."""
+        if len(offsets) != len(centroids) + 1 or offsets[-1] != len(rows):
+            raise ValueError("The offsets must delimit one list of rows per centroid.")
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+        self._centroid_norms = (np.asarray(centroids, dtype=np.float32) ** 2).sum(axis=1)
+
+    def __len__(self) -> int:
+        """The number of the indexed rows."""
+        return len(self.rows)
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def default_lists(rows: int) -> int:
+        """Return the number of lists for the number of rows, about 4 * sqrt(rows)."""
+        return max(1, min(rows, int(4 * np.sqrt(rows))))
+
+    @classmethod
+    def build(
+            cls,
+            vectors: np.ndarray,
+            lists: Optional[int] = None,
+            iterations: int = 10,
+            sample_size: Optional[int] = None,
+            seed: int = 0
+        ) -> 'IVFIndex':
+        """
+        Cluster the embeddings into the lists.
+
+        :param vectors: The float32 matrix, it may be memory-mapped.
+        :param lists: The number of lists, about 4 * sqrt(rows) by default.
+        :param iterations: The number of k-means iterations.
+        :param sample_size: The number of the rows used to train the centroids, 64 per list by default.
+        :param seed: The seed of the sample and the initial centroids.
+        :return: The index.
+        """
+        lists = lists or cls.default_lists(len(vectors))
+        sample = normalize(sample_rows(vectors, sample_size or 64 * lists, seed))
+        centroids = kmeans(sample, lists, iterations, np.random.default_rng(seed))
+        centroid_norms = (centroids ** 2).sum(axis=1)
+        assignment = np.empty(len(vectors), dtype=np.int32)
+        block_rows = max(1, _ASSIGN_BLOCK // len(centroids))
+        for start in range(0, len(vectors), block_rows):
+            rows = normalize(np.array(vectors[start:start + block_rows], dtype=np.float32))
+            assignment[start:start + len(rows)] = (centroid_norms - 2 * rows @ centroids.T).argmin(axis=1)
+        rows = np.argsort(assignment, kind='stable').astype(np.int64)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=len(centroids)))
+        return cls(centroids, rows, offsets)
+
+    def save(self, embeddings_file: str) -> None:
+        """
+        Write the index next to the embeddings file.
+
+        :param embeddings_file: The embeddings file, the index was built for.
+        """
+        for part in _PARTS:
+            np.save(index_path(embeddings_file, part), getattr(self, part))
+        np.save(index_path(embeddings_file, _FINGERPRINT), fingerprint(embeddings_file))
+
+    @classmethod
+    def load(cls, embeddings_file: str, mmap: bool = True) -> Optional['IVFIndex']:
+        """
+        Load the index, built for the embeddings file.
+
+        :param embeddings_file: The embeddings file.
+        :param mmap: If True, the index is memory-mapped read only.
+        :return: The index or None, if it was not built or was built for another version of the embeddings file.
+        """
+        paths = [index_path(embeddings_file, part) for part in _PARTS]
+        if not all(os.path.isfile(path) for path in paths):
+            return None
+        if not matches_fingerprint(index_path(embeddings_file, _FINGERPRINT), embeddings_file):
+            logger.warning(f"The IVF index was built for another version of {embeddings_file}, rebuild it.")
+            return None
+        return cls(*(np.load(path, mmap_mode='r' if mmap else None) for path in paths))
+
+    def candidates(self, query: np.ndarray, nprobe: int = DEFAULT_NPROBE) -> np.ndarray:
+        """
+        Find the rows of the lists nearest to the query.
+
+        :param query: The normalized float32 query vector.
+        :param nprobe: The number of lists to scan.
+        :return: The row numbers in ascending order.
+        """
+        distances = self._centroid_norms - 2 * (self.centroids @ query)
+        nprobe = min(nprobe, len(distances))
+        probe = np.argpartition(distances, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in probe])
+        # The memory-mapped embeddings are read in order.
+        return np.sort(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Build the index for the embeddings file, given in the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m api.ann_index", description="Build the IVF index next to the embeddings file.")
+    parser.add_argument("embeddings_file", help="The .npy or .csv embeddings file.")
+    parser.add_argument("--lists", type=int, default=None, help="The number of lists, about 4 * sqrt(rows) by default.")
+    parser.add_argument("--iterations", type=int, default=10, help="The number of k-means iterations.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    vectors = load_embeddings(args.embeddings_file).vectors
+    index = IVFIndex.build(vectors, args.lists, args.iterations)
+    index.save(args.embeddings_file)
+    print(f"Built {index.lists} lists over {len(index)} rows in {time.perf_counter() - start:.1f} seconds: "
+          f"{index_path(args.embeddings_file, '*')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import sys
+import time
+
+
+class TTLCache:
+    """
+    The in-memory cache with time to live and least recently used eviction.
+
+    The entries expire ttl seconds after they were set. When the cache holds more than max_size
+    entries or, if max_bytes is set, the total size of values exceeds max_bytes, the least recently
+    used entries are evicted. The cache is not thread safe, it is meant to be used from the event loop.
+
+    :param max_size: The maximal number of entries.
+    :param ttl: The time to live of an entry in seconds, None if entries never expire.
+    :param max_bytes: The memory bound for the values, None if the cache is bounded only by max_size.
+    :param sizeof: The function returning the size of a value in bytes, sys.getsizeof by default.
+    :param timer: The monotonic clock, used to expire entries.
+    """
+
+    def __init__(
+            self,
+            max_size: int = 1024,
+            ttl: Optional[float] = 300.0,
+            max_bytes: Optional[int] = None,
+            sizeof: Callable[[Any], int] = sys.getsizeof,
+            timer: Callable[[], float] = time.monotonic
+        ) -> None:
+        """Constructor."""
+        if max_size <= 0:
+            raise ValueError("max_size must be positive.")
+        self._max_size = max_size
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._timer = timer
+        # key -> (expiration time, size, value), the most recently used entries are at the end.
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Optional[tuple]:
+        """Return the entry if it exists and has not expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= self._timer():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get the value and mark it as recently used.
+
+        :param key: The key.
+        :param default: The value returned if the key is absent or expired.
+        :return: The cached value or default.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Set the value and evict the least recently used entries if the cache is full.
+
+        :param key: The key.
+        :param value: The value to cache.
+        :param ttl: The time to live of this entry, the cache ttl by default.
+        """
+        if key in self._entries:
+            self._remove(key)
+        ttl = self._ttl if ttl is None else ttl
+        expires = None if ttl is None else self._timer() + ttl
+        size = self._sizeof(value) if self._max_bytes is not None else 0
+        if self._max_bytes is not None and size > self._max_bytes:
+            # The value does not fit into the cache at all.
+            self.evictions += 1
+            return
+        self._entries[key] = (expires, size, value)
+        self._bytes += size
+        while len(self._entries) > self._max_size or (
+                self._max_bytes is not None and self._bytes > self._max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Remove the entry.
+
+        :param key: The key.
+        :param default: The value returned if the key is absent.
+        :return: The removed value or default.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[2]
+
+    def clear(self) -> None:
+        """Remove all the entries, the counters are kept."""
+        self._entries.clear()
+        self._bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """The counters, which can be used to size the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
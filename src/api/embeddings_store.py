@@ -0,0 +1,269 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+logger = logging.getLogger("azureaiapp")
+
+CSV_SUFFIX = '.csv'
+NPY_SUFFIX = '.npy'
+# The tokens and titles are stored in the sidecar file next to the float32 matrix.
+METADATA_SUFFIX = '.json'
+# The size of the blocks, in which the embeddings file is hashed.
+_HASH_BLOCK = 2 ** 20
+
+
+class Embeddings:
+    """
+    The columns of the embeddings file.
+
+    :param tokens: The text chunks.
+    :param titles: The source document of each chunk.
+    :param vectors: The float32 matrix with one embedding per chunk. It may be memory-mapped.
+    """
+
+    def __init__(self, tokens: Sequence[str], titles: Sequence[str], vectors: np.ndarray) -> None:
+        """Constructor."""
+        if vectors.ndim != 2 or vectors.shape[0] != len(tokens) or len(tokens) != len(titles):
+            raise ValueError("The embeddings matrix must have one row per token and title.")
+        self.tokens = tokens
+        self.titles = titles
+        self.vectors = vectors
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the rows in the format of the embeddings csv file.
+
+        :return: The iterator over dictionaries with token, embedding and title.
+        """
+        for token, vector, title in zip(self.tokens, self.vectors, self.titles):
+            yield {'token': token, 'embedding': vector.tolist(), 'title': title}
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scale the rows to the unit length in place, so that dot product is the cosine similarity.
+
+    :param matrix: The float32 matrix to normalize.
+    :return: The same matrix.
+    """
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+    return matrix
+
+
+def fingerprint(embeddings_file: str) -> np.ndarray:
+    """
+    Return the size and the hash of the content of the embeddings file, which identify its version.
+
+    The copy of the file, for example by git clone or in the image, has the same fingerprint.
+
+    :param embeddings_file: The embeddings file.
+    :return: The uint8 array of the size in bytes, as little endian int64, and the BLAKE2b digest.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    size = 0
+    with open(embeddings_file, 'rb') as fp:
+        while block := fp.read(_HASH_BLOCK):
+            digest.update(block)
+            size += len(block)
+    return np.frombuffer(size.to_bytes(8, 'little') + digest.digest(), dtype=np.uint8)
+
+
+def matches_fingerprint(fingerprint_file: str, embeddings_file: str) -> bool:
+    """
+    Check that the files, built for the embeddings file, were built for its current version.
+
+    :param fingerprint_file: The .npy file with the fingerprint, saved with the built files.
+    :param embeddings_file: The embeddings file.
+    :return: True if the fingerprint file exists and has the fingerprint of the embeddings file.
+    """
+    return os.path.isfile(fingerprint_file) and np.array_equal(
+        np.load(fingerprint_file), fingerprint(embeddings_file))
+
+
+def _metadata_path(npy_file: str) -> str:
+    """Return the path of the sidecar file with tokens and titles."""
+    return os.path.splitext(npy_file)[0] + METADATA_SUFFIX
+
+
+def read_csv(embeddings_file: str, dimensions: Optional[int] = None) -> Embeddings:
+    """
+    Read the embeddings csv file, where each embedding is stored as a JSON array.
+
+    :param embeddings_file: The csv file with token, embedding and title columns.
+    :param dimensions: The number of dimensions, used only if the file has no rows.
+    :return: The embeddings.
+    """
+    tokens = []
+    titles = []
+    vectors = []
+    with open(embeddings_file, newline='') as fp:
+        reader = csv.DictReader(fp)
+        for row in reader:
+            tokens.append(row['token'])
+            titles.append(row['title'])
+            vectors.append(json.loads(row['embedding']))
+    matrix = np.array(vectors, dtype=np.float32)
+    if not vectors:
+        matrix = matrix.reshape(0, dimensions or 0)
+    return Embeddings(tokens, titles, matrix)
+
+
+def iter_rows(embeddings_file: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily iterate over the rows of the embeddings file of either format.
+
+    The csv file is parsed row by row and the rows of the binary file are read from
+    the memory-mapped matrix, so the memory use does not depend on the file size.
+
+    :param embeddings_file: The .csv or .npy file.
+    :return: The iterator over dictionaries with token, embedding and title.
+    """
+    if embeddings_file.endswith(NPY_SUFFIX):
+        yield from read_npy(embeddings_file).rows()
+        return
+    with open(embeddings_file, newline='') as fp:
+        reader = csv.DictReader(fp)
+        for row in reader:
+            yield {'token': row['token'], 'embedding': json.loads(row['embedding']), 'title': row['title']}
+
+
+def read_npy(embeddings_file: str, mmap: bool = True) -> Embeddings:
+    """
+    Read the binary embeddings file and its sidecar file.
+
+    :param embeddings_file: The .npy file with the float32 matrix.
+    :param mmap: If True, the matrix is memory-mapped read only instead of being read into memory.
+    :return: The embeddings.
+    """
+    vectors = np.load(embeddings_file, mmap_mode='r' if mmap else None)
+    with open(_metadata_path(embeddings_file)) as fp:
+        metadata = json.load(fp)
+    return Embeddings(metadata['tokens'], metadata['titles'], vectors)
+
+
+def write_csv(embeddings: Embeddings, embeddings_file: str) -> None:
+    """
+    Write the embeddings csv file.
+
+    :param embeddings: The embeddings to write.
+    :param embeddings_file: The output csv file.
+    """
+    with open(embeddings_file, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=['token', 'embedding', 'title'])
+        writer.writeheader()
+        for row in embeddings.rows():
+            row['embedding'] = json.dumps(row['embedding'])
+            writer.writerow(row)
+
+
+def write_npy(embeddings: Embeddings, embeddings_file: str) -> None:
+    """
+    Write the float32 matrix to the .npy file and the tokens and titles to the sidecar file.
+
+    :param embeddings: The embeddings to write.
+    :param embeddings_file: The output .npy file.
+    """
+    np.save(embeddings_file, np.ascontiguousarray(embeddings.vectors, dtype=np.float32))
+    with open(_metadata_path(embeddings_file), 'w') as fp:
+        json.dump({'tokens': list(embeddings.tokens), 'titles': list(embeddings.titles)}, fp)
+
+
+def load_embeddings(embeddings_file: str, mmap: bool = True) -> Embeddings:
+    """
+    Load the embeddings file of either format, based on its extension.
+
+    :param embeddings_file: The .csv or .npy file.
+    :param mmap: If True, the binary matrix is memory-mapped.
+    :return: The embeddings.
+    """
+    if embeddings_file.endswith(NPY_SUFFIX):
+        return read_npy(embeddings_file, mmap=mmap)
+    return read_csv(embeddings_file)
+
+
+def save_embeddings(embeddings: Embeddings, embeddings_file: str) -> None:
+    """
+    Save the embeddings in the format, defined by the file extension.
+
+    :param embeddings: The embeddings to write.
+    :param embeddings_file: The .csv or .npy file.
+    """
+    if embeddings_file.endswith(NPY_SUFFIX):
+        write_npy(embeddings, embeddings_file)
+    else:
+        write_csv(embeddings, embeddings_file)
+
+
+def find_embeddings_file(embeddings_file: str) -> str:
+    """
+    Return the binary embeddings file next to the csv file if it was built.
+
+    The binary file, which is older than the csv file, for example after build_embeddings_file has
+    regenerated the csv file, is stale, and the csv file is used until it is converted again.
+
+    :param embeddings_file: The csv embeddings file.
+    :return: The path to the .npy file if it exists together with its sidecar and is not older than
+             the csv file, the embeddings_file otherwise.
+    """
+    npy_file = os.path.splitext(embeddings_file)[0] + NPY_SUFFIX
+    metadata_file = _metadata_path(npy_file)
+    if not (os.path.isfile(npy_file) and os.path.isfile(metadata_file)):
+        return embeddings_file
+    if os.path.isfile(embeddings_file) and os.path.getmtime(embeddings_file) > min(
+            os.path.getmtime(npy_file), os.path.getmtime(metadata_file)):
+        logger.warning(f"{npy_file} is older than {embeddings_file}, using the csv file; convert it again.")
+        return embeddings_file
+    return npy_file
+
+
+def get_local_embeddings_file() -> str:
+    """
+    Return the embeddings file of the local search.
+
+    :return: AZURE_AI_SEARCH_EMBEDDINGS_FILE or the bundled file, in the binary format if it was built.
+    """
+    return os.getenv(
+        "AZURE_AI_SEARCH_EMBEDDINGS_FILE",
+        find_embeddings_file(os.path.join(os.path.dirname(__file__), "data", "embeddings.csv")))
+
+
+def convert_csv(embeddings_file: str, output_file: Optional[str] = None) -> str:
+    """
+    Convert the embeddings csv file to the binary format.
+
+    :param embeddings_file: The csv embeddings file.
+    :param output_file: The .npy file to write, by default next to the csv file.
+    :return: The path to the .npy file.
+    """
+    if output_file is None:
+        output_file = os.path.splitext(embeddings_file)[0] + NPY_SUFFIX
+    write_npy(read_csv(embeddings_file), output_file)
+    return output_file
+
+
+def main(argv: List[str]) -> None:
+    """Convert the csv embeddings files, given in the command line."""
+    if not argv:
+        print("Usage: python -m api.embeddings_store <embeddings.csv> [<embeddings.csv> ...]")
+        sys.exit(1)
+    for embeddings_file in argv:
+        print(f"{embeddings_file} -> {convert_csv(embeddings_file)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
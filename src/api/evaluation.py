@@ -0,0 +1,345 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncio
+import concurrent.futures
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import (
+   AgentEvaluationRequest,
+   AgentEvaluationSamplingConfiguration,
+   AgentEvaluationRedactionConfiguration,
+   EvaluatorIds
+)
+
+logger = logging.getLogger("azureaiapp")
+
+# The thread ID and the run ID of the completed run.
+EvaluationRun = Tuple[str, str]
+
+
+def create_evaluation_request(thread_id: str, run_id: str, app_insights_conn_str: str) -> AgentEvaluationRequest:
+    """
+    Create the request to evaluate the agent run.
+
+    The runs are sampled by the scheduler, so the service evaluates every submitted run.
+
+    :param thread_id: The ID of the thread.
+    :param run_id: The ID of the run.
+    :param app_insights_conn_str: The Application Insights connection string, receiving the results.
+    :return: The evaluation request.
+    """
+    return AgentEvaluationRequest(
+        run_id=run_id,
+        thread_id=thread_id,
+        evaluators={
+            "Relevance": {"Id": EvaluatorIds.RELEVANCE.value},
+            "TaskAdherence": {"Id": EvaluatorIds.TASK_ADHERENCE.value},
+            "ToolCallAccuracy": {"Id": EvaluatorIds.TOOL_CALL_ACCURACY.value},
+        },
+        sampling_configuration=AgentEvaluationSamplingConfiguration(
+            name="default",
+            sampling_percent=100,
+        ),
+        redaction_configuration=AgentEvaluationRedactionConfiguration(
+            redact_score_properties=False,
+        ),
+        app_insights_connection_string=app_insights_conn_str,
+    )
+
+
+async def submit_evaluations(
+        ai_project: AIProjectClient,
+        app_insights_conn_str: str,
+        runs: List[EvaluationRun]
+) -> List[EvaluationRun]:
+    """
+    Submit the evaluations of the runs.
+
+    The service accepts one run per request, so the requests of the batch are sent concurrently.
+
+    :param ai_project: The project client.
+    :param app_insights_conn_str: The Application Insights connection string, receiving the results.
+    :param runs: The thread and run IDs.
+    :return: The runs, which evaluations were not submitted.
+    """
+    async def submit(thread_id: str, run_id: str) -> bool:
+        try:
+            logger.info(f"Running agent evaluation on thread ID {thread_id} and run ID {run_id}")
+            agent_evaluation_response = await ai_project.evaluations.create_agent_evaluation(
+                evaluation=create_evaluation_request(thread_id, run_id, app_insights_conn_str)
+            )
+            logger.info(f"Evaluation response: {agent_evaluation_response}")
+            return True
+        except Exception as e:
+            logger.error(f"Error creating agent evaluation: {e}")
+            return False
+
+    results = await asyncio.gather(*(submit(thread_id, run_id) for thread_id, run_id in runs))
+    return [run for run, submitted in zip(runs, results) if not submitted]
+
+
+class EvaluationScheduler:
+    """
+    The background evaluation of the completed runs with the bounded queue and the fixed number of workers.
+
+    The runs are sampled before they are queued. If the queue is full, the run is dropped rather
+    than delaying the chat. Each worker takes up to batch_size queued runs and submits them with
+    one call of the submit function. The queued runs are drained when the scheduler is closed.
+
+    :param submit: The function, submitting the batch of runs and returning the failed ones.
+    :param max_queue_size: The maximal number of queued runs.
+    :param workers: The number of workers.
+    :param batch_size: The maximal number of runs, submitted together.
+    :param sampling_percent: The percentage of the runs to evaluate, from 0 to 100.
+    :param rand: The function, returning a random number in [0, 1), used for sampling.
+    """
+
+    def __init__(
+            self,
+            submit: Callable[[List[EvaluationRun]], Awaitable[List[EvaluationRun]]],
+            max_queue_size: int = 100,
+            workers: int = 2,
+            batch_size: int = 10,
+            sampling_percent: float = 100.0,
+            rand: Callable[[], float] = random.random
+    ) -> None:
+        """Constructor."""
+        if workers <= 0 or batch_size <= 0:
+            raise ValueError("workers and batch_size must be positive.")
+        self._submit = submit
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._workers_count = workers
+        self._batch_size = batch_size
+        self._sampling_percent = sampling_percent
+        self._rand = rand
+        self._workers: List[asyncio.Task] = []
+        self._closed = False
+        self.scheduled = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.submitted = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Start the workers in the running event loop."""
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"evaluation-worker-{i}") for i in range(self._workers_count)]
+
+    def schedule(self, thread_id: str, run_id: str) -> bool:
+        """
+        Queue the completed run for evaluation without waiting.
+
+        :param thread_id: The ID of the thread.
+        :param run_id: The ID of the run.
+        :return: True if the run was queued, False if it was sampled out or dropped.
+        """
+        if self._rand() * 100 >= self._sampling_percent:
+            self.sampled_out += 1
+            return False
+        if self._closed:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((thread_id, run_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Evaluation queue is full, dropped run ID {run_id}, {self.dropped} dropped in total")
+            return False
+        self.scheduled += 1
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                self.failed += len(await self._submit(batch))
+                self.submitted += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Error submitting {len(batch)} evaluations: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def close(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Stop accepting runs, wait for the queued runs to be submitted and stop the workers.
+
+        :param timeout: The maximal time to wait for the queue to drain in seconds.
+        """
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Evaluation queue was not drained, {self._queue.qsize()} runs are not evaluated")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(f"Evaluation scheduler closed: {self.stats}")
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """The queue depth and the counters of the runs."""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'scheduled': self.scheduled,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+            'submitted': self.submitted,
+            'failed': self.failed,
+        }
+
+
+class SqliteEvaluationQueue:
+    """
+    The durable queue of the completed runs in the local SQLite database.
+
+    The chat workers only add the sampled runs to the queue, and the evaluator process
+    (python -m api.evaluator) takes them in batches and submits them. The runs are kept
+    until they are acknowledged, so they survive the restarts of the workers and of the
+    evaluator. The failed runs are retried with the delay up to max_attempts times.
+    The queue is designed for one evaluator process. The runs are stored by the writer thread,
+    so the insert, which waits while another process holds the write lock, does not block
+    the event loop of the chat worker.
+
+    :param path: The path to the database file, it is created if it does not exist.
+    :param sampling_percent: The percentage of the runs to evaluate, from 0 to 100.
+    :param max_attempts: The maximal number of submissions of a run.
+    :param retry_delay: The delay before the failed run is submitted again in seconds.
+    :param rand: The function, returning a random number in [0, 1), used for sampling.
+    :param timer: The wall clock, used to delay the retries.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            sampling_percent: float = 100.0,
+            max_attempts: int = 3,
+            retry_delay: float = 60.0,
+            rand: Callable[[], float] = random.random,
+            timer: Callable[[], float] = time.time
+    ) -> None:
+        """Constructor."""
+        self._sampling_percent = sampling_percent
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._rand = rand
+        self._timer = timer
+        # The connection is used by one thread at a time.
+        self._lock = threading.Lock()
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="evaluation-queue")
+        self._pending: List[concurrent.futures.Future] = []
+        self._connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, thread_id TEXT, run_id TEXT, "
+            "attempts INTEGER DEFAULT 0, not_before REAL DEFAULT 0)")
+        self.scheduled = 0
+        self.sampled_out = 0
+        self.dropped = 0
+
+    def schedule(self, thread_id: str, run_id: str) -> bool:
+        """
+        Add the completed run to the queue without waiting for it to be stored.
+
+        :param thread_id: The ID of the thread.
+        :param run_id: The ID of the run.
+        :return: True if the run was passed to the writer thread, False if it was sampled out.
+                 The runs, which could not be stored, are logged and counted as dropped.
+        """
+        if self._rand() * 100 >= self._sampling_percent:
+            self.sampled_out += 1
+            return False
+        self._pending = [future for future in self._pending if not future.done()]
+        self._pending.append(self._writer.submit(self._insert, thread_id, run_id))
+        return True
+
+    def _insert(self, thread_id: str, run_id: str) -> None:
+        """Store the run, this method is called by the writer thread."""
+        try:
+            with self._lock:
+                self._connection.execute(
+                    "INSERT INTO evaluations (thread_id, run_id) VALUES (?, ?)", (thread_id, run_id))
+        except sqlite3.Error as e:
+            self.dropped += 1
+            logger.error(f"Error queuing evaluation of run ID {run_id}: {e}")
+            return
+        self.scheduled += 1
+
+    async def flush(self) -> None:
+        """Wait until the scheduled runs are stored."""
+        pending, self._pending = self._pending, []
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in pending))
+
+    def take(self, batch_size: int) -> List[Tuple[int, EvaluationRun]]:
+        """
+        Get the oldest runs, which are due, without removing them from the queue.
+
+        :param batch_size: The maximal number of runs.
+        :return: The queue IDs and the runs.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, thread_id, run_id FROM evaluations WHERE not_before <= ? ORDER BY id LIMIT ?",
+                (self._timer(), batch_size)).fetchall()
+        return [(row[0], (row[1], row[2])) for row in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        """
+        Remove the submitted runs from the queue.
+
+        :param ids: The queue IDs, returned by take.
+        """
+        with self._lock:
+            self._connection.executemany("DELETE FROM evaluations WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, ids: List[int]) -> None:
+        """
+        Delay the failed runs and remove the ones, which have reached max_attempts.
+
+        :param ids: The queue IDs, returned by take.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "UPDATE evaluations SET attempts = attempts + 1, not_before = ? WHERE id = ?",
+                [(self._timer() + self._retry_delay, i) for i in ids])
+            self._connection.execute("DELETE FROM evaluations WHERE attempts >= ?", (self._max_attempts,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until the scheduled runs are stored and close the connection. The queued runs are kept
+        for the evaluator, so nothing is drained.
+
+        :param timeout: Not used, accepted for the compatibility with EvaluationScheduler.
+        """
+        await self.flush()
+        self._writer.shutdown()
+        with self._lock:
+            self._connection.close()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """The queue depth and the counters of the runs, queued by this process."""
+        return {
+            'queue_depth': len(self),
+            'scheduled': self.scheduled,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+        }
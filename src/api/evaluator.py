@@ -0,0 +1,100 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+The evaluator process, submitting the evaluations of the runs from the durable queue.
+
+The chat workers add the completed runs to the queue in EVALUATION_QUEUE_DB, so the evaluation
+does not use their connections or CPU. Gunicorn starts this process with the application; it
+can also be started separately:
+
+    python -m api.evaluator
+"""
+from typing import Awaitable, Callable, List
+
+import asyncio
+import functools
+import logging
+import os
+import signal
+
+from dotenv import load_dotenv
+
+from .evaluation import EvaluationRun, SqliteEvaluationQueue, submit_evaluations
+
+logger = logging.getLogger("azureaiapp")
+
+
+async def drain_queue(
+        queue: SqliteEvaluationQueue,
+        submit: Callable[[List[EvaluationRun]], Awaitable[List[EvaluationRun]]],
+        stop: asyncio.Event,
+        batch_size: int = 10,
+        poll_interval: float = 1.0
+) -> None:
+    """
+    Submit the queued runs in batches until the stop event is set.
+
+    :param queue: The durable queue.
+    :param submit: The function, submitting the batch of runs and returning the failed ones.
+    :param stop: The event, which stops the evaluator.
+    :param batch_size: The maximal number of runs, submitted together.
+    :param poll_interval: The time to wait when the queue is empty in seconds.
+    """
+    while not stop.is_set():
+        batch = queue.take(batch_size)
+        if not batch:
+            try:
+                await asyncio.wait_for(stop.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        failed = set(await submit([run for _, run in batch]))
+        queue.ack([i for i, run in batch if run not in failed])
+        if failed:
+            logger.warning(f"Failed to submit {len(failed)} of {len(batch)} evaluations, they will be retried")
+            queue.retry([i for i, run in batch if run in failed])
+        logger.info(f"Submitted {len(batch) - len(failed)} evaluations, {len(queue)} are queued")
+
+
+async def main() -> None:
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.identity.aio import DefaultAzureCredential
+
+    queue = SqliteEvaluationQueue(
+        os.environ["EVALUATION_QUEUE_DB"],
+        max_attempts=int(os.getenv("EVALUATION_MAX_ATTEMPTS", "3")),
+        retry_delay=float(os.getenv("EVALUATION_RETRY_DELAY", "60")))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with DefaultAzureCredential(exclude_shared_token_cache_credential=True) as creds:
+        async with AIProjectClient(
+            credential=creds,
+            endpoint=os.environ["AZURE_EXISTING_AIPROJECT_ENDPOINT"],
+            api_version="2025-05-15-preview"
+        ) as ai_project:
+            app_insights_conn_str = await ai_project.telemetry.get_connection_string()
+            if not app_insights_conn_str:
+                logger.error("Application Insights was not enabled for this project, the evaluator is stopped.")
+                await queue.close()
+                return
+            logger.info(f"Evaluator started, {len(queue)} evaluations are queued")
+            await drain_queue(
+                queue,
+                functools.partial(submit_evaluations, ai_project, app_insights_conn_str),
+                stop,
+                batch_size=int(os.getenv("EVALUATION_BATCH_SIZE", "10")),
+                poll_interval=float(os.getenv("EVALUATION_POLL_INTERVAL", "1")))
+    await queue.close()
+    logger.info("Evaluator stopped")
+
+
+if __name__ == "__main__":
+    if not os.getenv("RUNNING_IN_PRODUCTION"):
+        load_dotenv(override=True)
+    from logging_config import configure_logging
+    configure_logging(os.getenv("APP_LOG_FILE", ""))
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import time
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+
+
+class HttpPool:
+    """
+    The aiohttp session, shared by all the clients of the worker, and its connection statistics.
+
+    One connection pool per worker keeps the connections to the agent service alive between the
+    requests, so the short chat turns do not pay for the TCP and TLS handshakes. The statistics
+    are collected with the aiohttp tracing hooks and show whether the pool is saturated, that is
+    whether the requests wait for a free connection.
+
+    :param limit: The maximal number of connections, 0 for no limit.
+    :param limit_per_host: The maximal number of connections to one host, 0 for no limit.
+    :param keepalive_timeout: The time to keep the idle connection open in seconds.
+    :param dns_cache_ttl: The time to cache the resolved host names in seconds.
+    """
+
+    def __init__(
+            self,
+            limit: int = 100,
+            limit_per_host: int = 0,
+            keepalive_timeout: float = 60.0,
+            dns_cache_ttl: Optional[int] = 300
+    ) -> None:
+        """Constructor."""
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.queued = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """Return the tracing hooks, counting the requests and the connections."""
+        trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace())
+
+        async def on_request_start(session, ctx, params):
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        async def on_request_end(session, ctx, params):
+            self.in_flight -= 1
+
+        async def on_connection_queued_start(session, ctx, params):
+            self.queued += 1
+            ctx.queued_at = time.monotonic()
+
+        async def on_connection_queued_end(session, ctx, params):
+            wait = time.monotonic() - ctx.queued_at
+            self.queue_wait += wait
+            self.max_queue_wait = max(self.max_queue_wait, wait)
+
+        async def on_connection_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_end)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    def open(self) -> aiohttp.ClientSession:
+        """
+        Create the session in the running event loop.
+
+        :return: The session.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.dns_cache_ttl is not None,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        # The same session settings as the ones of the session, created by AioHttpTransport.
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            auto_decompress=False,
+            trust_env=True,
+            trace_configs=[self._trace_config()],
+        )
+        return self.session
+
+    def transport(self) -> AioHttpTransport:
+        """
+        Return the transport for the Azure SDK client, which uses the shared session.
+
+        The client does not close the session, it is closed by close.
+
+        :return: The transport.
+        """
+        if self.session is None:
+            self.open()
+        return AioHttpTransport(session=self.session, session_owner=False)
+
+    async def close(self) -> None:
+        """Close the session and its connections."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """The connection reuse, the requests waiting for a free connection and the DNS cache counters."""
+        connections = self.connections_created + self.connections_reused
+        return {
+            'limit': self.limit,
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_rate': self.connections_reused / connections if connections else 0.0,
+            'queued': self.queued,
+            'saturation': self.queued / self.requests if self.requests else 0.0,
+            'avg_queue_wait_ms': round(self.queue_wait / self.queued * 1000, 2) if self.queued else 0.0,
+            'max_queue_wait_ms': round(self.max_queue_wait * 1000, 2),
+            'dns_cache_hits': self.dns_cache_hits,
+            'dns_cache_misses': self.dns_cache_misses,
+        }
@@ -0,0 +1,247 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from azure.ai.agents.models import AsyncFunctionTool
+
+from .ann_index import IVFIndex
+from .embeddings_store import load_embeddings, normalize
+from .quantization import build_quantization
+from .search_index_manager import format_search_results
+
+
+class LocalSearchIndex:
+    """
+    The in-process vector search over the embeddings file.
+
+    All embeddings are kept in one contiguous float32 matrix with L2 normalized rows,
+    so that the top-k cosine similarity query is a single matrix-vector product.
+    The matrix, which is already normalized, is used as is, without copying, so the
+    memory-mapped binary embeddings file stays in the page cache.
+    This is an alternative to the Azure AI Search round trip for the corpora,
+    small enough to fit into the worker memory; the agent calls it with the function
+    tool, returned by create_search_tool.
+    With quantization, the first pass scores the int8 or the product quantized codes, which
+    take a fraction of the float32 matrix, and only its top top_k * rerank candidates are scored
+    exactly with the float32 rows. If the matrix is memory-mapped, these rows are read from
+    the page cache, shared by the workers, so the memory of each worker is mostly the codes.
+    The codes may be built offline, with python -m api.quantization, and memory-mapped instead.
+    With the IVF index, built offline, only the rows of the nprobe lists nearest to the query
+    are scored, so the query time grows with the size of the lists instead of the catalog.
+
+    :param tokens: The text chunks, one per row of the embeddings matrix.
+    :param titles: The source document of each chunk.
+    :param embeddings: The matrix of shape (number of chunks, dimensions).
+    :param model: The embedding model to be used,
+                  must be the same as one use to build the file with embeddings.
+    :param dimensions: The number of dimensions in the embedding. Set this parameter only if
+                       embedding model accepts dimensions parameter.
+    :param embedding_client: The embedding client, used to embed the queries.
+    :param quantization: The quantization of the first pass, 'int8' or 'pq', None for the exact search.
+    :param rerank: The number of the candidates of the first pass per result, re-ranked exactly.
+    :param pq_subspaces: The number of subspaces of the product quantization, a quarter of the dimensions by default.
+    :param quantized: The quantizer and the codes of the embeddings, built offline, which are used
+                      instead of fitting the quantization.
+    :param ann_index: The IVF index of the embeddings for the approximate search, it cannot be combined
+                      with quantization.
+    :param nprobe: The number of the IVF lists scanned by the query.
+    """
+
+    DEFAULT_TOP_K = 5
+    DEFAULT_RERANK = 10
+
+    def __init__(
+            self,
+            tokens: Sequence[str],
+            titles: Sequence[str],
+            embeddings: np.ndarray,
+            model: str,
+            dimensions: Optional[int] = None,
+            embedding_client: Optional[Any] = None,
+            quantization: Optional[str] = None,
+            rerank: int = DEFAULT_RERANK,
+            pq_subspaces: Optional[int] = None,
+            quantized: Optional[Tuple[Any, np.ndarray]] = None,
+            ann_index: Optional[IVFIndex] = None,
+            nprobe: int = IVFIndex.DEFAULT_NPROBE
+        ) -> None:
+        """Constructor."""
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(tokens) or len(tokens) != len(titles):
+            raise ValueError("The embeddings matrix must have one row per token and title.")
+        if ann_index is not None and len(ann_index) != len(tokens):
+            raise ValueError(
+                f"The IVF index has {len(ann_index)} rows for {len(tokens)} embeddings, rebuild it.")
+        if ann_index is not None and (quantization or quantized is not None):
+            raise ValueError("The IVF index cannot be combined with quantization.")
+        # The sequences, such as the string tables of the shared store, are used as is, without copying.
+        self._tokens = tokens if isinstance(tokens, Sequence) else list(tokens)
+        self._titles = titles if isinstance(titles, Sequence) else list(titles)
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if not self._is_normalized(matrix):
+            matrix = normalize(np.array(matrix))
+        self._matrix = matrix
+        self._embedding_model = model
+        self._dimensions = dimensions
+        self._embedding_client = embedding_client
+        self._rerank = max(1, rerank)
+        self._ann_index = ann_index
+        self._nprobe = nprobe
+        self._quantizer = None
+        self._codes = None
+        if quantized is not None:
+            self._quantizer, self._codes = quantized
+            if self._quantizer.rows(self._codes) != len(tokens):
+                raise ValueError(
+                    f"The quantization codes have {self._quantizer.rows(self._codes)} rows "
+                    f"for {len(tokens)} embeddings, rebuild them.")
+        elif quantization:
+            self._quantizer, self._codes = build_quantization(matrix, quantization, pq_subspaces)
+
+    @classmethod
+    def from_file(
+            cls,
+            embeddings_file: str,
+            model: str,
+            dimensions: Optional[int] = None,
+            embedding_client: Optional[Any] = None,
+            **kwargs: Any
+        ) -> 'LocalSearchIndex':
+        """
+        Load the embeddings file, generated by SearchIndexManager.build_embeddings_file.
+
+        :param embeddings_file: The csv file with token, embedding and title columns or the binary .npy file,
+                                which is memory-mapped.
+        :param model: The embedding model used to build the file.
+        :param dimensions: The number of dimensions in the embedding.
+        :param embedding_client: The embedding client, used to embed the queries.
+        :param kwargs: The quantization parameters of the constructor.
+        :return: The loaded search index.
+        """
+        embeddings = load_embeddings(embeddings_file)
+        return cls(
+            embeddings.tokens, embeddings.titles, embeddings.vectors, model, dimensions, embedding_client, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """The float32 matrix of the normalized embeddings."""
+        return self._matrix
+
+    @property
+    def nbytes(self) -> int:
+        """The memory scanned by the first pass: the codes with the quantizer parameters or the float32 matrix."""
+        if self._codes is None:
+            return self._matrix.nbytes
+        return self._codes.nbytes + self._quantizer.nbytes
+
+    @staticmethod
+    def _is_normalized(matrix: np.ndarray) -> bool:
+        """Return True if all the rows have the unit length."""
+        # The squared norms are computed without the temporary copy of the matrix.
+        return bool(np.allclose(np.einsum('ij,ij->i', matrix, matrix), 1, atol=2e-4))
+
+    def query(self, vector: Sequence[float], top_k: int = DEFAULT_TOP_K) -> List[Tuple[int, float]]:
+        """
+        Find the rows most similar to the vector.
+
+        :param vector: The query embedding.
+        :param top_k: The number of results to return.
+        :return: The list of (row, cosine similarity) pairs sorted by descending similarity.
+        """
+        top_k = min(top_k, len(self._tokens))
+        if top_k <= 0:
+            return []
+        query = normalize(np.array(vector, dtype=np.float32))
+        if self._ann_index is not None:
+            rows = self._ann_index.candidates(query, self._nprobe)
+            scores = self._matrix[rows] @ query
+        elif self._codes is None:
+            rows = None
+            scores = self._matrix @ query
+        else:
+            # The candidates are sorted, so the memory-mapped rows are read in order.
+            rows = np.sort(self._top(self._quantizer.scores(self._codes, query), top_k * self._rerank))
+            scores = self._matrix[rows] @ query
+        candidates = self._top(scores, top_k)
+        best = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(i if rows is None else rows[i]), float(scores[i])) for i in best]
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Return the positions of the k largest scores in any order."""
+        if k < len(scores):
+            return np.argpartition(scores, -k)[-k:]
+        return np.arange(len(scores))
+
+    def get_documents(self, hits: Sequence[Tuple[int, float]]) -> List[Dict[str, Any]]:
+        """
+        Get the documents in the format of Azure AI Search results.
+
+        :param hits: The (row, score) pairs, returned by query.
+        :return: The list of documents with token, title and score.
+        """
+        return [
+            {
+                'embedId': str(row),
+                'token': self._tokens[row],
+                'title': self._titles[row],
+                '@search.score': score,
+            }
+            for row, score in hits
+        ]
+
+    async def _embed(self, message: str) -> List[float]:
+        """
+        Build the embedding of the query.
+
+        :param message: The customer question.
+        :return: The embedding vector.
+        """
+        if self._embedding_client is None:
+            raise ValueError("The embedding client is needed to search the local index.")
+        response = await self._embedding_client.embed(
+            input=[message],
+            dimensions=self._dimensions,
+            model=self._embedding_model
+        )
+        return response["data"][0]["embedding"]
+
+    async def search(self, message: str, top_k: int = DEFAULT_TOP_K) -> str:
+        """
+        Search the message in the local index.
+
+        :param message: The customer question.
+        :param top_k: The number of chunks to return.
+        :return: The context for the question.
+        """
+        vector = await self._embed(message)
+        return format_search_results(self.get_documents(self.query(vector, top_k)))
+
+
+def create_search_tool(index: Optional[LocalSearchIndex] = None) -> AsyncFunctionTool:
+    """
+    Create the function tool, by which the agent searches the local index.
+
+    The agent run requests the function call, and the agents client, for which the tool is
+    enabled with enable_auto_function_calls, calls it in the worker while the run is streamed.
+    The tool without the index only defines the function, as the agent is created with it.
+
+    :param index: The local search index.
+    :return: The function tool.
+    """
+    async def search_product_catalog(query: str) -> str:
+        """
+        Search the product catalog for the information to answer the customer question.
+
+        :param query: The customer question.
+        :return: The chunks of the catalog, most similar to the question, with their source documents.
+        """
+        if index is None:
+            raise ValueError("The local search index is not loaded.")
+        return await index.search(query)
+
+    return AsyncFunctionTool({search_product_catalog})
@@ -1,7 +1,10 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
+import asyncio
 import contextlib
+import functools
+import importlib.util
 import os
 
 from azure.ai.projects.aio import AIProjectClient
@@ -14,66 +17,231 @@ from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
 from logging_config import configure_logging
+from .agent_cache import get_agent_cache, resolve_agent
+from .http_pool import HttpPool
+from .preload import PROJECT_SCOPE, SharedTokenCredential, get_shared_agent
+from .stream_limiter import StreamLimiter, StreamLimitMiddleware
+from .token_cache import CachingTokenCredential, FileTokenCache
 
 enable_trace = False
 logger = None
 
+
+def preload_modules() -> None:
+    """
+    Import the modules, which the workers import lazily, in the gunicorn master process.
+
+    The workers are forked from the master, so they share these modules instead of importing them
+    on every start, including the restarts after max_requests.
+    """
+    from . import evaluation, session_cache  # noqa: F401
+    if os.getenv("ENABLE_AZURE_MONITOR_TRACING", "").lower() == "true":
+        import azure.monitor.opentelemetry  # noqa: F401
+
+
+async def configure_tracing(app: fastapi.FastAPI, ai_project: AIProjectClient) -> None:
+    """
+    Configure Application Insights and start the evaluation of the completed runs.
+
+    :param app: The application, which state receives the connection string and the evaluation scheduler.
+    :param ai_project: The project client.
+    """
+    application_insights_connection_string = ""
+    try:
+        application_insights_connection_string = await ai_project.telemetry.get_connection_string()
+    except Exception as e:
+        e_string = str(e)
+        logger.error("Failed to get Application Insights connection string, error: %s", e_string)
+    if not application_insights_connection_string:
+        logger.error("Application Insights was not enabled for this project.")
+        logger.error("Enable it via the 'Tracing' tab in your AI Foundry project page.")
+        return
+
+    # The configuration probes the environment with blocking calls, so it runs in a thread.
+    from azure.monitor.opentelemetry import configure_azure_monitor
+    await asyncio.to_thread(configure_azure_monitor, connection_string=application_insights_connection_string)
+    app.state.application_insights_connection_string = application_insights_connection_string
+    logger.info("Configured Application Insights for tracing.")
+
+    # The completed runs are evaluated in the background with the bounded concurrency,
+    # or by the evaluator process if the durable queue is configured.
+    from .evaluation import EvaluationScheduler, SqliteEvaluationQueue, submit_evaluations
+    sampling_percent = float(os.getenv("EVALUATION_SAMPLING_PERCENT", "100"))
+    if os.getenv("EVALUATION_QUEUE_DB"):
+        evaluation_scheduler = SqliteEvaluationQueue(
+            os.environ["EVALUATION_QUEUE_DB"], sampling_percent=sampling_percent)
+    else:
+        evaluation_scheduler = EvaluationScheduler(
+            functools.partial(submit_evaluations, ai_project, application_insights_connection_string),
+            max_queue_size=int(os.getenv("EVALUATION_QUEUE_SIZE", "100")),
+            workers=int(os.getenv("EVALUATION_WORKERS", "2")),
+            batch_size=int(os.getenv("EVALUATION_BATCH_SIZE", "10")),
+            sampling_percent=sampling_percent)
+        evaluation_scheduler.start()
+    app.state.evaluation_scheduler = evaluation_scheduler
+
+
+async def warm_caches(ai_project: AIProjectClient) -> None:
+    """Fill the caches, which are not needed to serve the first request."""
+    try:
+        from .routes import warm_file_name_cache
+        await warm_file_name_cache(ai_project.agents)
+    except Exception as e:
+        logger.warning(f"Failed to warm the file name cache: {e}")
+
 @contextlib.asynccontextmanager
 async def lifespan(app: fastapi.FastAPI):
     agent = None
+    embeddings_client = None
+    session_cache = None
+    startup_tasks = []
 
     proj_endpoint = os.environ.get("AZURE_EXISTING_AIPROJECT_ENDPOINT")
     agent_id = os.environ.get("AZURE_EXISTING_AGENT_ID")
+    # One connection pool per worker, shared by the project, agents, evaluations and embeddings clients.
+    http_pool = HttpPool(
+        limit=int(os.getenv("HTTP_POOL_LIMIT", "100")),
+        limit_per_host=int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "0")),
+        keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60")),
+        dns_cache_ttl=int(os.getenv("HTTP_DNS_CACHE_TTL", "300")))
+    # The token is acquired before the first request and refreshed in the background; the workers
+    # can share it through the file, so only one of them acquires the token when it expires.
+    credential = CachingTokenCredential(
+        SharedTokenCredential(DefaultAzureCredential(exclude_shared_token_cache_credential=True)),
+        cache=FileTokenCache(os.environ["TOKEN_CACHE_FILE"]) if os.getenv("TOKEN_CACHE_FILE") else None,
+        refresh_margin=float(os.getenv("TOKEN_REFRESH_MARGIN", "600")))
     try:
+        # The refresh is started even if the token was not acquired, so it is retried in the background.
+        await credential.prewarm(PROJECT_SCOPE)
+        credential.start_refresh(PROJECT_SCOPE)
         ai_project = AIProjectClient(
-            credential=DefaultAzureCredential(exclude_shared_token_cache_credential=True),
+            credential=credential,
             endpoint=proj_endpoint,
-            api_version = "2025-05-15-preview" # Evaluations yet not supported on stable (api_version="2025-05-01")
+            api_version = "2025-05-15-preview", # Evaluations yet not supported on stable (api_version="2025-05-01")
+            transport=http_pool.transport()
         )
         logger.info("Created AIProjectClient")
 
-        if enable_trace:
-            application_insights_connection_string = ""
-            try:
-                application_insights_connection_string = await ai_project.telemetry.get_connection_string()
-            except Exception as e:
-                e_string = str(e)
-                logger.error("Failed to get Application Insights connection string, error: %s", e_string)
-            if not application_insights_connection_string:
-                logger.error("Application Insights was not enabled for this project.")
-                logger.error("Enable it via the 'Tracing' tab in your AI Foundry project page.")
-                exit()
-            else:
-                from azure.monitor.opentelemetry import configure_azure_monitor
-                configure_azure_monitor(connection_string=application_insights_connection_string)
-                app.state.application_insights_connection_string = application_insights_connection_string
-                logger.info("Configured Application Insights for tracing.")
-
-        if agent_id:
-            try: 
-                agent = await ai_project.agents.get_agent(agent_id)
-                logger.info("Agent already exists, skipping creation")
-                logger.info(f"Fetched agent, agent ID: {agent.id}")
-                logger.info(f"Fetched agent, model name: {agent.model}")
-            except Exception as e:
-                logger.error(f"Error fetching agent: {e}", exc_info=True)
-
-        if not agent:
-            # Fallback to searching by name
-            agent_name = os.environ["AZURE_AI_AGENT_NAME"]
-            agent_list = ai_project.agents.list_agents()
-            if agent_list:
-                async for agent_object in agent_list:
-                    if agent_object.name == agent_name:
-                        agent = agent_object
-                        logger.info(f"Found agent by name '{agent_name}', ID={agent_object.id}")
-                        break
+        # The gunicorn master resolves the agent in on_starting and shares it with the workers;
+        # otherwise the agent is fetched, and its ID is found in the agent cache by its name.
+        agent = get_shared_agent(agent_id)
+        if agent:
+            logger.info("Using the agent, resolved by the gunicorn master")
+        else:
+            agent = await resolve_agent(
+                ai_project.agents,
+                endpoint=proj_endpoint,
+                agent_name=os.environ.get("AZURE_AI_AGENT_NAME"),
+                agent_id=agent_id,
+                cache=get_agent_cache())
+        if agent:
+            logger.info(f"Fetched agent, agent ID: {agent.id}")
+            logger.info(f"Fetched agent, model name: {agent.model}")
 
         if not agent:
             raise RuntimeError("No agent found. Ensure qunicorn.py created one or set AZURE_EXISTING_AGENT_ID.")
 
+        local_search = os.getenv("AZURE_AI_SEARCH_BACKEND", "azure").lower() == "local"
+        response_cache = os.getenv("ENABLE_CHAT_RESPONSE_CACHE", "").lower() == "true"
+        if local_search or response_cache:
+            embeddings_client = ai_project.inference.get_embeddings_client(transport=http_pool.transport())
+            embed_model = os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME")
+            embed_dimensions = os.getenv("AZURE_AI_EMBED_DIMENSIONS")
+            embed_dimensions = int(embed_dimensions) if embed_dimensions else None
+
+        if local_search:
+            from .embeddings_store import get_local_embeddings_file, load_embeddings
+            from .local_search import LocalSearchIndex
+            from .shared_store import SHARED_STORE_ENV, read_shared_store, vectors_path
+            embeddings_file = get_local_embeddings_file()
+            # The store, created by the gunicorn master, is shared by the workers instead of a copy in each.
+            shared_store = os.getenv(SHARED_STORE_ENV)
+            if shared_store and os.path.isdir(shared_store):
+                embeddings = read_shared_store(shared_store)
+                logger.info(f"Attached to the shared embeddings store {shared_store}")
+            else:
+                shared_store = None
+                embeddings = load_embeddings(embeddings_file)
+            pq_subspaces = os.getenv("LOCAL_SEARCH_PQ_SUBSPACES")
+            ann_index = None
+            if os.getenv("LOCAL_SEARCH_ANN", "").lower() == "true":
+                from .ann_index import IVFIndex
+                ann_index = IVFIndex.load(embeddings_file)
+                if ann_index is None:
+                    logger.warning(f"No IVF index for {embeddings_file}, the local search is exact.")
+            quantization = os.getenv("LOCAL_SEARCH_QUANTIZATION") or None
+            quantized = None
+            if quantization:
+                from .quantization import load_quantization
+                # The codes are memory-mapped from the shared store, if the master built them, or from
+                # the files next to the embeddings file, if they were built offline.
+                if shared_store:
+                    quantized = load_quantization(vectors_path(shared_store), quantization)
+                if quantized is None:
+                    quantized = load_quantization(embeddings_file, quantization)
+                if quantized is None:
+                    logger.warning(f"No {quantization} codes for {embeddings_file}, they are built at startup.")
+            # The codes, which were not built offline or by the master, are built in a thread, so the event loop
+            # of the worker is not blocked by the quantization.
+            app.state.search_index = await asyncio.to_thread(
+                LocalSearchIndex,
+                embeddings.tokens,
+                embeddings.titles,
+                embeddings.vectors,
+                model=embed_model,
+                dimensions=embed_dimensions,
+                embedding_client=embeddings_client,
+                quantization=quantization,
+                rerank=int(os.getenv("LOCAL_SEARCH_RERANK", str(LocalSearchIndex.DEFAULT_RERANK))),
+                pq_subspaces=int(pq_subspaces) if pq_subspaces else None,
+                quantized=quantized,
+                ann_index=ann_index,
+                nprobe=int(os.getenv("LOCAL_SEARCH_NPROBE", "16")))
+            logger.info(
+                f"Loaded {len(app.state.search_index)} embeddings for the local search from {embeddings_file}, "
+                f"the first pass takes {app.state.search_index.nbytes / 2**20:.1f} MB")
+            # The agent searches the local index with the function tool, called by the agents
+            # client in this worker, instead of its Azure AI Search tool.
+            from .local_search import create_search_tool
+            app.state.search_tool = create_search_tool(app.state.search_index)
+            ai_project.agents.enable_auto_function_calls(app.state.search_tool)
+
+        if response_cache:
+            from .response_cache import SemanticResponseCache
+            app.state.response_cache = SemanticResponseCache(
+                embedding_client=embeddings_client,
+                model=embed_model,
+                dimensions=embed_dimensions,
+                threshold=float(os.getenv("CHAT_RESPONSE_CACHE_THRESHOLD", "0.95")),
+                max_size=int(os.getenv("CHAT_RESPONSE_CACHE_SIZE", "256")),
+                ttl=float(os.getenv("CHAT_RESPONSE_CACHE_TTL", "3600")))
+            logger.info("Enabled the semantic response cache for chat.")
+
+        # The threads, known to exist, are not retrieved on every request. If SESSION_CACHE_DB
+        # is set, the threads, seen by one worker, are shared with the others through SQLite.
+        from .session_cache import SessionCache, SqliteSessionStore
+        session_ttl = float(os.getenv("SESSION_CACHE_TTL", "600"))
+        session_db = os.getenv("SESSION_CACHE_DB")
+        session_cache = SessionCache(
+            max_size=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+            ttl=session_ttl,
+            store=SqliteSessionStore(session_db, ttl=session_ttl) if session_db else None)
+        app.state.session_cache = session_cache
+
+        # The tracing and the caches are not needed to serve the first request, by default the worker
+        # starts serving while they are being set up.
+        startup = [warm_caches(ai_project)]
+        if enable_trace:
+            startup.append(configure_tracing(app, ai_project))
+        if os.getenv("DEFER_STARTUP_TASKS", "true").lower() == "true":
+            startup_tasks = [asyncio.create_task(coroutine) for coroutine in startup]
+        else:
+            await asyncio.gather(*startup)
+
         app.state.ai_project = ai_project
+        app.state.agent_client = ai_project.agents
         app.state.agent = agent
+        app.state.http_pool = http_pool
         
         yield
 
@@ -82,11 +250,25 @@ async def lifespan(app: fastapi.FastAPI):
         raise RuntimeError(f"Error during startup: {e}")
 
     finally:
+        for task in startup_tasks:
+            task.cancel()
+        await asyncio.gather(*startup_tasks, return_exceptions=True)
+        evaluation_scheduler = getattr(app.state, "evaluation_scheduler", None)
+        if evaluation_scheduler is not None:
+            await evaluation_scheduler.close(timeout=float(os.getenv("EVALUATION_DRAIN_TIMEOUT", "30")))
+        if session_cache is not None:
+            session_cache.close()
+        if embeddings_client is not None:
+            await embeddings_client.close()
         try:
             await ai_project.close()
             logger.info("Closed AIProjectClient")
         except Exception as e:
             logger.error("Error closing AIProjectClient", exc_info=True)
+        logger.info(f"HTTP connection pool: {http_pool.stats}")
+        await http_pool.close()
+        await credential.stop()
+        logger.info(f"Token cache: {credential.stats}")
 
 
 def create_app():
@@ -105,9 +287,8 @@ def create_app():
         enable_trace = str(enable_trace_string).lower() == "true"
     if enable_trace:
         logger.info("Tracing is enabled.")
-        try:
-            from azure.monitor.opentelemetry import configure_azure_monitor
-        except ModuleNotFoundError:
+        # Check that the package is installed without importing it, it is imported when tracing is configured.
+        if importlib.util.find_spec("azure.monitor.opentelemetry") is None:
             logger.error("Required libraries for tracing not installed.")
             logger.error("Please make sure azure-monitor-opentelemetry is installed.")
             exit()
@@ -126,6 +307,13 @@ def create_app():
     from . import routes  # Import routes
     app.include_router(routes.router)
 
+    # The worker serves many streams in its event loop, over the limit the chat is rejected with 503.
+    app.state.stream_limiter = StreamLimiter(int(os.getenv("MAX_CONCURRENT_STREAMS", "0")))
+    app.add_middleware(
+        StreamLimitMiddleware,
+        limiter=app.state.stream_limiter,
+        retry_after=int(os.getenv("STREAM_RETRY_AFTER", "1")))
+
     # Global exception handler for any unhandled exceptions
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
@@ -0,0 +1,91 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+The state, prepared by the gunicorn master in on_starting and inherited by the forked workers.
+
+The master has already resolved the agent and acquired the token for the project, so the workers
+start serving without fetching the agent again and without acquiring their own first token.
+The state is kept in the memory of this module, which the master imports before forking;
+a worker, started without the master, finds it empty and falls back to the remote calls.
+"""
+from typing import Any, Dict, Optional
+
+import logging
+import time
+
+from azure.ai.agents.models import Agent
+from azure.core.credentials import AccessToken
+
+logger = logging.getLogger("azureaiapp")
+
+# The scope of the project and agents clients.
+PROJECT_SCOPE = "https://ai.azure.com/.default"
+# The shared token is not used if it expires within this time in seconds.
+TOKEN_EXPIRY_MARGIN = 300
+
+_agent: Optional[Dict[str, Any]] = None
+_tokens: Dict[str, AccessToken] = {}
+
+
+def share_agent(agent: Agent) -> None:
+    """
+    Keep the definition of the resolved agent for the workers.
+
+    :param agent: The agent.
+    """
+    global _agent
+    _agent = agent.as_dict()
+
+
+def get_shared_agent(agent_id: Optional[str]) -> Optional[Agent]:
+    """
+    Return the agent, resolved by the master.
+
+    :param agent_id: The ID of the expected agent.
+    :return: The copy of the agent or None if the master did not resolve the agent with this ID.
+    """
+    if _agent is None or _agent.get('id') != agent_id:
+        return None
+    return Agent(_agent)
+
+
+def share_token(scope: str, token: AccessToken) -> None:
+    """
+    Keep the token for the workers.
+
+    :param scope: The scope of the token.
+    :param token: The token.
+    """
+    _tokens[scope] = token
+
+
+class SharedTokenCredential:
+    """
+    The credential, which returns the token acquired by the master until it is about to expire.
+
+    The client caches the token after the first request, so only the first token of the worker
+    comes from the master; the refreshed tokens are acquired by the wrapped credential.
+
+    :param credential: The synchronous credential, acquiring the tokens not shared by the master.
+    """
+
+    def __init__(self, credential: Any) -> None:
+        """Constructor."""
+        self.credential = credential
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        """
+        Return the token for the scope.
+
+        :param scopes: The scopes of the token.
+        :return: The shared token if it is valid, otherwise the token of the wrapped credential.
+        """
+        token = _tokens.get(scopes[0]) if len(scopes) == 1 and not kwargs.get('claims') else None
+        if token is not None and token.expires_on - TOKEN_EXPIRY_MARGIN > time.time():
+            return token
+        return self.credential.get_token(*scopes, **kwargs)
+
+    def close(self) -> None:
+        """Close the wrapped credential."""
+        self.credential.close()
@@ -0,0 +1,354 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from .embeddings_store import fingerprint, load_embeddings, matches_fingerprint, normalize
+
+logger = logging.getLogger("azureaiapp")
+
+# The rows are processed in blocks, so the float32 temporaries do not grow with the number of embeddings.
+BLOCK_ROWS = 16384
+
+INT8 = 'int8'
+PQ = 'pq'
+
+
+def quantization_path(embeddings_file: str, kind: str, part: str) -> str:
+    """Return the path of the part of the quantization, built for the embeddings file."""
+    return f"{os.path.splitext(embeddings_file)[0]}.{kind}_{part}.npy"
+
+
+def _blocks(rows: int) -> Iterator[slice]:
+    for start in range(0, rows, BLOCK_ROWS):
+        yield slice(start, min(start + BLOCK_ROWS, rows))
+
+
+def sample_rows(vectors: np.ndarray, sample_size: int, seed: int) -> np.ndarray:
+    """Return the float32 copy of at most sample_size random rows in their order in the matrix."""
+    if len(vectors) <= sample_size:
+        return np.array(vectors, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False))
+    return np.array(vectors[rows], dtype=np.float32)
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Find the centroids of the points with Lloyd's algorithm.
+
+    :param points: The float32 matrix of the points.
+    :param k: The number of centroids, at most the number of points.
+    :param iterations: The number of iterations.
+    :param rng: The generator of the initial centroids, chosen from the points.
+    :return: The float32 matrix of the centroids.
+    """
+    k = min(k, len(points))
+    if k == 0:
+        return np.zeros((1, points.shape[1]), dtype=np.float32)
+    centroids = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(points, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack(
+            [np.bincount(assignment, weights=points[:, d], minlength=k) for d in range(points.shape[1])], axis=1)
+        # The empty clusters keep their centroids.
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def nearest_centroids(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Return the index of the nearest centroid of each point by the Euclidean distance."""
+    distances = (centroids ** 2).sum(axis=1) - 2 * points @ centroids.T
+    return distances.argmin(axis=1)
+
+
+class ScalarQuantizer:
+    """
+    The int8 scalar quantizer.
+
+    Each dimension is mapped linearly from its range over the embeddings to 256 levels, so the codes
+    take a quarter of the float32 matrix. The dot product with the query is computed from the codes
+    directly as codes @ (scale * query) plus the constant term of the offsets.
+    """
+
+    PARTS = ('offset', 'scale')
+
+    def __init__(self) -> None:
+        """Constructor."""
+        self.offset: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def fit(self, vectors: np.ndarray) -> 'ScalarQuantizer':
+        """
+        Find the range of each dimension.
+
+        :param vectors: The float32 matrix, it may be memory-mapped.
+        :return: The fitted quantizer.
+        """
+        low = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+        high = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+        for block in _blocks(len(vectors)):
+            low = np.minimum(low, vectors[block].min(axis=0))
+            high = np.maximum(high, vectors[block].max(axis=0))
+        if not len(vectors):
+            low = high = np.zeros(vectors.shape[1], dtype=np.float32)
+        self.offset = low
+        self.scale = np.maximum((high - low) / 255, np.finfo(np.float32).tiny).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Quantize the vectors.
+
+        :param vectors: The float32 matrix.
+        :return: The int8 matrix of the same shape.
+        """
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for block in _blocks(len(vectors)):
+            levels = np.rint((vectors[block] - self.offset) / self.scale)
+            codes[block] = np.clip(levels, 0, 255) - 128
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate the dot products of the quantized vectors with the query.
+
+        :param codes: The codes, returned by encode.
+        :param query: The float32 query vector.
+        :return: The float32 scores, one per row.
+        """
+        weights = (self.scale * query).astype(np.float32)
+        constant = float((128 * self.scale + self.offset) @ query)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for block in _blocks(len(codes)):
+            scores[block] = codes[block].astype(np.float32) @ weights
+        return scores + constant
+
+    @staticmethod
+    def rows(codes: np.ndarray) -> int:
+        """The number of the vectors, encoded by the codes."""
+        return len(codes)
+
+    def parameters(self) -> Dict[str, np.ndarray]:
+        """The arrays of the fitted quantizer, by part."""
+        return {'offset': self.offset, 'scale': self.scale}
+
+    @classmethod
+    def from_parameters(cls, parameters: Dict[str, np.ndarray]) -> 'ScalarQuantizer':
+        """Restore the quantizer from the arrays, returned by parameters."""
+        quantizer = cls()
+        quantizer.offset = parameters['offset']
+        quantizer.scale = parameters['scale']
+        return quantizer
+
+    @property
+    def nbytes(self) -> int:
+        """The memory of the quantizer parameters."""
+        return self.offset.nbytes + self.scale.nbytes
+
+
+class ProductQuantizer:
+    """
+    The product quantizer.
+
+    The dimensions are split into subspaces and the part of each vector in a subspace is replaced by
+    the nearest of at most 256 centroids, found by k-means on the sample of the embeddings, so a vector
+    takes one byte per subspace. The dot product with the query is the sum of the dot products of
+    the query parts with the centroids, which are computed once per query and looked up by the codes.
+
+    :param subspaces: The number of subspaces, at most the number of dimensions.
+    :param centroids: The number of centroids in each subspace, at most 256.
+    :param iterations: The number of k-means iterations.
+    :param sample_size: The maximal number of the embeddings used to train the centroids.
+    :param seed: The seed of the sample and the initial centroids.
+    """
+
+    PARTS = ('bounds', 'codebooks')
+
+    def __init__(
+            self,
+            subspaces: int,
+            centroids: int = 256,
+            iterations: int = 10,
+            sample_size: int = 16384,
+            seed: int = 0
+        ) -> None:
+        """Constructor."""
+        if not 1 <= centroids <= 256:
+            raise ValueError("The number of centroids must be from 1 to 256.")
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.bounds: List[int] = []
+        self.codebooks: List[np.ndarray] = []
+
+    def fit(self, vectors: np.ndarray) -> 'ProductQuantizer':
+        """
+        Train the centroids of every subspace.
+
+        :param vectors: The float32 matrix, it may be memory-mapped.
+        :return: The fitted quantizer.
+        """
+        dimensions = vectors.shape[1]
+        if not 1 <= self.subspaces <= dimensions:
+            raise ValueError(f"The number of subspaces must be from 1 to {dimensions}.")
+        self.bounds = [int(b) for b in np.linspace(0, dimensions, self.subspaces + 1)]
+        sample = sample_rows(vectors, self.sample_size, self.seed)
+        rng = np.random.default_rng(self.seed)
+        self.codebooks = [
+            kmeans(sample[:, start:end], self.centroids, self.iterations, rng)
+            for start, end in zip(self.bounds, self.bounds[1:])]
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Quantize the vectors.
+
+        :param vectors: The float32 matrix.
+        :return: The uint8 matrix with one row per subspace and one column per vector, so the codes
+                 of a subspace are contiguous.
+        """
+        codes = np.empty((self.subspaces, len(vectors)), dtype=np.uint8)
+        for block in _blocks(len(vectors)):
+            rows = np.asarray(vectors[block], dtype=np.float32)
+            for i, (start, end) in enumerate(zip(self.bounds, self.bounds[1:])):
+                codes[i, block] = nearest_centroids(rows[:, start:end], self.codebooks[i])
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate the dot products of the quantized vectors with the query.
+
+        :param codes: The codes, returned by encode.
+        :param query: The float32 query vector.
+        :return: The float32 scores, one per row.
+        """
+        scores = np.zeros(codes.shape[1], dtype=np.float32)
+        for i, (start, end) in enumerate(zip(self.bounds, self.bounds[1:])):
+            scores += (self.codebooks[i] @ query[start:end]).take(codes[i])
+        return scores
+
+    @staticmethod
+    def rows(codes: np.ndarray) -> int:
+        """The number of the vectors, encoded by the codes."""
+        return codes.shape[1]
+
+    def parameters(self) -> Dict[str, np.ndarray]:
+        """The arrays of the fitted quantizer, by part."""
+        # All the codebooks have the same number of centroids, so they are stored side by side.
+        return {'bounds': np.array(self.bounds, dtype=np.int64), 'codebooks': np.concatenate(self.codebooks, axis=1)}
+
+    @classmethod
+    def from_parameters(cls, parameters: Dict[str, np.ndarray]) -> 'ProductQuantizer':
+        """Restore the quantizer from the arrays, returned by parameters."""
+        bounds = [int(b) for b in parameters['bounds']]
+        codebooks = parameters['codebooks']
+        quantizer = cls(len(bounds) - 1, len(codebooks))
+        quantizer.bounds = bounds
+        quantizer.codebooks = [
+            np.ascontiguousarray(codebooks[:, start:end]) for start, end in zip(bounds, bounds[1:])]
+        return quantizer
+
+    @property
+    def nbytes(self) -> int:
+        """The memory of the codebooks."""
+        return sum(codebook.nbytes for codebook in self.codebooks)
+
+
+def create_quantizer(kind: str, dimensions: int, subspaces: Optional[int] = None):
+    """
+    Create the quantizer of the given kind.
+
+    :param kind: 'int8' or 'pq'.
+    :param dimensions: The number of dimensions of the embeddings.
+    :param subspaces: The number of the subspaces of the product quantizer,
+                      a quarter of the dimensions by default.
+    :return: The quantizer, which is not fitted yet.
+    :raises: ValueError if the kind is unknown.
+    """
+    if kind == INT8:
+        return ScalarQuantizer()
+    if kind == PQ:
+        return ProductQuantizer(subspaces or max(1, dimensions // 4))
+    raise ValueError(f"Unknown quantization {kind}, expected {INT8} or {PQ}.")
+
+
+def build_quantization(vectors: np.ndarray, kind: str, subspaces: Optional[int] = None) -> Tuple[Any, np.ndarray]:
+    """
+    Fit the quantizer of the given kind and encode the vectors.
+
+    :param vectors: The normalized float32 matrix, it may be memory-mapped.
+    :param kind: 'int8' or 'pq'.
+    :param subspaces: The number of the subspaces of the product quantizer.
+    :return: The fitted quantizer and the codes.
+    """
+    quantizer = create_quantizer(kind, vectors.shape[1], subspaces).fit(vectors)
+    return quantizer, quantizer.encode(vectors)
+
+
+def save_quantization(embeddings_file: str, kind: str, quantizer: Any, codes: np.ndarray) -> None:
+    """
+    Write the quantizer parameters and the codes next to the embeddings file with its fingerprint.
+
+    :param embeddings_file: The embeddings file, the codes were built for.
+    :param kind: 'int8' or 'pq'.
+    :param quantizer: The fitted quantizer.
+    :param codes: The codes of the embeddings.
+    """
+    for part, array in dict(quantizer.parameters(), codes=codes, fingerprint=fingerprint(embeddings_file)).items():
+        np.save(quantization_path(embeddings_file, kind, part), array)
+
+
+def load_quantization(embeddings_file: str, kind: str, mmap: bool = True) -> Optional[Tuple[Any, np.ndarray]]:
+    """
+    Load the quantizer and the codes, built for the embeddings file.
+
+    :param embeddings_file: The embeddings file.
+    :param kind: 'int8' or 'pq'.
+    :param mmap: If True, the codes are memory-mapped read only.
+    :return: The quantizer and the codes or None, if they were not built or were built for another
+             version of the embeddings file.
+    :raises: ValueError if the kind is unknown.
+    """
+    quantizer_class = type(create_quantizer(kind, 1))
+    paths = {part: quantization_path(embeddings_file, kind, part) for part in quantizer_class.PARTS + ('codes',)}
+    if not all(os.path.isfile(path) for path in paths.values()):
+        return None
+    if not matches_fingerprint(quantization_path(embeddings_file, kind, 'fingerprint'), embeddings_file):
+        logger.warning(f"The {kind} codes were built for another version of {embeddings_file}, rebuild them.")
+        return None
+    codes = np.load(paths.pop('codes'), mmap_mode='r' if mmap else None)
+    return quantizer_class.from_parameters({part: np.load(path) for part, path in paths.items()}), codes
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Build the quantization codes for the embeddings file, given in the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m api.quantization", description="Build the quantization codes next to the embeddings file.")
+    parser.add_argument("embeddings_file", help="The .npy or .csv embeddings file.")
+    parser.add_argument("--kind", choices=(INT8, PQ), required=True, help="The quantization.")
+    parser.add_argument(
+        "--subspaces", type=int, default=None,
+        help="The number of the product quantization subspaces, a quarter of the dimensions by default.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    vectors = normalize(np.array(load_embeddings(args.embeddings_file).vectors, dtype=np.float32))
+    quantizer, codes = build_quantization(vectors, args.kind, args.subspaces)
+    save_quantization(args.embeddings_file, args.kind, quantizer, codes)
+    print(f"Built the {args.kind} codes of {len(vectors)} rows in {time.perf_counter() - start:.1f} seconds: "
+          f"{quantization_path(args.embeddings_file, args.kind, '*')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Callable, Dict, List, Optional
+
+import time
+
+import numpy as np
+
+
+class SemanticResponseCache:
+    """
+    The cache of the agent answers, looked up by the embedding similarity of the questions.
+
+    The embeddings of the cached questions are kept in one normalized float32 matrix, so the
+    lookup is a single matrix-vector product. The answer is returned if the cosine similarity
+    of the questions is at least the threshold. The cache holds at most max_size answers,
+    evicting the least recently used one, and it is cleared when the agent changes.
+
+    :param embedding_client: The embedding client, used to embed the questions.
+    :param model: The embedding model.
+    :param dimensions: The number of dimensions in the embedding. Set this parameter only if
+                       embedding model accepts dimensions parameter.
+    :param threshold: The minimal cosine similarity of the questions to reuse the answer.
+    :param max_size: The maximal number of cached answers.
+    :param ttl: The time to live of an answer in seconds.
+    :param timer: The monotonic clock, used to expire answers.
+    """
+
+    def __init__(
+            self,
+            embedding_client: Any,
+            model: str,
+            dimensions: Optional[int] = None,
+            threshold: float = 0.95,
+            max_size: int = 256,
+            ttl: float = 3600.0,
+            timer: Callable[[], float] = time.monotonic
+        ) -> None:
+        """Constructor."""
+        if max_size <= 0:
+            raise ValueError("max_size must be positive.")
+        self._embedding_client = embedding_client
+        self._embedding_model = model
+        self._dimensions = dimensions
+        self._threshold = threshold
+        self._max_size = max_size
+        self._ttl = ttl
+        self._timer = timer
+        self._agent_id = None
+        # The matrix is allocated on the first answer, when the embedding size is known.
+        self._vectors: Optional[np.ndarray] = None
+        self._responses: List[Optional[Dict[str, Any]]] = [None] * max_size
+        self._expires = np.full(max_size, -np.inf)
+        self._last_used = np.zeros(max_size, dtype=np.int64)
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def embed(self, message: str) -> np.ndarray:
+        """
+        Build the normalized embedding of the question.
+
+        :param message: The user question.
+        :return: The embedding vector.
+        """
+        response = await self._embedding_client.embed(
+            input=[message],
+            dimensions=self._dimensions,
+            model=self._embedding_model
+        )
+        vector = np.array(response["data"][0]["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_agent(self, agent_id: str) -> None:
+        """Drop the answers of the previous agent."""
+        if agent_id != self._agent_id:
+            self.clear()
+            self._agent_id = agent_id
+
+    def get(self, vector: np.ndarray, agent_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the answer to the most similar question.
+
+        :param vector: The embedding of the question, returned by embed.
+        :param agent_id: The ID of the agent, answering the question.
+        :return: The cached completed message with content and annotations, None if there is no similar question.
+        """
+        self._check_agent(agent_id)
+        if self._vectors is not None:
+            scores = self._vectors @ vector
+            scores[self._expires <= self._timer()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] >= self._threshold:
+                self.hits += 1
+                self._tick += 1
+                self._last_used[best] = self._tick
+                return self._responses[best]
+        self.misses += 1
+        return None
+
+    def set(self, vector: np.ndarray, agent_id: str, response: Dict[str, Any]) -> None:
+        """
+        Cache the answer, evicting the least recently used one if the cache is full.
+
+        :param vector: The embedding of the question, returned by embed.
+        :param agent_id: The ID of the agent, which has answered the question.
+        :param response: The completed message with content and annotations.
+        """
+        self._check_agent(agent_id)
+        if self._vectors is None:
+            self._vectors = np.zeros((self._max_size, vector.shape[0]), dtype=np.float32)
+        free = np.flatnonzero(self._expires <= self._timer())
+        if len(free):
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self._last_used))
+            self.evictions += 1
+        self._vectors[slot] = vector
+        self._responses[slot] = response
+        self._expires[slot] = self._timer() + self._ttl
+        self._tick += 1
+        self._last_used[slot] = self._tick
+
+    def clear(self) -> None:
+        """Remove all the answers, the counters are kept."""
+        self._responses = [None] * self._max_size
+        self._expires[:] = -np.inf
+        self._last_used[:] = 0
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires > self._timer()))
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """The hit rate and the eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
@@ -2,12 +2,11 @@
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
 import asyncio
-import json
 import os
-from typing import AsyncGenerator, Optional, Dict
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterator, Iterable, List, Optional, Dict, Tuple
 
 import fastapi
-from fastapi import Request, Depends, HTTPException
+from fastapi import Request, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse
@@ -16,21 +15,31 @@ import logging
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
 
 from azure.ai.agents.aio import AgentsClient
+from azure.core.exceptions import ResourceNotFoundError
 from azure.ai.agents.models import (
     Agent,
     MessageDeltaChunk,
     ThreadMessage,
     ThreadRun,
     AsyncAgentEventHandler,
+    AsyncFunctionTool,
+    FilePurpose,
+    ListSortOrder,
     RunStep
 )
 from azure.ai.projects import AIProjectClient
-from azure.ai.projects.models import (
-   AgentEvaluationRequest,
-   AgentEvaluationSamplingConfiguration,
-   AgentEvaluationRedactionConfiguration,
-   EvaluatorIds
-)
+
+from .cache import TTLCache
+from .sse import CoalescingStats, coalesce_deltas, serialize_message_delta, serialize_sse_event
+
+# The caches and the evaluations are imported by the lifespan, which sets them up only if they are
+# enabled, so the routes do not import numpy and the evaluation models on every worker start.
+if TYPE_CHECKING:
+    import numpy as np
+
+    from .evaluation import EvaluationScheduler
+    from .response_cache import SemanticResponseCache
+    from .session_cache import SessionCache
 
 
 # Create a logger for this module
@@ -94,17 +103,56 @@ def get_app_insights_conn_str(request: Request) -> str:
     else:
         return None
 
-def serialize_sse_event(data: Dict) -> str:
-    return f"data: {json.dumps(data)}\n\n"
+def get_response_cache(request: Request) -> Optional["SemanticResponseCache"]:
+    return getattr(request.app.state, "response_cache", None)
+
+def get_evaluation_scheduler(request: Request) -> Optional["EvaluationScheduler"]:
+    return getattr(request.app.state, "evaluation_scheduler", None)
+
+def get_session_cache(request: Request) -> Optional["SessionCache"]:
+    return getattr(request.app.state, "session_cache", None)
+
+def get_search_tool(request: Request) -> Optional[AsyncFunctionTool]:
+    return getattr(request.app.state, "search_tool", None)
+
+# The names of the cited files, shared by all the requests in the worker process.
+file_name_cache = TTLCache(
+    max_size=int(os.getenv("FILE_NAME_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("FILE_NAME_CACHE_TTL", "3600"))
+)
+
+async def warm_file_name_cache(agent_client: AgentsClient) -> None:
+    """Fill the file name cache with the files, uploaded for the agent."""
+    files = await agent_client.files.list(purpose=FilePurpose.AGENTS)
+    for file_info in files.data:
+        file_name_cache.set(file_info.id, file_info.filename)
+    logger.info(f"Cached names of {len(files.data)} files")
+
+async def get_file_names(agent_client: AgentsClient, file_ids: Iterable[str]) -> Dict[str, str]:
+    """Get the file names from the cache and fetch the missing ones concurrently."""
+    file_names = {}
+    missing = []
+    for file_id in file_ids:
+        file_name = file_name_cache.get(file_id)
+        if file_name is None:
+            missing.append(file_id)
+        else:
+            file_names[file_id] = file_name
+    if missing:
+        logger.info(f"Fetching files with IDs for annotations {missing}")
+        for file_info in await asyncio.gather(*(agent_client.files.get(file_id) for file_id in missing)):
+            file_name_cache.set(file_info.id, file_info.filename)
+            file_names[file_info.id] = file_info.filename
+    return file_names
 
 async def get_message_and_annotations(agent_client : AgentsClient, message: ThreadMessage) -> Dict:
     annotations = []
     # Get file annotations for the file search.
-    for annotation in (a.as_dict() for a in message.file_citation_annotations):
-        file_id = annotation["file_citation"]["file_id"]
-        logger.info(f"Fetching file with ID for annotation {file_id}")
-        openai_file = await agent_client.files.get(file_id)
-        annotation["file_name"] = openai_file.filename
+    file_annotations = [a.as_dict() for a in message.file_citation_annotations]
+    file_names = await get_file_names(
+        agent_client, dict.fromkeys(a["file_citation"]["file_id"] for a in file_annotations))
+    for annotation in file_annotations:
+        annotation["file_name"] = file_names[annotation["file_citation"]["file_id"]]
         logger.info(f"File name for annotation: {annotation['file_name']}")
         annotations.append(annotation)
 
@@ -120,16 +168,133 @@ async def get_message_and_annotations(agent_client : AgentsClient, message: Thre
         'annotations': annotations
     }
 
+async def get_or_create_thread(
+    agent_client: AgentsClient,
+    thread_id: Optional[str],
+    agent_id: Optional[str],
+    agent: Agent,
+    session_cache: Optional["SessionCache"] = None
+) -> str:
+    """
+    Return the ID of the thread from the cookies if it exists, otherwise create a new thread.
+
+    The thread is retrieved only if the session cache has not seen it yet.
+
+    :param agent_client: The agents client.
+    :param thread_id: The ID of the thread from the cookies.
+    :param agent_id: The ID of the agent from the cookies.
+    :param agent: The agent, serving the requests.
+    :param session_cache: The cache of the known threads.
+    :return: The ID of the thread.
+    """
+    if thread_id and agent_id == agent.id:
+        if session_cache is not None:
+            session = await session_cache.get(thread_id)
+            if session is not None and session['agent_id'] == agent.id:
+                logger.info(f"Found thread with ID {thread_id} in the session cache")
+                return thread_id
+        logger.info(f"Retrieving thread with ID {thread_id}")
+        thread = await agent_client.threads.get(thread_id)
+    else:
+        logger.info("Creating a new thread")
+        thread = await agent_client.threads.create()
+    if session_cache is not None:
+        await session_cache.set(thread.id, {'agent_id': agent.id})
+    return thread.id
+
+# The maximal number of messages in one page of /chat/history, the service allows at most 100.
+CHAT_HISTORY_MAX_PAGE_SIZE = 100
+
+async def is_first_question(agent_client: AgentsClient, thread_id: str) -> bool:
+    """
+    Check that the thread has no messages before the last user message.
+
+    The answer to the follow-up question depends on the conversation, so it is neither looked up in
+    the response cache nor cached.
+
+    :param agent_client: The agents client.
+    :param thread_id: The ID of the thread, which has the user message.
+    :return: True if the user message is the only message of the thread.
+    """
+    count = 0
+    async for _ in agent_client.messages.list(thread_id=thread_id, limit=2, order=ListSortOrder.DESCENDING):
+        count += 1
+        if count > 1:
+            return False
+    return True
+
+
+async def get_history_page(
+    agent_client: AgentsClient,
+    thread_id: str,
+    limit: int,
+    before: Optional[str] = None
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Get one page of the thread messages, the newest first.
+
+    Only the requested window is fetched from the service. The file names for all the
+    citations in the page are fetched together, then the messages are formatted concurrently.
+
+    :param agent_client: The agents client.
+    :param thread_id: The ID of the thread.
+    :param limit: The maximal number of messages in the page.
+    :param before: The ID of the message; only the messages, older than it, are returned.
+    :return: The formatted messages and the cursor for the next page, None if it is the last page.
+    """
+    pages = agent_client.messages.list(
+        thread_id=thread_id,
+        limit=limit,
+        order=ListSortOrder.DESCENDING
+    ).by_page(continuation_token=before)
+    messages = []
+    async for page in pages:
+        messages = [message async for message in page]
+        break
+
+    await get_file_names(agent_client, dict.fromkeys(
+        annotation.as_dict()["file_citation"]["file_id"]
+        for message in messages for annotation in message.file_citation_annotations))
+    content = await asyncio.gather(*(get_message_and_annotations(agent_client, message) for message in messages))
+    for formatted_message, message in zip(content, messages):
+        formatted_message['role'] = message.role
+        formatted_message['created_at'] = message.created_at.astimezone().strftime("%m/%d/%y, %I:%M %p")
+    next_before = messages[-1].id if len(messages) == limit else None
+    return list(content), next_before
+
+async def get_history(agent_client: AgentsClient, thread_id: str) -> List[Dict]:
+    """
+    Get all the thread messages, the newest first.
+
+    The thread is read in the pages of the maximal size, each formatted as by get_history_page.
+
+    :param agent_client: The agents client.
+    :param thread_id: The ID of the thread.
+    :return: The formatted messages.
+    """
+    content, before = await get_history_page(agent_client, thread_id, CHAT_HISTORY_MAX_PAGE_SIZE)
+    while before:
+        page, before = await get_history_page(agent_client, thread_id, CHAT_HISTORY_MAX_PAGE_SIZE, before)
+        content.extend(page)
+    return content
+
 class MyEventHandler(AsyncAgentEventHandler[str]):
-    def __init__(self, ai_project: AIProjectClient, app_insights_conn_str: str):
+    def __init__(
+            self,
+            ai_project: AIProjectClient,
+            app_insights_conn_str: str,
+            evaluation_scheduler: Optional["EvaluationScheduler"] = None):
         super().__init__()
         self.agent_client = ai_project.agents
         self.ai_project = ai_project
         self.app_insights_conn_str = app_insights_conn_str
+        self.evaluation_scheduler = evaluation_scheduler
+        self.completed_message = None
+        self.run_status = None
 
     async def on_message_delta(self, delta: MessageDeltaChunk) -> Optional[str]:
-        stream_data = {'content': delta.text, 'type': "message"}
-        return serialize_sse_event(stream_data)
+        # The hottest path of the stream, the event is encoded without building the dictionary.
+        return serialize_message_delta(delta.text)
 
     async def on_thread_message(self, message: ThreadMessage) -> Optional[str]:
         try:
@@ -140,6 +305,7 @@ class MyEventHandler(AsyncAgentEventHandler[str]):
             logger.info("MyEventHandler: Received completed message")
 
             stream_data = await get_message_and_annotations(self.agent_client, message)
+            self.completed_message = dict(stream_data)
             stream_data['type'] = "completed_message"
             return serialize_sse_event(stream_data)
         except Exception as e:
@@ -148,13 +314,14 @@ class MyEventHandler(AsyncAgentEventHandler[str]):
 
     async def on_thread_run(self, run: ThreadRun) -> Optional[str]:
         logger.info("MyEventHandler: on_thread_run event received")
+        self.run_status = run.status
         run_information = f"ThreadRun status: {run.status}, thread ID: {run.thread_id}"
         stream_data = {'content': run_information, 'type': 'thread_run'}
         if run.status == "failed":
             stream_data['error'] = run.last_error.as_dict()
         # automatically run agent evaluation when the run is completed
-        if run.status == "completed":
-            run_agent_evaluation(run.thread_id, run.id, self.ai_project, self.app_insights_conn_str)
+        if run.status == "completed" and self.evaluation_scheduler is not None:
+            self.evaluation_scheduler.schedule(run.thread_id, run.id)
         return serialize_sse_event(stream_data)
 
     async def on_error(self, data: str) -> Optional[str]:
@@ -179,6 +346,9 @@ class MyEventHandler(AsyncAgentEventHandler[str]):
                 if azure_ai_search_details:
                     logger.info(f"azure_ai_search input: {azure_ai_search_details.get('input')}")
                     logger.info(f"azure_ai_search output: {azure_ai_search_details.get('output')}")
+                function_details = call.get("function", {})
+                if function_details:
+                    logger.info(f"function {function_details.get('name')} input: {function_details.get('arguments')}")
         return None
 
 @router.get("/", response_class=HTMLResponse)
@@ -191,43 +361,99 @@ async def index(request: Request, _ = auth_dependency):
     )
 
 
+# If the window is set, the message deltas, arriving within it, are sent as one event.
+STREAM_COALESCE_WINDOW = float(os.getenv("CHAT_STREAM_COALESCE_WINDOW_MS", "0")) / 1000
+STREAM_COALESCE_MAX_BYTES = int(os.getenv("CHAT_STREAM_COALESCE_MAX_BYTES", "1024"))
+
+async def stream_events(stream: AsyncIterator) -> AsyncGenerator[Tuple[Optional[str], str], None]:
+    """Yield the delta text, None for other events, and the serialized event for each event with data."""
+    # The events are logged only at the debug level, checked once per stream.
+    debug = logger.isEnabledFor(logging.DEBUG)
+    async for event in stream:
+        _, event_data, event_func_return_val = event
+        if debug:
+            logger.debug("Received event: %s", event)
+        if event_func_return_val:
+            if debug:
+                logger.debug("Yielding event: %s", event_func_return_val)
+            yield (event_data.text if isinstance(event_data, MessageDeltaChunk) else None), event_func_return_val
+        elif debug:
+            logger.debug("Event received but no data to yield")
+
 async def get_result(
     request: Request, 
     thread_id: str, 
     agent_id: str, 
     ai_project: AIProjectClient,
     app_insight_conn_str: Optional[str], 
-    carrier: Dict[str, str]
+    carrier: Dict[str, str],
+    response_cache: Optional["SemanticResponseCache"] = None,
+    question_vector: Optional["np.ndarray"] = None,
+    evaluation_scheduler: Optional["EvaluationScheduler"] = None,
+    search_tool: Optional[AsyncFunctionTool] = None
 ) -> AsyncGenerator[str, None]:
     ctx = TraceContextTextMapPropagator().extract(carrier=carrier)
     with tracer.start_as_current_span('get_result', context=ctx):
         logger.info(f"get_result invoked for thread_id={thread_id} and agent_id={agent_id}")
         try:
             agent_client = ai_project.agents
+            event_handler = MyEventHandler(ai_project, app_insight_conn_str, evaluation_scheduler)
+            # With the local search, the run uses its function tool instead of the tools of the agent.
             async with await agent_client.runs.stream(
                 thread_id=thread_id, 
                 agent_id=agent_id,
-                event_handler=MyEventHandler(ai_project, app_insight_conn_str),
+                tools=search_tool.definitions if search_tool is not None else None,
+                event_handler=event_handler,
             ) as stream:
                 logger.info("Successfully created stream; starting to process events")
-                async for event in stream:
-                    _, _, event_func_return_val = event
-                    logger.debug(f"Received event: {event}")
-                    if event_func_return_val:
-                        logger.info(f"Yielding event: {event_func_return_val}")
-                        yield event_func_return_val
-                    else:
-                        logger.debug("Event received but no data to yield")
+                if STREAM_COALESCE_WINDOW > 0:
+                    stats = CoalescingStats()
+                    async for frame in coalesce_deltas(
+                            stream_events(stream), STREAM_COALESCE_WINDOW, STREAM_COALESCE_MAX_BYTES, stats):
+                        yield frame
+                    logger.info(f"Coalesced message deltas: {stats.as_dict()}")
+                    trace.get_current_span().set_attribute("chat.stream.frames_saved", stats.frames_saved)
+                else:
+                    async for _, frame in stream_events(stream):
+                        yield frame
+            if (response_cache is not None and question_vector is not None
+                    and event_handler.run_status == "completed" and event_handler.completed_message):
+                response_cache.set(question_vector, agent_id, event_handler.completed_message)
         except Exception as e:
             logger.exception(f"Exception in get_result: {e}")
             yield serialize_sse_event({'type': "error", 'message': str(e)})
 
 
+async def replay_cached_response(
+    thread_id: str,
+    ai_project: AIProjectClient,
+    cached_response: Dict
+) -> AsyncGenerator[str, None]:
+    """Stream the cached answer with the same events as the agent run and add it to the thread."""
+    with tracer.start_as_current_span('replay_cached_response'):
+        try:
+            await ai_project.agents.messages.create(
+                thread_id=thread_id,
+                role="assistant",
+                content=cached_response['content']
+            )
+        except Exception as e:
+            logger.exception(f"Exception in replay_cached_response: {e}")
+            yield serialize_sse_event({'type': "error", 'message': str(e)})
+            return
+        yield serialize_sse_event({'content': cached_response['content'], 'type': "message"})
+        yield serialize_sse_event(dict(cached_response, type="completed_message"))
+        yield serialize_sse_event({'type': "stream_end"})
+
+
 @router.get("/chat/history")
 async def history(
     request: Request,
-    ai_project : AIProjectClient = Depends(get_ai_project),
+    limit: Optional[int] = Query(None, ge=1, le=CHAT_HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    agent_client : AgentsClient = Depends(get_agent_client),
     agent : Agent = Depends(get_agent),
+    session_cache : Optional["SessionCache"] = Depends(get_session_cache),
 	_ = auth_dependency
 ):
     with tracer.start_as_current_span("chat_history"):
@@ -237,41 +463,32 @@ async def history(
 
         # Attempt to get an existing thread. If not found, create a new one.
         try:
-            agent_client = ai_project.agents
-            if thread_id and agent_id == agent.id:
-                logger.info(f"Retrieving thread with ID {thread_id}")
-                thread = await agent_client.threads.get(thread_id)
-            else:
-                logger.info("Creating a new thread")
-                thread = await agent_client.threads.create()
+            thread_id = await get_or_create_thread(agent_client, thread_id, agent_id, agent, session_cache)
         except Exception as e:
             logger.error(f"Error handling thread: {e}")
             raise HTTPException(status_code=400, detail=f"Error handling thread: {e}")
 
-        thread_id = thread.id
         agent_id = agent.id
 
-    # Create a new message from the user's input.
+    # List the requested page of the messages or, without the limit, the whole thread, the newest first.
     try:
-        content = []
-        response = agent_client.messages.list(
-            thread_id=thread_id,
-        )
-        async for message in response:
-            formatteded_message = await get_message_and_annotations(agent_client, message)
-            formatteded_message['role'] = message.role
-            formatteded_message['created_at'] = message.created_at.astimezone().strftime("%m/%d/%y, %I:%M %p")
-            content.append(formatteded_message)
-                
-                                        
+        if limit is None:
+            content, next_before = await get_history(agent_client, thread_id), None
+        else:
+            content, next_before = await get_history_page(agent_client, thread_id, limit, before)
         logger.info(f"List message, thread ID: {thread_id}")
         response = JSONResponse(content=content)
-    
+        # The cursor for the older messages, if there are any.
+        if next_before:
+            response.headers["X-Next-Before"] = next_before
+
         # Update cookies to persist the thread and agent IDs.
         response.set_cookie("thread_id", thread_id)
         response.set_cookie("agent_id", agent_id)
         return response
     except Exception as e:
+        if isinstance(e, ResourceNotFoundError) and session_cache is not None:
+            await session_cache.invalidate(thread_id)
         logger.error(f"Error listing message: {e}")
         raise HTTPException(status_code=500, detail=f"Error list message: {e}")
 
@@ -286,7 +503,12 @@ async def chat(
     request: Request,
     agent : Agent = Depends(get_agent),
     ai_project: AIProjectClient = Depends(get_ai_project),
+    agent_client : AgentsClient = Depends(get_agent_client),
     app_insights_conn_str : str = Depends(get_app_insights_conn_str),
+    response_cache : Optional["SemanticResponseCache"] = Depends(get_response_cache),
+    session_cache : Optional["SessionCache"] = Depends(get_session_cache),
+    evaluation_scheduler : Optional["EvaluationScheduler"] = Depends(get_evaluation_scheduler),
+    search_tool : Optional[AsyncFunctionTool] = Depends(get_search_tool),
 	_ = auth_dependency
 ):
     # Retrieve the thread ID from the cookies (if available).
@@ -299,18 +521,11 @@ async def chat(
         
         # Attempt to get an existing thread. If not found, create a new one.
         try:
-            agent_client = ai_project.agents
-            if thread_id and agent_id == agent.id:
-                logger.info(f"Retrieving thread with ID {thread_id}")
-                thread = await agent_client.threads.get(thread_id)
-            else:
-                logger.info("Creating a new thread")
-                thread = await agent_client.threads.create()
+            thread_id = await get_or_create_thread(agent_client, thread_id, agent_id, agent, session_cache)
         except Exception as e:
             logger.error(f"Error handling thread: {e}")
             raise HTTPException(status_code=400, detail=f"Error handling thread: {e}")
 
-        thread_id = thread.id
         agent_id = agent.id
 
         # Parse the JSON from the request.
@@ -331,9 +546,31 @@ async def chat(
             )
             logger.info(f"Created message, message ID: {message.id}")
         except Exception as e:
+            if isinstance(e, ResourceNotFoundError) and session_cache is not None:
+                await session_cache.invalidate(thread_id)
             logger.error(f"Error creating message: {e}")
             raise HTTPException(status_code=500, detail=f"Error creating message: {e}")
 
+        # Look up the answer to a similar question, if it is the first question of the thread.
+        question_vector = None
+        cached_response = None
+        if response_cache is not None:
+            try:
+                first_question, question_vector = await asyncio.gather(
+                    is_first_question(agent_client, thread_id),
+                    response_cache.embed(user_message.get('message', '')))
+                if not first_question:
+                    question_vector = None
+                    logger.info("Response cache skipped for the follow-up question")
+                else:
+                    cached_response = response_cache.get(question_vector, agent_id)
+                    logger.info(
+                        f"Response cache {'hit' if cached_response else 'miss'}, "
+                        f"hit rate: {response_cache.stats['hit_rate']:.2f}")
+            except Exception as e:
+                logger.error(f"Error looking up the response cache: {e}")
+            trace.get_current_span().set_attribute("chat.response_cache.hit", cached_response is not None)
+
         # Set the Server-Sent Events (SSE) response headers.
         headers = {
             "Cache-Control": "no-cache",
@@ -343,7 +580,13 @@ async def chat(
         logger.info(f"Starting streaming response for thread ID {thread_id}")
 
         # Create the streaming response using the generator.
-        response = StreamingResponse(get_result(request, thread_id, agent_id, ai_project, app_insights_conn_str, carrier), headers=headers)
+        if cached_response is not None:
+            generator = replay_cached_response(thread_id, ai_project, cached_response)
+        else:
+            generator = get_result(
+                request, thread_id, agent_id, ai_project, app_insights_conn_str, carrier,
+                response_cache, question_vector, evaluation_scheduler, search_tool)
+        response = StreamingResponse(generator, headers=headers)
 
         # Update cookies to persist the thread and agent IDs.
         response.set_cookie("thread_id", thread_id)
@@ -355,43 +598,16 @@ def read_file(path: str) -> str:
         return file.read()
 
 
-def run_agent_evaluation(
-    thread_id: str, 
-    run_id: str,
-    ai_project: AIProjectClient,
-    app_insights_conn_str: str):
-
-    if app_insights_conn_str:
-        agent_evaluation_request = AgentEvaluationRequest(
-            run_id=run_id,
-            thread_id=thread_id,
-            evaluators={
-                "Relevance": {"Id": EvaluatorIds.RELEVANCE.value},
-                "TaskAdherence": {"Id": EvaluatorIds.TASK_ADHERENCE.value},
-                "ToolCallAccuracy": {"Id": EvaluatorIds.TOOL_CALL_ACCURACY.value},
-            },
-            sampling_configuration=AgentEvaluationSamplingConfiguration(
-                name="default",
-                sampling_percent=100,
-            ),
-            redaction_configuration=AgentEvaluationRedactionConfiguration(
-                redact_score_properties=False,
-            ),
-            app_insights_connection_string=app_insights_conn_str,
-        )
-        
-        async def run_evaluation():
-            try:        
-                logger.info(f"Running agent evaluation on thread ID {thread_id} and run ID {run_id}")
-                agent_evaluation_response = await ai_project.evaluations.create_agent_evaluation(
-                    evaluation=agent_evaluation_request
-                )
-                logger.info(f"Evaluation response: {agent_evaluation_response}")
-            except Exception as e:
-                logger.error(f"Error creating agent evaluation: {e}")
+@router.get("/stats/http_pool")
+async def get_http_pool_stats(request: Request, _ = auth_dependency):
+    """Get the connection pool statistics of this worker."""
+    return JSONResponse(content=request.app.state.http_pool.stats)
+
 
-        # Create a new task to run the evaluation asynchronously
-        asyncio.create_task(run_evaluation())
+@router.get("/stats/streams")
+async def get_stream_stats(request: Request, _ = auth_dependency):
+    """Get the concurrent chat streams of this worker."""
+    return JSONResponse(content=request.app.state.stream_limiter.stats)
 
 
 @router.get("/config/azure")
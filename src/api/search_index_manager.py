@@ -1,11 +1,16 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-import csv
+import asyncio
+import concurrent.futures
 import glob
-import json
+import hashlib
+import itertools
+import logging
 import os
 import time
 
+import numpy as np
+
 from azure.core.credentials_async import AsyncTokenCredential
 from azure.search.documents.aio import AsyncSearchItemPaged, SearchClient 
 from azure.search.documents.indexes.aio import SearchIndexClient
@@ -27,6 +32,97 @@ from azure.search.documents.indexes.models import (
 )
 from azure.search.documents.models import VectorizableTextQuery
 
+from .cache import TTLCache
+from .embeddings_store import Embeddings, iter_rows, load_embeddings, save_embeddings
+
+logger = logging.getLogger("azureaiapp")
+
+def format_search_results(results: Iterable[Dict]) -> str:
+    """
+    Format the found documents as the context for the agent.
+
+    :param results: The documents with 'token' and 'title' fields.
+    :return: The formatted response string.
+    """
+    return "\n------\n".join(f"{result['token']}, source: {result['title']}" for result in results)
+
+
+def reciprocal_rank_fusion(
+        rankings: Iterable[Sequence[Dict[str, Any]]],
+        rank_constant: int = 60,
+        key: str = 'embedId'
+) -> List[Dict[str, Any]]:
+    """
+    Fuse the rankings of the documents with the reciprocal rank fusion.
+
+    The score of the document is the sum of 1 / (rank_constant + rank) over the rankings,
+    which contain it, with the rank starting at 1, the same as in the Azure AI Search hybrid query.
+    The documents, found by several rankings, are returned once.
+
+    :param rankings: The lists of the documents, each sorted by descending relevance.
+    :param rank_constant: The constant, which reduces the weight of the top ranks.
+    :param key: The field, which identifies the document.
+    :return: The copies of the documents with the fused '@search.score', sorted by descending score.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            document_key = document[key]
+            scores[document_key] = scores.get(document_key, 0.0) + 1.0 / (rank_constant + rank)
+            documents.setdefault(document_key, document)
+    # sorted is stable, so the ties keep the order of the first ranking.
+    return [
+        dict(documents[document_key], **{'@search.score': scores[document_key]})
+        for document_key in sorted(scores, key=lambda document_key: -scores[document_key])
+    ]
+
+
+def limit_result_size(results: Sequence[Dict[str, Any]], max_chars: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Keep the best documents, which fit into the size of the context.
+
+    :param results: The documents with 'token' and 'title' fields, sorted by descending relevance.
+    :param max_chars: The maximal length of the formatted context, None for no limit.
+    :return: The longest prefix of results, which format_search_results formats within max_chars.
+    """
+    if max_chars is None:
+        return list(results)
+    kept = []
+    size = 0
+    for result in results:
+        size += len(format_search_results([result])) + (len("\n------\n") if kept else 0)
+        if size > max_chars:
+            break
+        kept.append(result)
+    return kept
+
+
+def _split_file(file_path: str) -> List[str]:
+    """
+    Split the informative lines of the document into sentences.
+
+    This function is executed in the worker process of the pool.
+
+    :param file_path: The document to split.
+    :return: The list of sentences.
+    """
+    from nltk.tokenize import sent_tokenize
+    sentences = []
+    with open(file_path) as f:
+        for line in f:
+            line = line.strip()
+            # Skip non informative lines.
+            if (len(line) < SearchIndexManager.MIN_LINE_LENGTH
+                    or len(set(line)) < SearchIndexManager.MIN_DIFF_CHARACTERS_IN_LINE):
+                continue
+            sentences.extend(sent_tokenize(line))
+    return sentences
+
+
+def _content_hash(token: str) -> str:
+    """Return the key of the chunk in the embeddings cache."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
 
 
 class SearchIndexManager:
@@ -45,6 +141,8 @@ class SearchIndexManager:
     :param embed_api_key: The api key used by the embedding resource.
     :param embedding_client: The embedding client, used t build the embedding. Needed only
                              to create embedding file. Not used in inference time.
+    :param query_cache: The cache of search results, keyed by the normalized query and the search mode.
+                        It is cleared when documents are uploaded or the index is deleted.
     """
     
     MIN_DIFF_CHARACTERS_IN_LINE = 5
@@ -54,6 +152,27 @@ class SearchIndexManager:
     _EMBEDDING_CONFIG = "embedding_config"
     _VECTORIZER = "search_vectorizer"
 
+    # The newly uploaded documents become searchable after a short delay,
+    # we poll the document count with exponential backoff until they are indexed.
+    _CONSISTENCY_TIMEOUT = 10.0
+    _CONSISTENCY_INITIAL_DELAY = 0.1
+    _CONSISTENCY_MAX_DELAY = 1.0
+
+    # The service accepts up to 1000 documents in one request.
+    DEFAULT_UPLOAD_BATCH_SIZE = 500
+    DEFAULT_UPLOAD_CONCURRENCY = 4
+    _UPLOAD_MAX_RETRIES = 5
+    _UPLOAD_INITIAL_BACKOFF = 1.0
+    _THROTTLING_STATUS_CODES = (429, 503)
+
+    DEFAULT_EMBEDDING_BATCH_SIZE = 2000
+    DEFAULT_EMBEDDING_CONCURRENCY = 4
+
+    DEFAULT_TOP_K = 5
+    # The number of documents, retrieved by each query of the hybrid search before the fusion.
+    DEFAULT_HYBRID_CANDIDATES = 20
+    RRF_RANK_CONSTANT = 60
+
 
     def __init__(
             self,
@@ -65,7 +184,8 @@ class SearchIndexManager:
             deployment_name: str,
             embedding_endpoint: str, 
             embed_api_key: Optional[str],
-            embedding_client: Optional[Any] = None
+            embedding_client: Optional[Any] = None,
+            query_cache: Optional[TTLCache] = None
         ) -> None:
         """Constructor."""
         self._dimensions = dimensions
@@ -79,6 +199,13 @@ class SearchIndexManager:
         self._embed_api_key = embed_api_key
         self._client = None
         self._embedding_client = embedding_client
+        self._query_cache = query_cache
+        # The number of documents the index must contain to be consistent with the uploads.
+        self._expected_documents = 0
+        self._consistent = True
+        # Set when the wait for consistency has timed out, the searches do not wait again until the next upload.
+        self._consistency_timed_out = False
+        self._consistency_lock = asyncio.Lock()
 
     def _get_client(self):
         """Get search client if it is absent."""
@@ -87,28 +214,159 @@ class SearchIndexManager:
                 endpoint=self._endpoint, index_name=self._index.name, credential=self._credential)
         return self._client
     
-    async def upload_documents(self, embeddings_file: str) -> None:
+    async def upload_documents(
+            self,
+            embeddings_file: str,
+            batch_size: int = DEFAULT_UPLOAD_BATCH_SIZE,
+            max_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY
+        ) -> None:
         """
         Upload the embeggings file to index search.
 
-        :param embeddings_file: The embeddings file to upload.
+        The file is read lazily and sent in the batches of batch_size documents, at most
+        max_concurrency batches are in flight at once, so the memory use does not depend
+        on the file size. The throttled batches are retried with exponential backoff.
+        The documents, rejected for other reasons, are logged and not counted as uploaded.
+
+        :param embeddings_file: The embeddings file to upload, either csv or the memory-mapped binary .npy file.
+        :param batch_size: The number of documents in one upload request.
+        :param max_concurrency: The maximal number of concurrent upload requests.
         """
         self._raise_if_no_index()
-        documents = []
+        start = time.monotonic()
+        uploaded = 0
+        in_flight = set()
+        self._invalidate_query_cache()
+        try:
+            for batch in self._iter_batches(embeddings_file, batch_size):
+                while len(in_flight) >= max_concurrency:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        uploaded += task.result()
+                in_flight.add(asyncio.create_task(self._upload_batch(batch)))
+            uploaded += sum(await asyncio.gather(*in_flight))
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            self._invalidate_query_cache()
+        self._expected_documents = max(self._expected_documents, uploaded)
+        self._consistent = False
+        self._consistency_timed_out = False
+        elapsed = time.monotonic() - start
+        logger.info(
+            "Uploaded %d documents to index %s in %.2f seconds, %.1f docs/sec.",
+            uploaded, self._index_name, elapsed, uploaded / elapsed if elapsed > 0 else 0.0)
+
+    @staticmethod
+    def _iter_batches(embeddings_file: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Lazily split the embeddings file into the batches of documents.
+
+        :param embeddings_file: The embeddings file to upload.
+        :param batch_size: The number of documents in the batch.
+        :return: The iterator over batches.
+        """
+        rows = iter_rows(embeddings_file)
         index = 0
-        with open(embeddings_file, newline='') as fp:
-            reader = csv.DictReader(fp)
-            for row in reader:
-                documents.append(
-                    {
-                        'embedId': str(index),
-                        'token': row['token'],
-                        'embedding': json.loads(row['embedding']),
-                        'title': row['title'] 
-                    }
-                )
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            for row in batch:
+                row['embedId'] = str(index)
                 index += 1
-        await self._get_client().upload_documents(documents)
+            yield batch
+
+    async def _upload_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Upload the batch of documents and retry the throttled ones.
+
+        :param batch: The documents to upload.
+        :return: The number of the uploaded documents, the documents rejected by the service are logged.
+        :raises: HttpResponseError if the request has failed or the documents were still throttled
+                 after the last retry.
+        """
+        delay = SearchIndexManager._UPLOAD_INITIAL_BACKOFF
+        succeeded = 0
+        for attempt in range(SearchIndexManager._UPLOAD_MAX_RETRIES + 1):
+            last_attempt = attempt == SearchIndexManager._UPLOAD_MAX_RETRIES
+            try:
+                results = await self._get_client().upload_documents(batch)
+            except HttpResponseError as e:
+                if last_attempt or e.status_code not in SearchIndexManager._THROTTLING_STATUS_CODES:
+                    raise
+                logger.warning("Upload of %d documents was throttled, retrying in %.1f seconds.", len(batch), delay)
+            else:
+                # The service may accept a part of the batch and throttle or reject the rest.
+                throttled = set()
+                failed = []
+                for result in results:
+                    if result.succeeded:
+                        succeeded += 1
+                    elif result.status_code in SearchIndexManager._THROTTLING_STATUS_CODES:
+                        throttled.add(result.key)
+                    else:
+                        failed.append(result)
+                if failed:
+                    logger.error(
+                        "%d documents were rejected by index %s: %s", len(failed), self._index_name,
+                        "; ".join(f"{r.key}: {r.status_code} {r.error_message}" for r in failed[:10]))
+                if not throttled:
+                    return succeeded
+                if last_attempt:
+                    raise HttpResponseError(
+                        f"{len(throttled)} documents were throttled after {attempt + 1} attempts.")
+                batch = [document for document in batch if document['embedId'] in throttled]
+                logger.warning("%d documents were throttled, retrying in %.1f seconds.", len(batch), delay)
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    @property
+    def is_consistent(self) -> bool:
+        """True if all the uploaded documents are known to be searchable."""
+        return self._consistent
+
+    async def wait_until_consistent(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the index contains all the uploaded documents.
+
+        The document count is polled with exponential backoff without blocking the event loop.
+        Concurrent callers share the same polling, and once the index is consistent
+        this method returns immediately. The timeout includes the wait for the concurrent caller;
+        once it has expired, this method returns False immediately until the next upload.
+
+        :param timeout: The maximal time to wait in seconds, _CONSISTENCY_TIMEOUT by default.
+        :return: True if the index is consistent, False if the timeout has expired.
+        """
+        if self._consistent:
+            return True
+        if self._consistency_timed_out:
+            return False
+        if timeout is None:
+            timeout = SearchIndexManager._CONSISTENCY_TIMEOUT
+        deadline = time.monotonic() + timeout
+        async with self._consistency_lock:
+            # The caller, which held the lock, may have given up.
+            if self._consistency_timed_out:
+                return False
+            delay = SearchIndexManager._CONSISTENCY_INITIAL_DELAY
+            while not self._consistent:
+                count = await self._get_client().get_document_count()
+                if count >= self._expected_documents:
+                    self._consistent = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._consistency_timed_out = True
+                    logger.warning(
+                        "Index %s has %d of %d documents after %.1f seconds, "
+                        "the searches do not wait for it until the next upload.",
+                        self._index_name, count, self._expected_documents, timeout)
+                    return False
+                await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * 2, SearchIndexManager._CONSISTENCY_MAX_DELAY)
+        return True
 
     def _raise_if_no_index(self) -> None:
         """
@@ -127,6 +385,10 @@ class SearchIndexManager:
         async with SearchIndexClient(endpoint=self._endpoint, credential=self._credential) as ix_client:
             await ix_client.delete_index(self._index.name)
         self._index = None
+        self._expected_documents = 0
+        self._consistent = True
+        self._consistency_timed_out = False
+        self._invalidate_query_cache()
 
     def _check_dimensions(self, vector_index_dimensions: Optional[int] = None) -> int:
         """
@@ -153,8 +415,42 @@ class SearchIndexManager:
         :param response: The search results.
         :return: The formatted response string.
         """
-        results = [f"{result['token']}, source: {result['title']}" async for result in response]
-        return "\n------\n".join(results)
+        return format_search_results([result async for result in response])
+
+    @staticmethod
+    def _query_cache_key(mode: str, message: str) -> Tuple[str, str]:
+        """
+        Return the cache key of the query.
+
+        :param mode: The search mode.
+        :param message: The customer question.
+        :return: The mode and the question in lower case with collapsed whitespace.
+        """
+        return mode, ' '.join(message.lower().split())
+
+    def _get_cached(self, cache_key: Tuple[str, str]) -> Optional[str]:
+        """Return the cached search result, None if it is absent or there is no cache."""
+        if self._query_cache is None:
+            return None
+        return self._query_cache.get(cache_key)
+
+    def _set_cached(self, cache_key: Tuple[str, str], result: str) -> str:
+        """Cache the search result and return it."""
+        if self._query_cache is not None:
+            self._query_cache.set(cache_key, result)
+        return result
+
+    def _invalidate_query_cache(self) -> None:
+        """Drop the cached search results, because the index contents have changed."""
+        if self._query_cache is not None:
+            self._query_cache.clear()
+
+    @property
+    def query_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """The hit, miss and eviction counters of the query cache, None if there is no cache."""
+        if self._query_cache is None:
+            return None
+        return self._query_cache.stats
 
     async def semantic_search(self, message: str) -> str:
         """
@@ -164,35 +460,132 @@ class SearchIndexManager:
         :return: The context for the question.
         """
         self._raise_if_no_index()
+        cache_key = self._query_cache_key("semantic", message)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        await self.wait_until_consistent()
         response = await self._get_client().search(
             search_text=message,
             query_type="full",
             search_fields=['token', 'title'],
             semantic_configuration_name=SearchIndexManager._SEMANTIC_CONFIG,
         )
-        return await self._format_search_results(response)
+        return self._set_cached(cache_key, await self._format_search_results(response))
         
 
-    async def search(self, message: str) -> str:
+    async def search(self, message: str, k: int = DEFAULT_TOP_K) -> str:
         """
         Search the message in the vector store.
 
         :param message: The customer question.
+        :param k: The number of the nearest chunks to return.
         :return: The context for the question.
         """
         self._raise_if_no_index()
+        mode = "vector" if k == SearchIndexManager.DEFAULT_TOP_K else f"vector:{k}"
+        cache_key = self._query_cache_key(mode, message)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        await self.wait_until_consistent()
         vector_query = VectorizableTextQuery(
             text=message,
-            k_nearest_neighbors=5,
+            k_nearest_neighbors=k,
             fields="embedding"
         )
         response = await self._get_client().search(
             vector_queries=[vector_query],
             select=['token', 'title'],
         )
-        # This lag is necessary, despite it is not described in documentation.
-        time.sleep(1)
-        return await self._format_search_results(response)
+        return self._set_cached(cache_key, await self._format_search_results(response))
+
+    async def _search_documents(self, **kwargs: Any) -> List[Dict[str, Any]]:
+        """
+        Run the query and read all its results.
+
+        :param kwargs: The parameters of SearchClient.search.
+        :return: The found documents.
+        """
+        return [result async for result in await self._get_client().search(**kwargs)]
+
+    async def hybrid_search_documents(
+            self,
+            message: str,
+            k: int = DEFAULT_TOP_K,
+            candidates: int = DEFAULT_HYBRID_CANDIDATES,
+            combined: bool = False
+        ) -> List[Dict[str, Any]]:
+        """
+        Find the chunks by both the vector and the full text query.
+
+        By default the vector and the full text queries run concurrently and their rankings are fused
+        here with the reciprocal rank fusion; with combined, the service runs both in one hybrid request
+        and fuses them the same way.
+
+        :param message: The customer question.
+        :param k: The number of chunks to return.
+        :param candidates: The number of chunks, retrieved by each query before the fusion.
+        :param combined: Send one hybrid request instead of two concurrent ones.
+        :return: The documents with embedId, token, title and the fused score, without duplicates.
+        """
+        self._raise_if_no_index()
+        await self.wait_until_consistent()
+        candidates = max(k, candidates)
+        vector_query = VectorizableTextQuery(
+            text=message,
+            k_nearest_neighbors=candidates,
+            fields="embedding"
+        )
+        select = ['embedId', 'token', 'title']
+        if combined:
+            results = await self._search_documents(
+                search_text=message,
+                vector_queries=[vector_query],
+                search_fields=['token', 'title'],
+                select=select,
+                top=candidates,
+            )
+            # The service has already fused the rankings, the fusion only removes the duplicates.
+            return reciprocal_rank_fusion([results], SearchIndexManager.RRF_RANK_CONSTANT)[:k]
+        rankings = await asyncio.gather(
+            self._search_documents(vector_queries=[vector_query], select=select, top=candidates),
+            self._search_documents(
+                search_text=message,
+                query_type="full",
+                search_fields=['token', 'title'],
+                semantic_configuration_name=SearchIndexManager._SEMANTIC_CONFIG,
+                select=select,
+                top=candidates,
+            ),
+        )
+        return reciprocal_rank_fusion(rankings, SearchIndexManager.RRF_RANK_CONSTANT)[:k]
+
+    async def hybrid_search(
+            self,
+            message: str,
+            k: int = DEFAULT_TOP_K,
+            max_chars: Optional[int] = None,
+            candidates: int = DEFAULT_HYBRID_CANDIDATES,
+            combined: bool = False
+        ) -> str:
+        """
+        Search the message with both the vector and the full text query, see hybrid_search_documents.
+
+        :param message: The customer question.
+        :param k: The number of chunks to return.
+        :param max_chars: The maximal length of the context, the less relevant chunks, which do not fit, are dropped.
+        :param candidates: The number of chunks, retrieved by each query before the fusion.
+        :param combined: Send one hybrid request instead of two concurrent ones.
+        :return: The context for the question.
+        """
+        self._raise_if_no_index()
+        cache_key = self._query_cache_key(f"hybrid:{k}:{max_chars}:{candidates}:{combined}", message)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        documents = await self.hybrid_search_documents(message, k, candidates, combined)
+        return self._set_cached(cache_key, format_search_results(limit_result_size(documents, max_chars)))
 
     async def create_index(
         self,
@@ -300,6 +693,10 @@ class SearchIndexManager:
             input_directory: str,
             output_file: str,
             sentences_per_embedding: int=4,
+            cache_file: Optional[str]=None,
+            batch_size: int=DEFAULT_EMBEDDING_BATCH_SIZE,
+            max_concurrency: int=DEFAULT_EMBEDDING_CONCURRENCY,
+            max_workers: Optional[int]=None,
             ) -> None:
         """
         In this method we do lazy loading of nltk and download the needed data set to split
@@ -307,56 +704,129 @@ class SearchIndexManager:
         document into tokens. This operation takes time that is why we hide import nltk under this
         method. We also do not include nltk into requirements because this method is only used
         during rag generation.
+        The documents are split in the process pool. Each chunk is keyed by the hash of its text,
+        and the embeddings of chunks, found in the cache file, are reused, so only new or changed
+        chunks are sent to the embedding client. Re-running this method on the unchanged directory
+        does not call the embedding client at all.
         :param dimensions: The number of dimensions in the embeddings. Must be the same as
                the one used for SearchIndexManager creation.
         :param input_directory: The directory with the embedding files.
-        :param output_file: The file csv file to store embeddings.
+        :param output_file: The file to store embeddings, csv or binary .npy with the json sidecar
+                            for tokens and titles, depending on the extension.
         :param embeddings_client: The embedding client, used to create embeddings. 
                 Must be the same as the one used for SearchIndexManager creation.
         :param sentences_per_embedding: The number of sentences used to build embedding.
+        :param cache_file: The embeddings file built earlier with the same model and dimensions,
+               by default the output_file, if it exists.
+        :param batch_size: The number of chunks in one embedding request.
+        :param max_concurrency: The maximal number of concurrent embedding requests.
+        :param max_workers: The number of processes used to split the documents, by default the number of CPUs.
         """
         import nltk
         nltk.download('punkt')
-        
-        from nltk.tokenize import sent_tokenize
+        nltk.download('punkt_tab')
+
         # Split the data to sentence tokens.
-        sentence_tokens = []
-        references = []
-        globs = glob.glob(input_directory + '/*.md', recursive=True)
+        chunks = await self._split_files(
+            glob.glob(input_directory + '/*.md', recursive=True), sentences_per_embedding, max_workers)
+        tokens = [token for token, _ in chunks]
+        titles = [title for _, title in chunks]
+
+        # Reuse the embeddings of unchanged chunks.
+        cache = self._load_embeddings_cache(cache_file or output_file)
+        keys = [_content_hash(token) for token in tokens]
+        missing = list({key: token for key, token in zip(keys, tokens) if key not in cache}.items())
+        logger.info(
+            "Building embeddings for %d of %d chunks, the rest is reused from cache.", len(missing), len(tokens))
+
+        # For each new token build the embedding, which will be used in the search.
+        vectors = await self._embed_tokens([token for _, token in missing], batch_size, max_concurrency)
+        cache.update((key, vector) for (key, _), vector in zip(missing, vectors))
+
+        if tokens:
+            matrix = np.array([cache[key] for key in keys], dtype=np.float32)
+        else:
+            matrix = np.zeros((0, self._dimensions or 0), dtype=np.float32)
+        save_embeddings(Embeddings(tokens, titles, matrix), output_file)
+
+    @staticmethod
+    async def _split_files(
+            files: List[str],
+            sentences_per_embedding: int,
+            max_workers: Optional[int] = None
+        ) -> List[Tuple[str, str]]:
+        """
+        Split the documents into chunks in the process pool.
+
+        The documents are split into sentences in the pool, and the sentences of all documents are
+        grouped into chunks in the order of files, so a chunk may continue into the next document,
+        and its title is the document, where it starts.
+
+        :param files: The documents to split.
+        :param sentences_per_embedding: The number of sentences in one chunk.
+        :param max_workers: The number of processes.
+        :return: The list of (chunk, document name) pairs in the order of files.
+        """
+        if not files:
+            return []
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+            file_sentences = await asyncio.gather(*(
+                loop.run_in_executor(pool, _split_file, fle) for fle in files))
+        chunks = []
         index = 0
-        for fle in globs:
-            with open(fle) as f:
-                for line in f:
-                    line = line.strip()
-                    # Skip non informative lines.
-                    if len(line) < SearchIndexManager.MIN_LINE_LENGTH or len(set(line)) < SearchIndexManager.MIN_DIFF_CHARACTERS_IN_LINE:
-                        continue
-                    for sentence in sent_tokenize(line):
-                        if index % sentences_per_embedding == 0:
-                            sentence_tokens.append(sentence)
-                            references.append(os.path.split(fle)[-1])
-                        else:
-                            sentence_tokens[-1] += ' '
-                            sentence_tokens[-1] += sentence
-                        index += 1
-        
-        
-        # For each token build the embedding, which will be used in the search.
-        batch_size = 2000
-        with open(output_file, 'w') as fp:
-            writer = csv.DictWriter(fp, fieldnames=['token', 'embedding', 'title'])
-            writer.writeheader()
-            for i in range(0, len(sentence_tokens), batch_size):
-                emedding = (await self._embedding_client.embed(
-                    input=sentence_tokens[i:i+min(batch_size, len(sentence_tokens))],
+        for fle, sentences in zip(files, file_sentences):
+            for sentence in sentences:
+                if index % sentences_per_embedding == 0:
+                    chunks.append((sentence, os.path.split(fle)[-1]))
+                else:
+                    chunks[-1] = (chunks[-1][0] + ' ' + sentence, chunks[-1][1])
+                index += 1
+        return chunks
+
+    @staticmethod
+    def _load_embeddings_cache(embeddings_file: str) -> Dict[str, np.ndarray]:
+        """
+        Load the embeddings, built earlier, keyed by the hash of the chunk text.
+
+        :param embeddings_file: The embeddings file of either format.
+        :return: The dictionary from the chunk hash to its embedding, empty if there is no file.
+        """
+        if not os.path.isfile(embeddings_file):
+            return {}
+        embeddings = load_embeddings(embeddings_file)
+        return {_content_hash(token): vector for token, vector in zip(embeddings.tokens, embeddings.vectors)}
+
+    async def _embed_tokens(
+            self,
+            tokens: List[str],
+            batch_size: int,
+            max_concurrency: int
+        ) -> List[List[float]]:
+        """
+        Build the embeddings in concurrent batches.
+
+        :param tokens: The texts to embed.
+        :param batch_size: The number of texts in one request.
+        :param max_concurrency: The maximal number of concurrent requests.
+        :return: The embeddings in the same order as tokens.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                embedding = (await self._embedding_client.embed(
+                    input=batch,
                     dimensions=self._dimensions,
                     model=self._embedding_model
                 ))["data"]
-                for token, float_data, reference in zip(sentence_tokens, emedding, references):
-                    writer.writerow({
-                        'token': token,
-                        'embedding': json.dumps(float_data['embedding']),
-                        'title': reference})
+            if len(embedding) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(embedding)}.")
+            return [float_data['embedding'] for float_data in embedding]
+
+        batches = await asyncio.gather(*(
+            embed_batch(tokens[i:i + batch_size]) for i in range(0, len(tokens), batch_size)))
+        return [vector for batch in batches for vector in batch]
 
     async def close(self):
         """Close the closeable resources, associated with SearchIndexManager."""
@@ -0,0 +1,144 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Callable, Dict, Optional
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from .cache import TTLCache
+
+
+class SqliteSessionStore:
+    """
+    The sessions, shared by the worker processes through the local SQLite database.
+
+    Each worker opens its own connection. The entries are stored with the wall clock
+    expiration time, because the monotonic clocks of the processes may differ.
+    The methods block while another worker holds the write lock, so SessionCache calls them
+    in a thread; the connection is used by one thread at a time.
+
+    :param path: The path to the database file, it is created if it does not exist.
+    :param ttl: The time to live of an entry in seconds.
+    :param timer: The wall clock, used to expire entries.
+    """
+
+    def __init__(self, path: str, ttl: float, timer: Callable[[], float] = time.time) -> None:
+        """Constructor."""
+        self._ttl = ttl
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (thread_id TEXT PRIMARY KEY, expires REAL, data TEXT)")
+        self._connection.execute("DELETE FROM sessions WHERE expires <= ?", (self._timer(),))
+
+    def get(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the session metadata.
+
+        :param thread_id: The ID of the thread.
+        :return: The metadata or None if the session is absent or expired.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM sessions WHERE thread_id = ? AND expires > ?", (thread_id, self._timer())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, thread_id: str, data: Dict[str, Any]) -> None:
+        """
+        Store the session metadata.
+
+        :param thread_id: The ID of the thread.
+        :param data: The JSON serializable metadata.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sessions (thread_id, expires, data) VALUES (?, ?, ?)",
+                (thread_id, self._timer() + self._ttl, json.dumps(data)))
+
+    def delete(self, thread_id: str) -> None:
+        """
+        Remove the session.
+
+        :param thread_id: The ID of the thread.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+
+    def close(self) -> None:
+        """Close the connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class SessionCache:
+    """
+    The cache of the threads, known to exist, so that they are not retrieved on every request.
+
+    The sessions are kept in the in-memory cache of the worker with time to live and least
+    recently used eviction. If the shared store is set, the sessions, created or retrieved by one
+    worker, are visible to the other workers as well. The store is accessed in a thread, so
+    the event loop is not blocked while another worker writes to it. A session is invalidated
+    when the agent service reports that the thread was not found.
+
+    :param max_size: The maximal number of sessions in the memory of the worker.
+    :param ttl: The time to live of a session in seconds.
+    :param store: The optional store, shared by the workers.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 600.0, store: Optional[SqliteSessionStore] = None) -> None:
+        """Constructor."""
+        self._sessions = TTLCache(max_size=max_size, ttl=ttl)
+        self._store = store
+        self.store_hits = 0
+
+    async def get(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the session metadata, looking in the shared store if the worker has not seen the thread.
+
+        :param thread_id: The ID of the thread.
+        :return: The metadata or None if the thread has to be retrieved.
+        """
+        data = self._sessions.get(thread_id)
+        if data is None and self._store is not None:
+            data = await asyncio.to_thread(self._store.get, thread_id)
+            if data is not None:
+                self.store_hits += 1
+                self._sessions.set(thread_id, data)
+        return data
+
+    async def set(self, thread_id: str, data: Dict[str, Any]) -> None:
+        """
+        Remember the thread after it was created or retrieved.
+
+        :param thread_id: The ID of the thread.
+        :param data: The JSON serializable metadata.
+        """
+        self._sessions.set(thread_id, data)
+        if self._store is not None:
+            await asyncio.to_thread(self._store.set, thread_id, data)
+
+    async def invalidate(self, thread_id: str) -> None:
+        """
+        Forget the thread, which was not found by the agent service.
+
+        :param thread_id: The ID of the thread.
+        """
+        self._sessions.pop(thread_id)
+        if self._store is not None:
+            await asyncio.to_thread(self._store.delete, thread_id)
+
+    def close(self) -> None:
+        """Close the shared store."""
+        if self._store is not None:
+            self._store.close()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """The counters of the in-memory cache and the shared store hits."""
+        return dict(self._sessions.stats, store_hits=self.store_hits)
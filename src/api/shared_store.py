@@ -0,0 +1,173 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from collections.abc import Sequence
+from typing import Iterable, Optional, Tuple, Union
+
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .embeddings_store import Embeddings, load_embeddings, normalize
+from .quantization import build_quantization, load_quantization, save_quantization
+
+logger = logging.getLogger("azureaiapp")
+
+# The environment variable, by which the master passes the store directory to the workers.
+SHARED_STORE_ENV = "LOCAL_SEARCH_SHARED_STORE"
+_BLOCK_ROWS = 65536
+
+
+class StringTable(Sequence):
+    """
+    The read-only sequence of strings, stored as the concatenated UTF-8 bytes and their offsets.
+
+    Unlike the list of str objects, the table has no reference counts in its pages, so the workers
+    reading its memory-mapped arrays do not copy them, and the string is decoded only when it is read.
+
+    :param data: The uint8 array of the concatenated strings.
+    :param offsets: The int64 array of the start of every string and the size of data at the end.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        """Constructor."""
+        self._data = data
+        self._offsets = offsets
+
+    @staticmethod
+    def encode(strings: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encode the strings.
+
+        :param strings: The strings.
+        :return: The data and the offsets arrays.
+        """
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, list]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("StringTable index out of range")
+        return self._data[self._offsets[index]:self._offsets[index + 1]].tobytes().decode('utf-8')
+
+
+def default_store_dir() -> str:
+    """
+    Return the store directory of this process in the temporary directory.
+
+    The pages of the memory-mapped files are shared by the workers in the page cache. /dev/shm may be
+    used instead, but it is small by default in containers.
+    """
+    return os.path.join(tempfile.gettempdir(), f"azureaiapp_embeddings_{os.getpid()}")
+
+
+def vectors_path(directory: str) -> str:
+    """Return the path of the matrix in the store directory, next to which the quantization codes are stored."""
+    return os.path.join(directory, 'vectors.npy')
+
+
+def write_shared_store(
+        embeddings: Embeddings,
+        directory: str,
+        quantization: Optional[str] = None,
+        pq_subspaces: Optional[int] = None
+    ) -> None:
+    """
+    Write the embeddings as the arrays, which the workers memory-map.
+
+    The rows of the matrix are normalized, so the workers use it without copying. The directory
+    is written next to its final path and renamed, so the workers never see a partial store.
+
+    :param embeddings: The embeddings.
+    :param directory: The store directory, it is replaced if it exists.
+    :param quantization: The quantization, 'int8' or 'pq', whose parameters and codes are written
+                         to the store, so the workers do not build them.
+    :param pq_subspaces: The number of subspaces of the product quantization.
+    """
+    staging = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(staging)
+    try:
+        # The matrix is written by blocks with the file writes, so the lack of space raises OSError.
+        with open(vectors_path(staging), 'wb') as fp:
+            np.lib.format.write_array_header_1_0(fp, {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                'fortran_order': False,
+                'shape': embeddings.vectors.shape,
+            })
+            for start in range(0, len(embeddings.vectors), _BLOCK_ROWS):
+                block = np.array(embeddings.vectors[start:start + _BLOCK_ROWS], dtype=np.float32)
+                fp.write(normalize(block).tobytes())
+        for name, strings in (('tokens', embeddings.tokens), ('titles', embeddings.titles)):
+            data, offsets = StringTable.encode(strings)
+            np.save(os.path.join(staging, f'{name}.npy'), data)
+            np.save(os.path.join(staging, f'{name}_offsets.npy'), offsets)
+        if quantization:
+            vectors = np.load(vectors_path(staging), mmap_mode='r')
+            save_quantization(
+                vectors_path(staging), quantization, *build_quantization(vectors, quantization, pq_subspaces))
+            del vectors
+        remove_shared_store(directory)
+        os.replace(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def read_shared_store(directory: str) -> Embeddings:
+    """
+    Attach to the store read only.
+
+    :param directory: The store directory.
+    :return: The embeddings with the memory-mapped matrix and the string tables of tokens and titles.
+    """
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+    return Embeddings(
+        StringTable(load('tokens'), load('tokens_offsets')),
+        StringTable(load('titles'), load('titles_offsets')),
+        load('vectors'))
+
+
+def create_shared_store(
+        embeddings_file: str,
+        directory: Optional[str] = None,
+        quantization: Optional[str] = None,
+        pq_subspaces: Optional[int] = None
+    ) -> str:
+    """
+    Create the store of the embeddings file and pass its directory to the workers, forked later.
+
+    :param embeddings_file: The embeddings file of either format.
+    :param directory: The store directory, in the temporary directory by default.
+    :param quantization: The quantization, whose codes are built in the store, unless they were
+                         built offline next to the embeddings file.
+    :param pq_subspaces: The number of subspaces of the product quantization.
+    :return: The store directory.
+    """
+    directory = directory or default_store_dir()
+    if quantization and load_quantization(embeddings_file, quantization) is not None:
+        # The workers memory-map the codes, built offline, next to the embeddings file.
+        quantization = None
+    write_shared_store(load_embeddings(embeddings_file), directory, quantization, pq_subspaces)
+    os.environ[SHARED_STORE_ENV] = directory
+    logger.info(f"Created the shared embeddings store {directory} from {embeddings_file}")
+    return directory
+
+
+def remove_shared_store(directory: Optional[str]) -> None:
+    """Remove the store directory if it exists."""
+    if directory and os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,149 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import asyncio
+import json
+import time
+
+try:
+    # orjson is several times faster than the standard library, it is used if it is installed.
+    import orjson
+
+    def dumps(data: Any) -> str:
+        """Serialize the data to the compact JSON string."""
+        return orjson.dumps(data).decode()
+
+    JSON_BACKEND = "orjson"
+except ImportError:
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    JSON_BACKEND = "json"
+
+# The message delta event is {"content": <text>, "type": "message"}, only the text is encoded per delta.
+# For a single string the C encoder of the standard library is faster than orjson with its decoding.
+_encode_string = json.encoder.encode_basestring
+_MESSAGE_PREFIX = 'data: {"content":'
+_MESSAGE_SUFFIX = ',"type":"message"}\n\n'
+
+
+def serialize_sse_event(data: Dict) -> str:
+    """
+    Serialize the server-sent event.
+
+    :param data: The event data.
+    :return: The event in the SSE format.
+    """
+    return f"data: {dumps(data)}\n\n"
+
+
+def serialize_message_delta(text: str) -> str:
+    """
+    Serialize the message delta event without building the event dictionary.
+
+    :param text: The text of the delta.
+    :return: The event in the SSE format, the same as serialize_sse_event({'content': text, 'type': "message"}).
+    """
+    return _MESSAGE_PREFIX + _encode_string(text) + _MESSAGE_SUFFIX
+
+
+class CoalescingStats:
+    """The counters of the delta coalescing in one stream."""
+
+    def __init__(self) -> None:
+        """Constructor."""
+        self.deltas = 0
+        self.delta_frames = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    @property
+    def frames_saved(self) -> int:
+        """The number of frames, which were not sent because the deltas were merged."""
+        return self.deltas - self.delta_frames
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The counters with the added latency in milliseconds."""
+        return {
+            'deltas': self.deltas,
+            'frames': self.delta_frames,
+            'frames_saved': self.frames_saved,
+            'avg_delay_ms': round(self.total_delay / self.delta_frames * 1000, 2) if self.delta_frames else 0.0,
+            'max_delay_ms': round(self.max_delay * 1000, 2),
+        }
+
+
+async def coalesce_deltas(
+        events: AsyncIterable[Tuple[Optional[str], str]],
+        window: float,
+        max_bytes: int,
+        stats: Optional[CoalescingStats] = None,
+        timer: Callable[[], float] = time.monotonic
+) -> AsyncIterator[str]:
+    """
+    Merge the message deltas, arriving within the window, into one message event.
+
+    The merged event is sent when the window after the first buffered delta expires, when
+    the buffered text reaches max_bytes, or before any other event, so that the completed
+    message, the run status and the end of the stream are never delayed.
+
+    :param events: The delta text, None for other events, and the serialized event.
+    :param window: The maximal time to hold the delta in seconds.
+    :param max_bytes: The maximal size of the buffered text in bytes.
+    :param stats: The counters to fill.
+    :param timer: The monotonic clock.
+    :return: The serialized events.
+    """
+    stats = stats if stats is not None else CoalescingStats()
+    iterator = events.__aiter__()
+    buffer: List[str] = []
+    size = 0
+    first = 0.0
+    pending: Optional[asyncio.Future] = None
+
+    def flush() -> str:
+        nonlocal buffer, size
+        delay = timer() - first
+        stats.delta_frames += 1
+        stats.total_delay += delay
+        stats.max_delay = max(stats.max_delay, delay)
+        frame = serialize_message_delta("".join(buffer))
+        buffer = []
+        size = 0
+        return frame
+
+    try:
+        while True:
+            if buffer:
+                # Wait for the next event only until the window of the buffered deltas expires.
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, first + window - timer()))
+                if not done:
+                    yield flush()
+                    continue
+                next_event, pending = pending, None
+            else:
+                next_event = pending if pending is not None else iterator.__anext__()
+                pending = None
+            try:
+                text, frame = await next_event
+            except StopAsyncIteration:
+                break
+            if text is None:
+                if buffer:
+                    yield flush()
+                yield frame
+                continue
+            if not buffer:
+                first = timer()
+            stats.deltas += 1
+            buffer.append(text)
+            size += len(text.encode())
+            if size >= max_bytes:
+                yield flush()
+        if buffer:
+            yield flush()
+    finally:
+        if pending is not None:
+            pending.cancel()
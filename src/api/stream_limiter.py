@@ -0,0 +1,109 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Dict, Iterable
+
+import json
+
+
+class StreamLimiter:
+    """
+    The limit of the concurrent chat streams of the worker.
+
+    The chat is I/O bound: a worker mostly waits for the agent, so a few workers serve many streams,
+    each in its event loop. Over the limit, the stream is rejected before any work is done, so the
+    load balancer or the client retries it, possibly with another worker, instead of slowing down
+    all the streams of the busy worker.
+
+    :param limit: The maximal number of the concurrent streams, 0 for no limit.
+    """
+
+    def __init__(self, limit: int) -> None:
+        """Constructor."""
+        self.limit = limit
+        self.active = 0
+        self.max_active = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        """
+        Take the slot for the stream.
+
+        :return: False if the worker is at the limit.
+        """
+        if self.limit and self.active >= self.limit:
+            self.rejected += 1
+            return False
+        self.active += 1
+        self.accepted += 1
+        self.max_active = max(self.max_active, self.active)
+        return True
+
+    def release(self) -> None:
+        """Return the slot of the finished stream."""
+        self.active -= 1
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The current and the maximal number of the streams and the rejected requests."""
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'max_active': self.max_active,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+        }
+
+
+class StreamLimitMiddleware:
+    """
+    The ASGI middleware, which holds the slot of the limiter until the streamed response is sent
+    or the client disconnects, and rejects the request over the limit with 503 and Retry-After,
+    closing the connection.
+
+    :param app: The ASGI application.
+    :param limiter: The limiter of the worker.
+    :param paths: The paths of the streaming POST requests.
+    :param retry_after: The value of the Retry-After header in seconds.
+    """
+
+    def __init__(
+            self,
+            app: Any,
+            limiter: StreamLimiter,
+            paths: Iterable[str] = ("/chat",),
+            retry_after: int = 1
+    ) -> None:
+        """Constructor."""
+        self.app = app
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        if not self.limiter.try_acquire():
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+    async def _reject(self, send: Any) -> None:
+        body = json.dumps({"detail": "Too many concurrent chats, retry later."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+                # The retry opens a new connection, which may be accepted by another worker.
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,226 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import Any, Callable, Dict, Optional
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # The file is not locked on Windows, the workers may acquire the token at the same time.
+    fcntl = None
+
+from azure.core.credentials import AccessToken
+
+logger = logging.getLogger("azureaiapp")
+
+
+class FileTokenCache:
+    """
+    The tokens, shared by the workers in the file, readable only by the owner.
+
+    The workers acquire the token under the exclusive lock of the file, so only one of them calls
+    the identity endpoint when the token expires, and the others read its token from the file.
+
+    :param path: The path to the JSON file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Constructor."""
+        self.path = path
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Hold the exclusive lock of the cache between the processes."""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _load(self) -> Dict[str, list]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring the unreadable token cache {self.path}: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, scope: str) -> Optional[AccessToken]:
+        """
+        Return the cached token.
+
+        :param scope: The scope of the token.
+        :return: The token or None if it is not cached.
+        """
+        entry = self._load().get(scope)
+        return AccessToken(entry[0], int(entry[1])) if entry else None
+
+    def set(self, scope: str, token: AccessToken) -> None:
+        """
+        Save the token, the caller holds the lock.
+
+        :param scope: The scope of the token.
+        :param token: The token.
+        """
+        entries = self._load()
+        entries[scope] = [token.token, token.expires_on]
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            # mkstemp creates the file, readable and writable only by the owner.
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tokens-", suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write the token cache {self.path}: {e}")
+
+
+class CachingTokenCredential:
+    """
+    The credential, which acquires the token before it is needed, so no request waits for it.
+
+    The token is acquired by prewarm during the startup and refreshed in the background before
+    it expires. The client awaits get_token in its event loop, so the token is returned from
+    memory; if the refresh has failed, the wrapped credential and the lock of the file cache
+    are called in a thread, so the event loop is never blocked by the token acquisition.
+
+    :param credential: The synchronous credential, acquiring the tokens.
+    :param cache: The token cache, shared by the workers.
+    :param refresh_margin: The time before the expiry to refresh the token in seconds.
+    :param min_validity: The minimal remaining validity of the cached token in seconds.
+    :param retry_delay: The time to wait after a failed or early refresh in seconds.
+    :param timer: The clock, returning the time in seconds since the epoch.
+    """
+
+    def __init__(
+            self,
+            credential: Any,
+            cache: Optional[FileTokenCache] = None,
+            refresh_margin: float = 600.0,
+            min_validity: float = 60.0,
+            retry_delay: float = 30.0,
+            timer: Callable[[], float] = time.time
+    ) -> None:
+        """Constructor."""
+        self.credential = credential
+        self.cache = cache
+        self.refresh_margin = refresh_margin
+        self.min_validity = min_validity
+        self.retry_delay = retry_delay
+        self.timer = timer
+        self._tokens: Dict[str, AccessToken] = {}
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self.memory_hits = 0
+        self.file_hits = 0
+        self.acquired = 0
+        self.refreshed = 0
+        self.refresh_failures = 0
+
+    def _is_valid(self, token: Optional[AccessToken], margin: float) -> bool:
+        return token is not None and token.expires_on - margin > self.timer()
+
+    def _acquire(self, scope: str, margin: float, **kwargs: Any) -> AccessToken:
+        """Return the token, valid for at least the margin, from the file cache or the wrapped credential."""
+        if self.cache is None:
+            token = self.credential.get_token(scope, **kwargs)
+            self.acquired += 1
+        else:
+            with self.cache.lock():
+                # Another worker may have acquired the token while this one waited for the lock.
+                token = self.cache.get(scope)
+                if self._is_valid(token, margin):
+                    self.file_hits += 1
+                else:
+                    token = self.credential.get_token(scope, **kwargs)
+                    self.acquired += 1
+                    self.cache.set(scope, token)
+        self._tokens[scope] = token
+        return token
+
+    async def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        """
+        Return the token for the scope.
+
+        :param scopes: The scopes of the token.
+        :return: The token.
+        """
+        if len(scopes) != 1 or kwargs.get('claims'):
+            return await asyncio.to_thread(self.credential.get_token, *scopes, **kwargs)
+        token = self._tokens.get(scopes[0])
+        if self._is_valid(token, self.min_validity):
+            self.memory_hits += 1
+            return token
+        return await asyncio.to_thread(self._acquire, scopes[0], self.min_validity, **kwargs)
+
+    async def prewarm(self, scope: str) -> bool:
+        """
+        Acquire the token in a thread, without blocking the event loop.
+
+        :param scope: The scope of the token.
+        :return: True if the token was acquired.
+        """
+        try:
+            await asyncio.to_thread(self._acquire, scope, self.refresh_margin)
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to acquire the token for {scope}, it will be acquired by the first request: {e}")
+            return False
+
+    def start_refresh(self, scope: str) -> None:
+        """
+        Refresh the token for the scope in the background, before it expires.
+
+        If the token was not acquired yet, it is acquired after retry_delay.
+
+        :param scope: The scope of the token.
+        """
+        if scope not in self._refresh_tasks:
+            self._refresh_tasks[scope] = asyncio.create_task(self._refresh(scope))
+
+    async def _refresh(self, scope: str) -> None:
+        while True:
+            token = self._tokens.get(scope)
+            delay = token.expires_on - self.refresh_margin - self.timer() if token else 0.0
+            # The wrapped credential may return its cached token, which is not refreshed yet.
+            await asyncio.sleep(max(delay, self.retry_delay))
+            if not await self.prewarm(scope):
+                self.refresh_failures += 1
+            elif token is None or self._tokens[scope].expires_on != token.expires_on:
+                self.refreshed += 1
+
+    async def stop(self) -> None:
+        """Stop the background refresh."""
+        for task in self._refresh_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks.values(), return_exceptions=True)
+        self._refresh_tasks.clear()
+
+    def close(self) -> None:
+        """Close the wrapped credential."""
+        self.credential.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The sources of the returned tokens and the refresh counters."""
+        return {
+            'memory_hits': self.memory_hits,
+            'file_hits': self.file_hits,
+            'acquired': self.acquired,
+            'refreshed': self.refreshed,
+            'refresh_failures': self.refresh_failures,
+        }
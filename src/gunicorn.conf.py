@@ -9,11 +9,15 @@ import json
 import logging
 import multiprocessing
 import os
+import subprocess
 import sys
+import threading
+import time
 
 from azure.ai.projects.aio import AIProjectClient
 from azure.ai.agents.models import (
     Agent,
+    AsyncFunctionTool,
     AsyncToolSet,
     AzureAISearchTool,
     FilePurpose,
@@ -26,6 +30,8 @@ from azure.core.credentials_async import AsyncTokenCredential
 
 from dotenv import load_dotenv
 
+from api.agent_cache import get_agent_cache, resolve_agent
+from api.preload import PROJECT_SCOPE, share_agent, share_token
 from logging_config import configure_logging
 
 load_dotenv()
@@ -64,6 +70,7 @@ async def create_index_maybe(
     :param ai_client: The project client to be used to create an index.
     :param creds: The credentials, used for the index.
     """
+    from api.embeddings_store import find_embeddings_file
     from api.search_index_manager import SearchIndexManager
     endpoint = os.environ.get('AZURE_AI_SEARCH_ENDPOINT')
     embedding = os.getenv('AZURE_AI_EMBED_DEPLOYMENT_NAME')    
@@ -94,8 +101,8 @@ async def create_index_maybe(
         if await search_mgr.create_index(
             vector_index_dimensions=int(
                 os.getenv('AZURE_AI_EMBED_DIMENSIONS'))):
-            embeddings_path = os.path.join(
-                os.path.dirname(__file__), 'data', 'embeddings.csv')
+            embeddings_path = find_embeddings_file(os.path.join(
+                os.path.dirname(__file__), 'data', 'embeddings.csv'))
 
             assert embeddings_path, f'File {embeddings_path} not found.'
             await search_mgr.upload_documents(embeddings_path)
@@ -126,6 +133,12 @@ async def get_available_tool(
     """
     # File name -> {"id": file_id, "path": file_path}
     file_ids: List[str] = []
+    # The workers search the embeddings file themselves, the remote index is not created.
+    if os.getenv("AZURE_AI_SEARCH_BACKEND", "azure").lower() == "local":
+        from api.local_search import create_search_tool
+        logger.info("agent: using the local search in the workers.")
+        return create_search_tool()
+
     # First try to get an index search.
     conn_id = ""
     if os.environ.get('AZURE_AI_SEARCH_INDEX_NAME'):
@@ -171,7 +184,12 @@ async def create_agent(ai_client: AIProjectClient,
     toolset = AsyncToolSet()
     toolset.add(tool)
     
-    instructions = "Use AI Search always. Avoid to use base knowledge." if isinstance(tool, AzureAISearchTool) else "Use File Search always.  Avoid to use base knowledge."
+    if isinstance(tool, AzureAISearchTool):
+        instructions = "Use AI Search always. Avoid to use base knowledge."
+    elif isinstance(tool, AsyncFunctionTool):
+        instructions = "Use the product catalog search always. Avoid to use base knowledge."
+    else:
+        instructions = "Use File Search always.  Avoid to use base knowledge."
     
     agent = await ai_client.agents.create_agent(
         model=os.environ["AZURE_AI_AGENT_DEPLOYMENT_NAME"],
@@ -182,7 +200,22 @@ async def create_agent(ai_client: AIProjectClient,
     return agent
 
 
+async def share_with_workers(agent: Agent, creds: AsyncTokenCredential) -> None:
+    """
+    Keep the agent and the project token for the forked workers.
+
+    :param agent: The resolved agent.
+    :param creds: The credentials, used to acquire the token.
+    """
+    share_agent(agent)
+    try:
+        share_token(PROJECT_SCOPE, await creds.get_token(PROJECT_SCOPE))
+    except Exception as e:
+        logger.warning(f"Failed to acquire the token for the workers: {e}")
+
+
 async def initialize_resources():
+    agent_cache = get_agent_cache()
     try:
         async with DefaultAzureCredential(
                 exclude_shared_token_cache_credential=True) as creds:
@@ -190,45 +223,143 @@ async def initialize_resources():
                 credential=creds,
                 endpoint=proj_endpoint
             ) as ai_client:
-                # If the environment already has AZURE_AI_AGENT_ID or AZURE_EXISTING_AGENT_ID, try
-                # fetching that agent
-                if agentID is not None:
-                    try:
-                        agent = await ai_client.agents.get_agent(
-                            agentID)
-                        logger.info(f"Found agent by ID: {agent.id}")
-                        return
-                    except Exception as e:
-                        logger.warning(
-                            "Could not retrieve agent by AZURE_EXISTING_AGENT_ID = "
-                            f"{agentID}, error: {e}")
-
-                # Check if an agent with the same name already exists
-                agent_list = ai_client.agents.list_agents()
-                if agent_list:
-                    async for agent_object in agent_list:
-                        if agent_object.name == os.environ[
-                                "AZURE_AI_AGENT_NAME"]:
-                            logger.info(
-                                "Found existing agent named "
-                                f"'{agent_object.name}'"
-                                f", ID: {agent_object.id}")
-                            os.environ["AZURE_EXISTING_AGENT_ID"] = agent_object.id
-                            return
-                        
-                # Create a new agent
-                agent = await create_agent(ai_client, creds)
+                # Find the agent by AZURE_AI_AGENT_ID or AZURE_EXISTING_AGENT_ID, by the ID cached
+                # for its name or, if the cached ID is stale, by listing the agents.
+                agent = await resolve_agent(
+                    ai_client.agents,
+                    endpoint=proj_endpoint,
+                    agent_name=os.environ["AZURE_AI_AGENT_NAME"],
+                    agent_id=agentID,
+                    cache=agent_cache)
+                if agent is not None:
+                    logger.info(f"Found agent '{agent.name}', ID: {agent.id}")
+                else:
+                    # Create a new agent
+                    agent = await create_agent(ai_client, creds)
+                    logger.info(f"Created agent, agent ID: {agent.id}")
                 os.environ["AZURE_EXISTING_AGENT_ID"] = agent.id
-                logger.info(f"Created agent, agent ID: {agent.id}")
+                # The workers and the next start find the agent by the cached ID.
+                if agent_cache and agent.name:
+                    agent_cache.set(proj_endpoint, agent.name, agent.id)
+                if os.getenv("SHARE_AGENT_WITH_WORKERS", "true").lower() == "true":
+                    await share_with_workers(agent, creds)
 
     except Exception as e:
         logger.info("Error creating agent: {e}", exc_info=True)
         raise RuntimeError(f"Failed to create the agent: {e}")
 
 
+evaluator_process = None
+evaluator_stop = threading.Event()
+# The evaluator, which has run longer than this, is restarted again after the initial delay.
+EVALUATOR_STABLE_TIME = 600.0
+
+
+def _spawn_evaluator() -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "api.evaluator"],
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    logger.info(f"Started evaluator process, PID: {process.pid}")
+    return process
+
+
+def supervise_evaluator(max_restarts: int, restart_delay: float) -> None:
+    """
+    Restart the evaluator process, which has failed, with the growing delay.
+
+    Without the evaluator the durable queue only grows, so every exit is logged as an error.
+    The evaluator, which has stopped by itself with the exit code 0, is not restarted.
+
+    :param max_restarts: The maximal number of the consecutive restarts.
+    :param restart_delay: The delay before the first restart in seconds, doubled on every restart.
+    """
+    global evaluator_process
+    restarts = 0
+    delay = restart_delay
+    while True:
+        started = time.monotonic()
+        code = evaluator_process.wait()
+        if evaluator_stop.is_set():
+            return
+        if time.monotonic() - started > EVALUATOR_STABLE_TIME:
+            restarts = 0
+            delay = restart_delay
+        if code == 0 or restarts >= max_restarts:
+            logger.error(
+                f"Evaluator process {evaluator_process.pid} exited with code {code}, "
+                "the queued evaluations are not submitted until it is started again.")
+            return
+        logger.error(
+            f"Evaluator process {evaluator_process.pid} exited with code {code}, restarting in {delay:.0f} seconds.")
+        if evaluator_stop.wait(delay):
+            return
+        evaluator_process = _spawn_evaluator()
+        restarts += 1
+        delay *= 2
+
+
+def start_evaluator() -> None:
+    """Start the evaluator process and its supervisor if the durable evaluation queue is configured."""
+    global evaluator_process
+    if os.getenv("EVALUATION_QUEUE_DB") and os.getenv(
+            "START_EVALUATOR_PROCESS", "true").lower() == "true":
+        evaluator_process = _spawn_evaluator()
+        threading.Thread(
+            target=supervise_evaluator,
+            args=(int(os.getenv("EVALUATOR_MAX_RESTARTS", "5")), float(os.getenv("EVALUATOR_RESTART_DELAY", "5"))),
+            name="evaluator-supervisor",
+            daemon=True).start()
+
+
+def stop_evaluator() -> None:
+    """Stop the evaluator process, the queued runs are kept for the next start."""
+    evaluator_stop.set()
+    if evaluator_process is not None:
+        evaluator_process.terminate()
+        evaluator_process.wait(timeout=30)
+
+
+shared_store = None
+
+
+def create_shared_store() -> None:
+    """
+    Create the embeddings store for the local search, which the workers memory-map read only,
+    so the memory of a worker does not grow with the catalog. With LOCAL_SEARCH_QUANTIZATION,
+    the quantization codes are built once in the store too. If it fails, every worker loads
+    the embeddings file itself.
+    """
+    global shared_store
+    if os.getenv("AZURE_AI_SEARCH_BACKEND", "azure").lower() != "local" or os.getenv(
+            "LOCAL_SEARCH_SHARE_EMBEDDINGS", "true").lower() != "true":
+        return
+    from api.embeddings_store import get_local_embeddings_file
+    from api import shared_store as store
+    pq_subspaces = os.getenv("LOCAL_SEARCH_PQ_SUBSPACES")
+    try:
+        shared_store = store.create_shared_store(
+            get_local_embeddings_file(),
+            os.getenv("LOCAL_SEARCH_SHARED_STORE_DIR") or None,
+            quantization=os.getenv("LOCAL_SEARCH_QUANTIZATION") or None,
+            pq_subspaces=int(pq_subspaces) if pq_subspaces else None)
+    except Exception as e:
+        logger.warning(f"Failed to create the shared embeddings store: {e}")
+
+
 def on_starting(server):
     """This code runs once before the workers will start."""
     asyncio.get_event_loop().run_until_complete(initialize_resources())
+    start_evaluator()
+    create_shared_store()
+    from api.main import preload_modules
+    preload_modules()
+
+
+def on_exit(server):
+    """Stop the evaluator process, the queued runs are kept for the next start, and remove the shared store."""
+    stop_evaluator()
+    from api.shared_store import remove_shared_store
+    remove_shared_store(shared_store)
 
 
 max_requests = 1000
@@ -245,7 +376,23 @@ if not os.getenv("RUNNING_IN_PRODUCTION"):
 # https://docs.gunicorn.org/en/stable/settings.html
 preload_app = True
 num_cpus = multiprocessing.cpu_count()
-workers = (num_cpus * 2) + 1
+# The chat is I/O bound: the workers mostly wait for the agent streams, each serving many of them
+# in its event loop. The default "cpu" profile keeps (2 x cores) + 1 workers. The opt-in "io" profile
+# runs one worker per core and relies on MAX_CONCURRENT_STREAMS to limit the streams of a worker,
+# so it limits them to IO_PROFILE_STREAMS per worker, unless MAX_CONCURRENT_STREAMS is set.
+# WEB_CONCURRENCY sets the number of workers explicitly,
+# benchmarks/load_test.py finds it for the given cores and memory.
+IO_PROFILE_STREAMS = "100"
+concurrency_profile = os.getenv("CONCURRENCY_PROFILE", "cpu").lower()
+if concurrency_profile == "io":
+    # The workers, forked later, read the limit from the environment.
+    os.environ.setdefault("MAX_CONCURRENT_STREAMS", IO_PROFILE_STREAMS)
+if os.getenv("WEB_CONCURRENCY"):
+    workers = int(os.environ["WEB_CONCURRENCY"])
+elif concurrency_profile == "io":
+    workers = max(2, num_cpus)
+else:
+    workers = (num_cpus * 2) + 1
 worker_class = "uvicorn.workers.UvicornWorker"
 
 timeout = 120
@@ -17,6 +17,9 @@ def configure_logging(log_file_name: Optional[str] = None, logger_name: str = "a
     :rtype: logging.Logger
     """
     logger = logging.getLogger(logger_name)
+    if logger.handlers:
+        # The logger was configured by gunicorn.conf.py, adding the handlers again would duplicate the records.
+        return logger
     logger.setLevel(logging.INFO)
 
     # Stream handler (stdout)
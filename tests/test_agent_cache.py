@@ -0,0 +1,111 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from azure.ai.agents.models import Agent
+from azure.core.exceptions import ResourceNotFoundError
+
+from api.agent_cache import AgentResolutionCache, resolve_agent
+
+ENDPOINT = "https://project.example.com"
+
+
+def get_agents_client(agents):
+    """Return the mock agents client with the given agents."""
+    async def list_agents():
+        for agent in agents:
+            yield agent
+
+    async def get_agent(agent_id):
+        for agent in agents:
+            if agent.id == agent_id:
+                return agent
+        raise ResourceNotFoundError(f"No agent {agent_id}")
+
+    client = MagicMock()
+    client.get_agent = AsyncMock(side_effect=get_agent)
+    client.list_agents = MagicMock(side_effect=list_agents)
+    return client
+
+
+class TestAgentCache(unittest.IsolatedAsyncioTestCase):
+    """Tests for the resolution of the agent name."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = AgentResolutionCache(os.path.join(self.dir.name, 'agents.json'))
+        self.agents = [Agent(id=f"asst_{i}", name=f"agent-{i}") for i in range(100)]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_persisted(self):
+        """Test that the entries are kept per endpoint and survive a new cache object."""
+        self.assertIsNone(self.cache.get(ENDPOINT, "agent-1"))
+        self.cache.set(ENDPOINT, "agent-1", "asst_1")
+        self.cache.set("https://other.example.com", "agent-1", "asst_2")
+        reloaded = AgentResolutionCache(self.cache.path)
+        self.assertEqual(reloaded.get(ENDPOINT, "agent-1"), "asst_1")
+        reloaded.invalidate(ENDPOINT, "agent-1")
+        self.assertIsNone(self.cache.get(ENDPOINT, "agent-1"))
+        self.assertEqual(self.cache.get("https://other.example.com", "agent-1"), "asst_2")
+
+    def test_corrupted_file(self):
+        """Test that the unreadable file is treated as empty."""
+        with open(self.cache.path, 'w') as f:
+            f.write("{not json")
+        self.assertIsNone(self.cache.get(ENDPOINT, "agent-1"))
+        self.cache.set(ENDPOINT, "agent-1", "asst_1")
+        self.assertEqual(self.cache.get(ENDPOINT, "agent-1"), "asst_1")
+
+    async def test_scan_then_cached(self):
+        """Test that the agent is listed once and then found by the cached ID."""
+        client = get_agents_client(self.agents)
+        agent = await resolve_agent(client, ENDPOINT, "agent-99", cache=self.cache)
+        self.assertEqual(agent.id, "asst_99")
+        self.assertEqual(client.list_agents.call_count, 1)
+
+        client = get_agents_client(self.agents)
+        agent = await resolve_agent(client, ENDPOINT, "agent-99", cache=self.cache)
+        self.assertEqual(agent.id, "asst_99")
+        client.list_agents.assert_not_called()
+        client.get_agent.assert_awaited_once_with("asst_99")
+
+    async def test_configured_id(self):
+        """Test that the configured ID is used without the cache."""
+        client = get_agents_client(self.agents)
+        agent = await resolve_agent(client, ENDPOINT, "agent-1", agent_id="asst_5", cache=self.cache)
+        self.assertEqual(agent.id, "asst_5")
+        client.list_agents.assert_not_called()
+
+    async def test_stale_id(self):
+        """Test that the stale IDs fall back to the scan, which updates the cache."""
+        self.cache.set(ENDPOINT, "agent-7", "asst_deleted")
+        client = get_agents_client(self.agents)
+        agent = await resolve_agent(client, ENDPOINT, "agent-7", agent_id="asst_gone", cache=self.cache)
+        self.assertEqual(agent.id, "asst_7")
+        self.assertEqual(client.list_agents.call_count, 1)
+        self.assertEqual(self.cache.get(ENDPOINT, "agent-7"), "asst_7")
+
+    async def test_renamed(self):
+        """Test that the cached ID of an agent with another name is not used."""
+        self.cache.set(ENDPOINT, "agent-7", "asst_8")
+        client = get_agents_client(self.agents)
+        agent = await resolve_agent(client, ENDPOINT, "agent-7", cache=self.cache)
+        self.assertEqual(agent.id, "asst_7")
+        self.assertEqual(self.cache.get(ENDPOINT, "agent-7"), "asst_7")
+
+    async def test_not_found(self):
+        """Test that None is returned and nothing is cached if no agent has the name."""
+        client = get_agents_client(self.agents)
+        self.assertIsNone(await resolve_agent(client, ENDPOINT, "missing", cache=self.cache))
+        self.assertIsNone(self.cache.get(ENDPOINT, "missing"))
+        self.assertIsNone(await resolve_agent(client, ENDPOINT, None, agent_id="asst_gone"))
+
+
+if __name__ == "__main__":
+    unittest.main()
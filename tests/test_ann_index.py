@@ -0,0 +1,126 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from api import ann_index
+from api.ann_index import IVFIndex, index_path
+from api.local_search import LocalSearchIndex
+
+
+class TestIVFIndex(unittest.TestCase):
+    """Tests for the inverted file index."""
+
+    EMBEDDINGS_FILE = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'src', 'api', 'data', 'embeddings.csv')
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((20, 16)).astype(np.float32)
+        vectors = centers[rng.integers(0, 20, 2000)] + 0.3 * rng.standard_normal((2000, 16)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def _local_index(self, index=None, **kwargs):
+        return LocalSearchIndex(
+            [str(i) for i in range(len(self.vectors))], [''] * len(self.vectors), self.vectors,
+            model="mock_embedding_model", ann_index=index, **kwargs)
+
+    def test_build(self):
+        """Test that every row is in exactly one list."""
+        index = IVFIndex.build(self.vectors, lists=20)
+        self.assertEqual(index.lists, 20)
+        self.assertEqual(len(index), 2000)
+        self.assertListEqual(sorted(index.rows.tolist()), list(range(2000)))
+        self.assertEqual(index.offsets[0], 0)
+        self.assertEqual(index.offsets[-1], 2000)
+        self.assertEqual(IVFIndex.default_lists(10000), 400)
+        self.assertEqual(IVFIndex.default_lists(3), 3)
+
+    def test_candidates(self):
+        """Test that the candidates are the sorted rows of the probed lists and all of them for all lists."""
+        index = IVFIndex.build(self.vectors, lists=20)
+        candidates = index.candidates(self.vectors[0], nprobe=2)
+        self.assertIn(0, candidates)
+        self.assertTrue(np.all(np.diff(candidates) > 0))
+        self.assertLess(len(candidates), 2000)
+        self.assertListEqual(index.candidates(self.vectors[0], nprobe=100).tolist(), list(range(2000)))
+
+    def test_recall(self):
+        """Test that the approximate search finds most of the exact results and all of them with all lists."""
+        exact = self._local_index()
+        approximate = self._local_index(IVFIndex.build(self.vectors, lists=40), nprobe=4)
+        complete = self._local_index(IVFIndex.build(self.vectors, lists=40), nprobe=40)
+        found = 0
+        for query in self.vectors[:50]:
+            expected = {row for row, _ in exact.query(query, top_k=5)}
+            found += len(expected & {row for row, _ in approximate.query(query, top_k=5)})
+            self.assertEqual(complete.query(query, top_k=5), exact.query(query, top_k=5))
+        self.assertGreater(found / 250, 0.9)
+
+    def test_save_load(self):
+        """Test that the saved index is memory-mapped at load and gives the same candidates."""
+        index = IVFIndex.build(self.vectors, lists=20)
+        with tempfile.TemporaryDirectory() as d:
+            embeddings_file = os.path.join(d, 'embeddings.npy')
+            np.save(embeddings_file, self.vectors)
+            self.assertIsNone(IVFIndex.load(embeddings_file))
+            index.save(embeddings_file)
+            self.assertTrue(os.path.isfile(os.path.join(d, 'embeddings.ivf_rows.npy')))
+            loaded = IVFIndex.load(embeddings_file)
+            self.assertIsInstance(loaded.rows, np.memmap)
+            np.testing.assert_array_equal(
+                loaded.candidates(self.vectors[3], nprobe=3), index.candidates(self.vectors[3], nprobe=3))
+            del loaded
+
+    def test_load_stale(self):
+        """Test that the index of the rebuilt embeddings file and the index without the fingerprint are ignored."""
+        index = IVFIndex.build(self.vectors, lists=20)
+        with tempfile.TemporaryDirectory() as d:
+            embeddings_file = os.path.join(d, 'embeddings.npy')
+            np.save(embeddings_file, self.vectors)
+            index.save(embeddings_file)
+            # The copy with another modification time has the same content.
+            stat = os.stat(embeddings_file)
+            os.utime(embeddings_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual(len(IVFIndex.load(embeddings_file, mmap=False)), 2000)
+            # The same number of rows, but another content.
+            np.save(embeddings_file, self.vectors[::-1])
+            with self.assertLogs("azureaiapp", level="WARNING") as logs:
+                self.assertIsNone(IVFIndex.load(embeddings_file))
+            self.assertIn("The IVF index was built for another version", logs.output[0])
+            index.save(embeddings_file)
+            self.assertEqual(len(IVFIndex.load(embeddings_file, mmap=False)), 2000)
+            os.remove(index_path(embeddings_file, 'fingerprint'))
+            with self.assertLogs("azureaiapp", level="WARNING"):
+                self.assertIsNone(IVFIndex.load(embeddings_file))
+
+    def test_main(self):
+        """Test that the command line builds the index next to the bundled embeddings."""
+        with tempfile.TemporaryDirectory() as d:
+            embeddings_file = os.path.join(d, 'embeddings.csv')
+            shutil.copy(self.EMBEDDINGS_FILE, embeddings_file)
+            ann_index.main([embeddings_file, '--lists', '8'])
+            self.assertTrue(os.path.isfile(index_path(embeddings_file, 'centroids')))
+            index = LocalSearchIndex.from_file(
+                embeddings_file, model="mock_embedding_model",
+                ann_index=IVFIndex.load(embeddings_file, mmap=False), nprobe=8)
+            self.assertEqual(len(index.query(index.embeddings[0], top_k=5)), 5)
+
+    def test_invalid(self):
+        """Test that the stale index and the index with quantization are rejected."""
+        index = IVFIndex.build(self.vectors[:100], lists=5)
+        with self.assertRaisesRegex(ValueError, "The IVF index has 100 rows for 2000 embeddings.+"):
+            self._local_index(index)
+        with self.assertRaisesRegex(ValueError, "The IVF index cannot be combined.+"):
+            self._local_index(IVFIndex.build(self.vectors, lists=5), quantization='int8')
+        with self.assertRaisesRegex(ValueError, "The offsets must.+"):
+            IVFIndex(index.centroids, index.rows, index.offsets[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
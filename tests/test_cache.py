@@ -0,0 +1,82 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import unittest
+
+from api.cache import TTLCache
+
+
+class MockTimer:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    """Tests for the TTL and LRU cache."""
+
+    def setUp(self) -> None:
+        self.timer = MockTimer()
+        unittest.TestCase.setUp(self)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        cache = TTLCache(max_size=2, ttl=None, timer=self.timer)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertEqual(cache.stats['hits'], 3)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['hit_rate'], 0.75)
+
+    def test_ttl(self):
+        """Test that the entries expire."""
+        cache = TTLCache(ttl=10, timer=self.timer)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=20)
+        self.timer.now = 9.9
+        self.assertEqual(cache.get('a'), 1)
+        self.timer.now = 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats['expirations'], 1)
+
+    def test_memory_bound(self):
+        """Test that the entries are evicted when the values exceed max_bytes."""
+        cache = TTLCache(max_bytes=10, sizeof=len, timer=self.timer)
+        cache.set('a', 'x' * 4)
+        cache.set('b', 'x' * 4)
+        cache.set('c', 'x' * 4)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.stats['bytes'], 8)
+        cache.set('d', 'x' * 11)
+        self.assertNotIn('d', cache)
+        self.assertEqual(cache.stats['evictions'], 2)
+        cache.set('b', 'x')
+        self.assertEqual(cache.stats['bytes'], 5)
+
+    def test_pop_and_clear(self):
+        """Test the removal of entries."""
+        cache = TTLCache(timer=self.timer)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        with self.assertRaisesRegex(ValueError, "max_size must be positive."):
+            TTLCache(max_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from api import embeddings_store
+from api.embeddings_store import Embeddings
+from api.local_search import LocalSearchIndex
+
+
+class TestEmbeddingsStore(unittest.TestCase):
+    """Tests for the binary embeddings format."""
+
+    EMBEDDINGS_FILE = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'src', 'data', 'embeddings.csv')
+
+    def setUp(self) -> None:
+        self._dir = tempfile.mkdtemp()
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self._dir)
+        unittest.TestCase.tearDown(self)
+
+    def test_convert_round_trip(self):
+        """Test that the binary file contains the same data as the csv file."""
+        csv_file = os.path.join(self._dir, 'embeddings.csv')
+        shutil.copy(self.EMBEDDINGS_FILE, csv_file)
+        self.assertEqual(embeddings_store.find_embeddings_file(csv_file), csv_file)
+
+        npy_file = embeddings_store.convert_csv(csv_file)
+        self.assertEqual(npy_file, os.path.join(self._dir, 'embeddings.npy'))
+        self.assertTrue(os.path.isfile(os.path.join(self._dir, 'embeddings.json')))
+        self.assertEqual(embeddings_store.find_embeddings_file(csv_file), npy_file)
+        # The csv file, regenerated after the conversion, is used instead of the stale binary file.
+        mtime = os.path.getmtime(npy_file)
+        os.utime(csv_file, (mtime + 10, mtime + 10))
+        self.assertEqual(embeddings_store.find_embeddings_file(csv_file), csv_file)
+        os.utime(csv_file, (mtime, mtime))
+        self.assertEqual(embeddings_store.find_embeddings_file(csv_file), npy_file)
+
+        expected = embeddings_store.load_embeddings(csv_file)
+        actual = embeddings_store.load_embeddings(npy_file)
+        self.assertIsInstance(actual.vectors, np.memmap)
+        self.assertListEqual(list(actual.tokens), list(expected.tokens))
+        self.assertListEqual(list(actual.titles), list(expected.titles))
+        np.testing.assert_array_equal(actual.vectors, expected.vectors)
+        self.assertListEqual(list(actual.rows()), list(expected.rows()))
+
+    def test_save_by_extension(self):
+        """Test that the format is chosen by the file extension."""
+        embeddings = Embeddings(['a', 'b'], ['a.md', 'b.md'], np.array([[0.5, 1], [1, 0.25]], dtype=np.float32))
+        for name in ('out.csv', 'out.npy'):
+            out_file = os.path.join(self._dir, name)
+            embeddings_store.save_embeddings(embeddings, out_file)
+            loaded = embeddings_store.load_embeddings(out_file)
+            self.assertListEqual(list(loaded.rows()), list(embeddings.rows()))
+
+    def test_local_search_zero_copy(self):
+        """Test that the local index uses the memory-mapped normalized matrix without copying."""
+        npy_file = embeddings_store.convert_csv(
+            self.EMBEDDINGS_FILE, os.path.join(self._dir, 'embeddings.npy'))
+        embeddings = embeddings_store.load_embeddings(npy_file)
+        index = LocalSearchIndex(
+            embeddings.tokens, embeddings.titles, embeddings.vectors, model="mock_embedding_model")
+        self.assertTrue(np.shares_memory(index.embeddings, embeddings.vectors))
+        self.assertEqual(index.query(index.embeddings[3], top_k=1)[0][0], 3)
+
+    def test_mismatched_columns(self):
+        """Test that the matrix must have one row per token."""
+        with self.assertRaisesRegex(ValueError, "The embeddings matrix must have one row per token and title."):
+            Embeddings(['a'], ['a.md'], np.zeros((2, 3), dtype=np.float32))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from api.evaluation import EvaluationScheduler, SqliteEvaluationQueue, submit_evaluations
+from api.evaluator import drain_queue
+
+
+class TestEvaluationScheduler(unittest.IsolatedAsyncioTestCase):
+    """Tests for the background evaluation of the runs."""
+
+    async def test_batches_and_drain(self):
+        """Test that the queued runs are submitted in batches and drained on close."""
+        batches = []
+
+        async def submit(runs):
+            batches.append(runs)
+            await asyncio.sleep(0)
+            return []
+
+        scheduler = EvaluationScheduler(submit, max_queue_size=10, workers=1, batch_size=3)
+        scheduler.start()
+        for i in range(7):
+            self.assertTrue(scheduler.schedule("thread_1", f"run_{i}"))
+        await scheduler.close(timeout=1)
+        self.assertListEqual([len(batch) for batch in batches], [3, 3, 1])
+        self.assertEqual(batches[0][0], ("thread_1", "run_0"))
+        self.assertEqual(scheduler.stats['submitted'], 7)
+        self.assertEqual(scheduler.stats['queue_depth'], 0)
+        self.assertFalse(scheduler.schedule("thread_1", "run_8"))
+        self.assertEqual(scheduler.dropped, 1)
+
+    async def test_queue_full(self):
+        """Test that the runs are dropped instead of waiting when the queue is full."""
+        release = asyncio.Event()
+
+        async def submit(runs):
+            await release.wait()
+            return runs
+
+        scheduler = EvaluationScheduler(submit, max_queue_size=2, workers=1, batch_size=1)
+        scheduler.start()
+        scheduler.schedule("thread_1", "run_0")
+        await asyncio.sleep(0)
+        results = [scheduler.schedule("thread_1", f"run_{i}") for i in range(1, 5)]
+        self.assertListEqual(results, [True, True, False, False])
+        self.assertEqual(scheduler.stats['queue_depth'], 2)
+        self.assertEqual(scheduler.stats['dropped'], 2)
+        release.set()
+        await scheduler.close(timeout=1)
+        self.assertEqual(scheduler.stats['failed'], 3)
+
+    async def test_sampling(self):
+        """Test that only the sampled runs are queued."""
+        values = iter([0.1, 0.5, 0.9])
+        scheduler = EvaluationScheduler(AsyncMock(return_value=[]), sampling_percent=50, rand=lambda: next(values))
+        self.assertListEqual([scheduler.schedule("thread_1", f"run_{i}") for i in range(3)], [True, False, False])
+        self.assertEqual(scheduler.stats['sampled_out'], 2)
+
+    async def test_submit_evaluations(self):
+        """Test that the runs of the batch are submitted separately and the failures are counted."""
+        ai_project = MagicMock()
+        ai_project.evaluations.create_agent_evaluation = AsyncMock(side_effect=[None, Exception("error")])
+        failed = await submit_evaluations(ai_project, "conn_str", [("thread_1", "run_1"), ("thread_1", "run_2")])
+        self.assertListEqual(failed, [("thread_1", "run_2")])
+        request = ai_project.evaluations.create_agent_evaluation.await_args_list[0].kwargs['evaluation']
+        self.assertEqual(request.run_id, "run_1")
+        self.assertEqual(request.app_insights_connection_string, "conn_str")
+
+
+class TestSqliteEvaluationQueue(unittest.IsolatedAsyncioTestCase):
+    """Tests for the durable evaluation queue."""
+
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'evaluations.db')
+        self.now = [1000.0]
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+        unittest.TestCase.tearDown(self)
+
+    def _get_queue(self):
+        return SqliteEvaluationQueue(self.path, max_attempts=2, retry_delay=60, timer=lambda: self.now[0])
+
+    async def test_runs_survive_restart(self):
+        """Test that the queued runs are kept until they are acknowledged."""
+        worker = self._get_queue()
+        for i in range(3):
+            self.assertTrue(worker.schedule("thread_1", f"run_{i}"))
+        await worker.close()
+        self.assertEqual(worker.scheduled, 3)
+
+        evaluator = self._get_queue()
+        batch = evaluator.take(2)
+        self.assertListEqual([run for _, run in batch], [("thread_1", "run_0"), ("thread_1", "run_1")])
+        evaluator.ack([batch[0][0]])
+        self.assertListEqual([run for _, run in evaluator.take(10)][:1], [("thread_1", "run_1")])
+        self.assertEqual(len(evaluator), 2)
+        await evaluator.close()
+
+    async def test_schedule_does_not_wait_for_lock(self):
+        """Test that the run is scheduled at once while the evaluator holds the write lock."""
+        queue = self._get_queue()
+        evaluator = sqlite3.connect(self.path, isolation_level=None)
+        evaluator.execute("BEGIN IMMEDIATE")
+        start = time.monotonic()
+        self.assertTrue(queue.schedule("thread_1", "run_0"))
+        self.assertLess(time.monotonic() - start, 0.1)
+        await asyncio.sleep(0.1)
+        self.assertEqual(queue.scheduled, 0)
+        evaluator.execute("COMMIT")
+        evaluator.close()
+        await queue.flush()
+        self.assertEqual(queue.scheduled, 1)
+        self.assertEqual(len(queue), 1)
+        await queue.close()
+
+    async def test_retry(self):
+        """Test that the failed runs are delayed and removed after max_attempts."""
+        queue = self._get_queue()
+        queue.schedule("thread_1", "run_0")
+        queue.schedule("thread_1", "run_1")
+        await queue.flush()
+        failing = [i for i, run in queue.take(10) if run[1] == "run_0"]
+        queue.retry(failing)
+        self.assertListEqual([run[1] for _, run in queue.take(10)], ["run_1"])
+        self.now[0] += 61
+        self.assertListEqual([run[1] for _, run in queue.take(10)], ["run_0", "run_1"])
+        queue.retry(failing)
+        self.assertEqual(len(queue), 1)
+        await queue.close()
+
+    async def test_drain_queue(self):
+        """Test that the evaluator submits the queued runs in batches and retries the failed ones."""
+        queue = self._get_queue()
+        for i in range(5):
+            queue.schedule("thread_1", f"run_{i}")
+        await queue.flush()
+        stop = asyncio.Event()
+        batches = []
+
+        async def submit(runs):
+            batches.append(runs)
+            if len(queue) == 1:
+                stop.set()
+            return [run for run in runs if run[1] == "run_4"]
+
+        await asyncio.wait_for(drain_queue(queue, submit, stop, batch_size=2, poll_interval=0.01), timeout=5)
+        self.assertListEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertListEqual([run[1] for _, run in queue.take(10)], [])
+        self.now[0] += 61
+        self.assertListEqual([run[1] for _, run in queue.take(10)], ["run_4"])
+        await queue.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
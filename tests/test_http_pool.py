@@ -0,0 +1,62 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import asyncio
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from api.http_pool import HttpPool
+
+
+class TestHttpPool(unittest.IsolatedAsyncioTestCase):
+    """Tests for the shared connection pool."""
+
+    async def asyncSetUp(self) -> None:
+        async def handler(request):
+            await asyncio.sleep(0.05)
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get("/", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self) -> None:
+        await self.server.close()
+
+    async def _get(self, session):
+        async with session.get(self.server.make_url("/")) as response:
+            return await response.text()
+
+    async def test_stats(self):
+        """Test that the connections are reused and the requests, waiting for a connection, are counted."""
+        pool = HttpPool(limit=1)
+        session = pool.open()
+        self.assertListEqual(await asyncio.gather(self._get(session), self._get(session)), ["ok", "ok"])
+        await self._get(session)
+        stats = pool.stats
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections_created'], 1)
+        self.assertEqual(stats['connections_reused'], 2)
+        self.assertEqual(stats['queued'], 1)
+        self.assertGreater(stats['max_queue_wait_ms'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+        await pool.close()
+
+    async def test_transport_shares_session(self):
+        """Test that the clients share the session and do not close it."""
+        pool = HttpPool()
+        first = pool.transport()
+        second = pool.transport()
+        self.assertIs(first.session, second.session)
+        async with first:
+            pass
+        self.assertFalse(pool.session.closed)
+        await pool.close()
+        self.assertIsNone(pool.session)
+
+
+if __name__ == "__main__":
+    unittest.main()
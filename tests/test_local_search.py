@@ -0,0 +1,130 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+
+from api.local_search import LocalSearchIndex, create_search_tool
+from api.quantization import build_quantization
+
+
+class TestLocalSearchIndex(unittest.IsolatedAsyncioTestCase):
+    """Tests for the in-process vector search."""
+
+    EMBEDDINGS_FILE = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'src', 'api', 'data', 'embeddings.csv')
+
+    def _get_index(self, embedding_client=None):
+        """Return the index with three orthogonal documents."""
+        return LocalSearchIndex(
+            tokens=['a', 'b', 'c'],
+            titles=['a.md', 'b.md', 'c.md'],
+            embeddings=np.array([[1, 0, 0], [0, 2, 0], [0, 0, 3]], dtype=np.float32),
+            model="mock_embedding_model",
+            dimensions=3,
+            embedding_client=embedding_client
+        )
+
+    def test_query_cosine_order(self):
+        """Test that the results are ordered by cosine similarity, not by the dot product."""
+        index = self._get_index()
+        hits = index.query([1, 0.5, 0.4], top_k=2)
+        self.assertListEqual([row for row, _ in hits], [0, 1])
+        self.assertAlmostEqual(hits[0][1], 1 / np.linalg.norm([1, 0.5, 0.4]), places=5)
+        self.assertEqual(len(index.query([1, 1, 1], top_k=10)), 3)
+        self.assertListEqual(index.query([1, 1, 1], top_k=0), [])
+
+    def test_query_matches_brute_force(self):
+        """Test the vectorized query against the exhaustive search on the bundled embeddings."""
+        index = LocalSearchIndex.from_file(self.EMBEDDINGS_FILE, model="mock_embedding_model")
+        with open(self.EMBEDDINGS_FILE, newline='') as fp:
+            vectors = [json.loads(row['embedding']) for row in csv.DictReader(fp)]
+        self.assertEqual(len(index), len(vectors))
+        query = vectors[42]
+        expected = sorted(
+            range(len(vectors)),
+            key=lambda i: -np.dot(vectors[i], query) / (np.linalg.norm(vectors[i]) * np.linalg.norm(query)))
+        self.assertListEqual([row for row, _ in index.query(query, top_k=5)], expected[:5])
+
+    def test_quantized_query(self):
+        """Test that the quantized first pass, re-ranked exactly, finds the nearest row with the exact scores."""
+        exact = LocalSearchIndex.from_file(self.EMBEDDINGS_FILE, model="mock_embedding_model")
+        rng = np.random.default_rng(0)
+        queries = exact.embeddings[rng.integers(0, len(exact), 20)] + rng.normal(scale=0.01, size=(20, 100))
+        for quantization in ('int8', 'pq'):
+            index = LocalSearchIndex.from_file(
+                self.EMBEDDINGS_FILE, model="mock_embedding_model", quantization=quantization)
+            self.assertLess(index.nbytes, exact.nbytes / 3)
+            for query in queries:
+                expected = exact.query(query, top_k=5)
+                hits = index.query(query, top_k=5)
+                # The bundled file has duplicate chunks, so the rows of the equal scores may differ.
+                self.assertAlmostEqual(hits[0][1], expected[0][1], places=5)
+                self.assertEqual(len(hits), 5)
+                for row, score in hits:
+                    self.assertAlmostEqual(score, float(np.dot(exact.embeddings[row], query / np.linalg.norm(query))),
+                                           places=5)
+
+    def test_quantized_offline(self):
+        """Test that the codes, built offline, are used as is and the stale codes are rejected."""
+        exact = LocalSearchIndex.from_file(self.EMBEDDINGS_FILE, model="mock_embedding_model")
+        quantizer, codes = build_quantization(exact.embeddings, 'int8')
+        index = LocalSearchIndex.from_file(
+            self.EMBEDDINGS_FILE, model="mock_embedding_model", quantization='pq', quantized=(quantizer, codes))
+        self.assertIs(index._codes, codes)
+        query = exact.embeddings[42]
+        self.assertAlmostEqual(index.query(query, top_k=1)[0][1], exact.query(query, top_k=1)[0][1], places=5)
+        with self.assertRaisesRegex(ValueError, "The quantization codes have 100 rows for 953 embeddings.+"):
+            LocalSearchIndex.from_file(
+                self.EMBEDDINGS_FILE, model="mock_embedding_model", quantized=(quantizer, codes[:100]))
+
+    async def test_search_format(self):
+        """Test that the local search returns the same format as the remote one."""
+        embedding_client = AsyncMock()
+        embedding_client.embed.return_value = {'data': [{'embedding': [0, 0.1, 1]}]}
+        index = self._get_index(embedding_client)
+        result = await index.search('test', top_k=2)
+        self.assertEqual(result, "c, source: c.md\n------\nb, source: b.md")
+        embedding_client.embed.assert_called_once_with(
+            input=['test'], dimensions=3, model="mock_embedding_model")
+
+    async def test_search_no_embedding_client(self):
+        """Test that the search without the embedding client raises the error."""
+        with self.assertRaisesRegex(ValueError, "The embedding client is needed.+"):
+            await self._get_index().search('test')
+
+    async def test_search_tool(self):
+        """Test that the function tool defines the search for the agent and calls the index."""
+        embedding_client = AsyncMock()
+        embedding_client.embed.return_value = {'data': [{'embedding': [0, 0.1, 1]}]}
+        tool = create_search_tool(self._get_index(embedding_client))
+        function = tool.definitions[0].function
+        self.assertEqual(function.name, "search_product_catalog")
+        self.assertListEqual(function.parameters['required'], ['query'])
+        tool_call = MagicMock()
+        tool_call.function.name = "search_product_catalog"
+        tool_call.function.arguments = '{"query": "test"}'
+        result = await tool.execute(tool_call)
+        self.assertTrue(result.startswith("c, source: c.md"))
+        # The tool without the index only defines the function.
+        self.assertIn("not loaded", await create_search_tool().execute(tool_call))
+
+    def test_from_csv_empty(self):
+        """Test that the file without rows gives an empty index."""
+        with tempfile.TemporaryDirectory() as d:
+            out_file = os.path.join(d, 'embeddings.csv')
+            with open(out_file, 'w', newline='') as fp:
+                csv.DictWriter(fp, fieldnames=['token', 'embedding', 'title']).writeheader()
+            index = LocalSearchIndex.from_file(out_file, model="mock_embedding_model", dimensions=3)
+        self.assertEqual(len(index), 0)
+        self.assertListEqual(index.query([1, 0, 0]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
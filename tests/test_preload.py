@@ -0,0 +1,53 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from azure.ai.agents.models import Agent
+from azure.core.credentials import AccessToken
+
+from api import preload
+from api.preload import PROJECT_SCOPE, SharedTokenCredential, get_shared_agent, share_agent, share_token
+
+
+class TestPreload(unittest.TestCase):
+    """Tests for the state, shared by the gunicorn master with the workers."""
+
+    def setUp(self):
+        patcher = patch.multiple(preload, _agent=None, _tokens={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared_agent(self):
+        """Test that the worker gets the copy of the agent with the expected ID only."""
+        self.assertIsNone(get_shared_agent("asst_1"))
+        share_agent(Agent(id="asst_1", name="agent", model="gpt-4o-mini", instructions="Use AI Search always."))
+        agent = get_shared_agent("asst_1")
+        self.assertEqual(agent.model, "gpt-4o-mini")
+        self.assertEqual(agent.instructions, "Use AI Search always.")
+        agent.name = "changed"
+        self.assertEqual(get_shared_agent("asst_1").name, "agent")
+        self.assertIsNone(get_shared_agent("asst_2"))
+        self.assertIsNone(get_shared_agent(None))
+
+    def test_shared_token(self):
+        """Test that the shared token is returned until it is about to expire."""
+        inner = MagicMock()
+        inner.get_token.return_value = AccessToken("worker", int(time.time()) + 3600)
+        credential = SharedTokenCredential(inner)
+        self.assertEqual(credential.get_token(PROJECT_SCOPE).token, "worker")
+
+        share_token(PROJECT_SCOPE, AccessToken("master", int(time.time()) + 3600))
+        self.assertEqual(credential.get_token(PROJECT_SCOPE).token, "master")
+        self.assertEqual(credential.get_token("https://search.azure.com/.default").token, "worker")
+        self.assertEqual(credential.get_token(PROJECT_SCOPE, claims="{}").token, "worker")
+
+        share_token(PROJECT_SCOPE, AccessToken("master", int(time.time()) + 60))
+        self.assertEqual(credential.get_token(PROJECT_SCOPE).token, "worker")
+        self.assertEqual(inner.get_token.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
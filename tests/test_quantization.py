@@ -0,0 +1,129 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from api import quantization
+from api.quantization import (
+    ProductQuantizer,
+    ScalarQuantizer,
+    build_quantization,
+    create_quantizer,
+    load_quantization,
+    quantization_path,
+    save_quantization,
+)
+
+
+class TestQuantization(unittest.TestCase):
+    """Tests for the int8 and the product quantizers."""
+
+    EMBEDDINGS_FILE = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'src', 'api', 'data', 'embeddings.csv')
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((500, 16)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+        self.query = self.vectors[7]
+
+    def test_scalar_scores(self):
+        """Test that the int8 scores are close to the exact dot products."""
+        quantizer = ScalarQuantizer().fit(self.vectors)
+        codes = quantizer.encode(self.vectors)
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual(codes.shape, self.vectors.shape)
+        np.testing.assert_allclose(quantizer.scores(codes, self.query), self.vectors @ self.query, atol=0.02)
+
+    def test_scalar_constant_dimension(self):
+        """Test that the dimension with the same value everywhere is encoded exactly."""
+        vectors = np.array([[0.5, 0.0], [0.5, 1.0]], dtype=np.float32)
+        quantizer = ScalarQuantizer().fit(vectors)
+        scores = quantizer.scores(quantizer.encode(vectors), np.array([1, 0], dtype=np.float32))
+        np.testing.assert_allclose(scores, [0.5, 0.5], atol=1e-6)
+
+    def test_product_scores(self):
+        """Test that the product quantized scores rank the query vector itself first."""
+        quantizer = ProductQuantizer(subspaces=8, centroids=64).fit(self.vectors)
+        codes = quantizer.encode(self.vectors)
+        self.assertEqual(codes.dtype, np.uint8)
+        self.assertEqual(codes.shape, (8, 500))
+        scores = quantizer.scores(codes, self.query)
+        self.assertEqual(int(np.argmax(scores)), 7)
+        self.assertLess(float(np.abs(scores - self.vectors @ self.query).mean()), 0.1)
+
+    def test_product_uneven_subspaces(self):
+        """Test that the dimensions, which are not divisible by the subspaces, are all encoded."""
+        quantizer = ProductQuantizer(subspaces=5).fit(self.vectors[:100])
+        self.assertEqual(quantizer.bounds, [0, 3, 6, 9, 12, 16])
+        # Fewer vectors than centroids, so every vector is a centroid.
+        scores = quantizer.scores(quantizer.encode(self.vectors[:100]), self.query)
+        np.testing.assert_allclose(scores, self.vectors[:100] @ self.query, atol=1e-5)
+
+    def test_blocks(self):
+        """Test that the result does not depend on the size of the blocks."""
+        quantizer = ScalarQuantizer().fit(self.vectors)
+        expected = quantizer.scores(quantizer.encode(self.vectors), self.query)
+        with patch.object(quantization, 'BLOCK_ROWS', 64):
+            quantizer = ScalarQuantizer().fit(self.vectors)
+            scores = quantizer.scores(quantizer.encode(self.vectors), self.query)
+        np.testing.assert_allclose(scores, expected, atol=1e-6)
+
+    def test_create_quantizer(self):
+        """Test the quantizer kinds and the default number of subspaces."""
+        self.assertIsInstance(create_quantizer('int8', 100), ScalarQuantizer)
+        self.assertEqual(create_quantizer('pq', 100).subspaces, 25)
+        self.assertEqual(create_quantizer('pq', 100, subspaces=10).subspaces, 10)
+        with self.assertRaisesRegex(ValueError, "Unknown quantization.+"):
+            create_quantizer('fp16', 100)
+        with self.assertRaisesRegex(ValueError, "The number of subspaces.+"):
+            ProductQuantizer(subspaces=17).fit(self.vectors)
+
+    def test_save_load(self):
+        """Test that the saved codes are memory-mapped at load and give the same scores."""
+        with tempfile.TemporaryDirectory() as d:
+            embeddings_file = os.path.join(d, 'embeddings.npy')
+            np.save(embeddings_file, self.vectors)
+            for kind in ('int8', 'pq'):
+                self.assertIsNone(load_quantization(embeddings_file, kind))
+                quantizer, codes = build_quantization(self.vectors, kind, subspaces=5)
+                save_quantization(embeddings_file, kind, quantizer, codes)
+                self.assertTrue(os.path.isfile(os.path.join(d, f'embeddings.{kind}_codes.npy')))
+                loaded, loaded_codes = load_quantization(embeddings_file, kind)
+                self.assertIsInstance(loaded_codes, np.memmap)
+                self.assertEqual(loaded.rows(loaded_codes), 500)
+                np.testing.assert_allclose(
+                    loaded.scores(loaded_codes, self.query), quantizer.scores(codes, self.query), atol=1e-6)
+                del loaded_codes
+            self.assertEqual(loaded.bounds, [0, 3, 6, 9, 12, 16])
+            with self.assertRaisesRegex(ValueError, "Unknown quantization.+"):
+                load_quantization(embeddings_file, 'fp16')
+            # The copy with another modification time has the same content.
+            stat = os.stat(embeddings_file)
+            os.utime(embeddings_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertIsNotNone(load_quantization(embeddings_file, 'pq', mmap=False))
+            np.save(embeddings_file, self.vectors[::-1])
+            with self.assertLogs("azureaiapp", level="WARNING") as logs:
+                self.assertIsNone(load_quantization(embeddings_file, 'pq'))
+            self.assertIn("The pq codes were built for another version", logs.output[0])
+
+    def test_main(self):
+        """Test that the command line builds the codes next to the bundled embeddings."""
+        with tempfile.TemporaryDirectory() as d:
+            embeddings_file = os.path.join(d, 'embeddings.csv')
+            shutil.copy(self.EMBEDDINGS_FILE, embeddings_file)
+            quantization.main([embeddings_file, '--kind', 'pq', '--subspaces', '10'])
+            self.assertTrue(os.path.isfile(quantization_path(embeddings_file, 'pq', 'codebooks')))
+            quantizer, codes = load_quantization(embeddings_file, 'pq', mmap=False)
+            self.assertEqual(quantizer.subspaces, 10)
+            self.assertEqual(codes.shape, (10, 953))
+
+
+if __name__ == "__main__":
+    unittest.main()
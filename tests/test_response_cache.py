@@ -0,0 +1,81 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import unittest
+from unittest.mock import AsyncMock
+
+import numpy as np
+
+from api.response_cache import SemanticResponseCache
+
+
+class MockTimer:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSemanticResponseCache(unittest.IsolatedAsyncioTestCase):
+    """Tests for the semantic response cache."""
+
+    def setUp(self) -> None:
+        self.timer = MockTimer()
+        unittest.TestCase.setUp(self)
+
+    def _get_cache(self, **kwargs):
+        return SemanticResponseCache(
+            embedding_client=AsyncMock(), model="mock_embedding_model", timer=self.timer, **kwargs)
+
+    @staticmethod
+    def _vector(*values):
+        vector = np.array(values, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def test_similarity_threshold(self):
+        """Test that only the answers to similar enough questions are returned."""
+        cache = self._get_cache(threshold=0.9)
+        self.assertIsNone(cache.get(self._vector(1, 0), 'agent'))
+        cache.set(self._vector(1, 0), 'agent', {'content': 'a', 'annotations': []})
+        cache.set(self._vector(0, 1), 'agent', {'content': 'b', 'annotations': []})
+        self.assertEqual(cache.get(self._vector(1, 0.1), 'agent')['content'], 'a')
+        self.assertEqual(cache.get(self._vector(0.1, 1), 'agent')['content'], 'b')
+        self.assertIsNone(cache.get(self._vector(1, 1), 'agent'))
+        self.assertEqual(cache.stats['hits'], 2)
+        self.assertEqual(cache.stats['misses'], 2)
+        self.assertEqual(cache.stats['hit_rate'], 0.5)
+
+    def test_lru_and_ttl(self):
+        """Test that the least recently used answer is evicted and the answers expire."""
+        cache = self._get_cache(max_size=2, ttl=10)
+        cache.set(self._vector(1, 0, 0), 'agent', {'content': 'a'})
+        cache.set(self._vector(0, 1, 0), 'agent', {'content': 'b'})
+        self.assertIsNotNone(cache.get(self._vector(1, 0, 0), 'agent'))
+        cache.set(self._vector(0, 0, 1), 'agent', {'content': 'c'})
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertIsNone(cache.get(self._vector(0, 1, 0), 'agent'))
+        self.assertIsNotNone(cache.get(self._vector(1, 0, 0), 'agent'))
+        self.timer.now = 10
+        self.assertIsNone(cache.get(self._vector(1, 0, 0), 'agent'))
+        self.assertEqual(len(cache), 0)
+
+    def test_agent_change(self):
+        """Test that the answers of the previous agent are dropped."""
+        cache = self._get_cache()
+        cache.set(self._vector(1, 0), 'agent', {'content': 'a'})
+        self.assertIsNone(cache.get(self._vector(1, 0), 'new_agent'))
+        self.assertIsNone(cache.get(self._vector(1, 0), 'agent'))
+
+    async def test_embed(self):
+        """Test that the question embedding is normalized."""
+        cache = self._get_cache(dimensions=2)
+        cache._embedding_client.embed.return_value = {'data': [{'embedding': [3, 4]}]}
+        np.testing.assert_allclose(await cache.embed('question'), [0.6, 0.8])
+        cache._embedding_client.embed.assert_awaited_once_with(
+            input=['question'], dimensions=2, model="mock_embedding_model")
+
+
+if __name__ == "__main__":
+    unittest.main()
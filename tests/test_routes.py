@@ -0,0 +1,334 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import datetime
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+from azure.ai.agents.models import (
+    MessageDelta,
+    MessageDeltaChunk,
+    MessageDeltaTextContent,
+    MessageDeltaTextContentObject,
+)
+from azure.core.async_paging import AsyncItemPaged, AsyncList
+from azure.core.exceptions import ResourceNotFoundError
+
+from api import routes
+from api.response_cache import SemanticResponseCache
+from api.session_cache import SessionCache
+
+
+class MockStream:
+    """The agent run stream, which calls the event handler as the SDK does."""
+
+    def __init__(self, event_handler, events):
+        self._event_handler = event_handler
+        self._events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def __aiter__(self):
+        for name, value in self._events:
+            handler = getattr(self._event_handler, name)
+            result = await (handler(value) if value is not None else handler())
+            yield name, value, result
+
+
+def get_delta(text):
+    return MessageDeltaChunk(id="msg_1", delta=MessageDelta(role="assistant", content=[
+        MessageDeltaTextContent(index=0, text=MessageDeltaTextContentObject(value=text))]))
+
+
+def get_mock_message(content, status="completed"):
+    message = MagicMock()
+    message.id = "msg_1"
+    message.status = status
+    message.file_citation_annotations = []
+    message.url_citation_annotations = []
+    message.text_messages = [MagicMock()]
+    message.text_messages[0].text.value = content
+    return message
+
+
+def get_mock_run(status="completed"):
+    run = MagicMock()
+    run.id = "run_1"
+    run.thread_id = "thread_1"
+    run.status = status
+    return run
+
+
+def get_mock_project(events):
+    ai_project = MagicMock()
+    ai_project.agents.runs.stream = AsyncMock(
+        side_effect=lambda **kwargs: MockStream(kwargs['event_handler'], events))
+    ai_project.agents.messages.create = AsyncMock()
+    return ai_project
+
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        for line in chunk.split("\n"):
+            if line.startswith("data: "):
+                events.append(json.loads(line[len("data: "):]))
+    return events
+
+
+class TestRoutes(unittest.IsolatedAsyncioTestCase):
+    """Tests for the chat streaming helpers."""
+
+    EVENTS = [
+        ("on_message_delta", get_delta("Hello")),
+        ("on_message_delta", get_delta(" world")),
+        ("on_thread_message", get_mock_message("Hello world")),
+        ("on_thread_run", get_mock_run()),
+        ("on_done", None),
+    ]
+
+    async def _collect(self, generator):
+        return [chunk async for chunk in generator]
+
+    async def test_get_result_fills_response_cache(self):
+        """Test that the completed answer is cached and replayed with the same events."""
+        cache = SemanticResponseCache(embedding_client=AsyncMock(), model="mock_embedding_model")
+        vector = np.array([1, 0], dtype=np.float32)
+        ai_project = get_mock_project(self.EVENTS)
+        live = parse_events(await self._collect(routes.get_result(
+            None, "thread_1", "agent_1", ai_project, None, {}, cache, vector)))
+        self.assertListEqual(
+            [event['type'] for event in live],
+            ["message", "message", "completed_message", "thread_run", "stream_end"])
+
+        cached = cache.get(vector, "agent_1")
+        self.assertDictEqual(cached, {'content': "Hello world", 'annotations': []})
+        replayed = parse_events(await self._collect(routes.replay_cached_response("thread_2", ai_project, cached)))
+        self.assertListEqual(
+            replayed,
+            [
+                {'content': "Hello world", 'type': "message"},
+                {'content': "Hello world", 'annotations': [], 'type': "completed_message"},
+                {'type': "stream_end"},
+            ])
+        ai_project.agents.messages.create.assert_awaited_once_with(
+            thread_id="thread_2", role="assistant", content="Hello world")
+
+    async def test_get_result_coalesced(self):
+        """Test that the deltas are merged into one event if the coalescing window is set."""
+        with patch.object(routes, "STREAM_COALESCE_WINDOW", 10):
+            events = parse_events(await self._collect(routes.get_result(
+                None, "thread_1", "agent_1", get_mock_project(self.EVENTS), None, {})))
+        self.assertListEqual(
+            [event['type'] for event in events], ["message", "completed_message", "thread_run", "stream_end"])
+        self.assertEqual(events[0]['content'], "Hello world")
+
+    async def test_get_result_search_tool(self):
+        """Test that the run uses the local search tool instead of the tools of the agent."""
+        ai_project = get_mock_project(self.EVENTS)
+        await self._collect(routes.get_result(None, "thread_1", "agent_1", ai_project, None, {}))
+        self.assertIsNone(ai_project.agents.runs.stream.call_args.kwargs['tools'])
+        search_tool = MagicMock()
+        await self._collect(routes.get_result(
+            None, "thread_1", "agent_1", ai_project, None, {}, search_tool=search_tool))
+        self.assertIs(ai_project.agents.runs.stream.call_args.kwargs['tools'], search_tool.definitions)
+
+    async def test_get_result_failed_run_not_cached(self):
+        """Test that the answer of the failed run is not cached."""
+        cache = SemanticResponseCache(embedding_client=AsyncMock(), model="mock_embedding_model")
+        vector = np.array([1, 0], dtype=np.float32)
+        run = get_mock_run("failed")
+        run.last_error.as_dict.return_value = {'message': 'error'}
+        ai_project = get_mock_project([
+            ("on_thread_message", get_mock_message("partial")),
+            ("on_thread_run", run),
+        ])
+        await self._collect(routes.get_result(None, "thread_1", "agent_1", ai_project, None, {}, cache, vector))
+        self.assertIsNone(cache.get(vector, "agent_1"))
+
+
+class TestFileNameCache(unittest.IsolatedAsyncioTestCase):
+    """Tests for the file citation names."""
+
+    def setUp(self) -> None:
+        routes.file_name_cache.clear()
+        unittest.TestCase.setUp(self)
+
+    @staticmethod
+    def _file_info(file_id):
+        file_info = MagicMock()
+        file_info.id = file_id
+        file_info.filename = f"{file_id}.md"
+        return file_info
+
+    @staticmethod
+    def _citation(file_id):
+        annotation = MagicMock()
+        annotation.as_dict.return_value = {'file_citation': {'file_id': file_id}}
+        return annotation
+
+    async def test_missing_names_fetched_once(self):
+        """Test that the file names are fetched once per file and then served from the cache."""
+        agent_client = MagicMock()
+        agent_client.files.get = AsyncMock(side_effect=self._file_info)
+        agent_client.files.list = AsyncMock(return_value=MagicMock(data=[self._file_info("file_0")]))
+        await routes.warm_file_name_cache(agent_client)
+
+        message = get_mock_message("answer")
+        message.file_citation_annotations = [
+            self._citation("file_0"), self._citation("file_1"), self._citation("file_2"), self._citation("file_1")]
+        result = await routes.get_message_and_annotations(agent_client, message)
+        self.assertListEqual(
+            [annotation['file_name'] for annotation in result['annotations']],
+            ["file_0.md", "file_1.md", "file_2.md", "file_1.md"])
+        self.assertListEqual(
+            [call.args[0] for call in agent_client.files.get.await_args_list], ["file_1", "file_2"])
+
+        await routes.get_message_and_annotations(agent_client, message)
+        self.assertEqual(agent_client.files.get.await_count, 2)
+        self.assertEqual(routes.file_name_cache.stats['size'], 3)
+
+
+def get_mock_messages_list(messages):
+    """Return messages.list, which pages over the messages as the service does, the newest first."""
+    calls = []
+
+    def list_messages(thread_id, limit=20, order=None, before=None):
+        ordered = list(reversed(messages))
+
+        async def get_next(continuation_token=None):
+            start = 0
+            if continuation_token is not None:
+                start = [m.id for m in ordered].index(continuation_token) + 1
+            calls.append((start, limit))
+            return ordered[start:start + limit]
+
+        async def extract_data(page):
+            return (page[-1].id if page else None), AsyncList(page)
+
+        return AsyncItemPaged(get_next, extract_data)
+
+    return MagicMock(side_effect=list_messages), calls
+
+
+class TestChatHistory(unittest.IsolatedAsyncioTestCase):
+    """Tests for the pages of the chat history."""
+
+    def setUp(self) -> None:
+        routes.file_name_cache.clear()
+        unittest.TestCase.setUp(self)
+
+    def _get_messages(self, count):
+        messages = []
+        for i in range(count):
+            message = get_mock_message(f"message {i}")
+            message.id = f"msg_{i}"
+            message.role = "user" if i % 2 == 0 else "assistant"
+            message.created_at = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+            annotation = MagicMock()
+            annotation.as_dict.return_value = {'file_citation': {'file_id': f"file_{i % 3}"}}
+            message.file_citation_annotations = [annotation]
+            messages.append(message)
+        return messages
+
+    async def test_pages(self):
+        """Test that only the requested window is fetched and the pages are chained by the cursor."""
+        agent_client = MagicMock()
+        agent_client.messages.list, calls = get_mock_messages_list(self._get_messages(25))
+        agent_client.files.get = AsyncMock(side_effect=TestFileNameCache._file_info)
+
+        content, before = await routes.get_history_page(agent_client, "thread_1", limit=10)
+        self.assertListEqual([m['content'] for m in content], [f"message {i}" for i in range(24, 14, -1)])
+        self.assertListEqual([m['role'] for m in content[:2]], ["user", "assistant"])
+        self.assertEqual(content[0]['annotations'][0]['file_name'], "file_0.md")
+        self.assertEqual(before, "msg_15")
+        self.assertListEqual(calls, [(0, 10)])
+        # Each file name is fetched once for the whole page.
+        self.assertEqual(agent_client.files.get.await_count, 3)
+
+        content, before = await routes.get_history_page(agent_client, "thread_1", limit=10, before=before)
+        self.assertListEqual([m['content'] for m in content], [f"message {i}" for i in range(14, 4, -1)])
+        content, before = await routes.get_history_page(agent_client, "thread_1", limit=10, before=before)
+        self.assertListEqual([m['content'] for m in content], [f"message {i}" for i in range(4, -1, -1)])
+        self.assertIsNone(before)
+        self.assertListEqual(calls, [(0, 10), (10, 10), (20, 10)])
+        self.assertEqual(agent_client.files.get.await_count, 3)
+
+    async def test_whole_thread(self):
+        """Test that the whole thread is read in the pages of the maximal size."""
+        agent_client = MagicMock()
+        agent_client.messages.list, calls = get_mock_messages_list(self._get_messages(250))
+        agent_client.files.get = AsyncMock(side_effect=TestFileNameCache._file_info)
+        content = await routes.get_history(agent_client, "thread_1")
+        self.assertListEqual([m['content'] for m in content], [f"message {i}" for i in range(249, -1, -1)])
+        self.assertListEqual(calls, [(0, 100), (100, 100), (200, 100)])
+
+    async def test_first_question(self):
+        """Test that only the thread with the single message is the first question and one page is fetched."""
+        agent_client = MagicMock()
+        agent_client.messages.list, calls = get_mock_messages_list(self._get_messages(1))
+        self.assertTrue(await routes.is_first_question(agent_client, "thread_1"))
+        agent_client.messages.list, calls = get_mock_messages_list(self._get_messages(25))
+        self.assertFalse(await routes.is_first_question(agent_client, "thread_1"))
+        self.assertListEqual(calls, [(0, 2)])
+
+    async def test_empty_thread(self):
+        """Test that the new thread has no history and no next page."""
+        agent_client = MagicMock()
+        agent_client.messages.list, _ = get_mock_messages_list([])
+        self.assertEqual(await routes.get_history_page(agent_client, "thread_1", limit=10), ([], None))
+
+
+class TestThreadLookup(unittest.IsolatedAsyncioTestCase):
+    """Tests for the thread lookup of the chat requests."""
+
+    def _get_agent_client(self):
+        agent_client = MagicMock()
+        agent_client.threads.get = AsyncMock(side_effect=lambda thread_id: MagicMock(id=thread_id))
+        agent_client.threads.create = AsyncMock(return_value=MagicMock(id="thread_new"))
+        return agent_client
+
+    async def test_thread_retrieved_once(self):
+        """Test that the known thread is not retrieved again until it is invalidated."""
+        agent_client = self._get_agent_client()
+        agent = MagicMock(id="agent_1")
+        cache = SessionCache()
+        for _ in range(3):
+            thread_id = await routes.get_or_create_thread(agent_client, "thread_1", "agent_1", agent, cache)
+            self.assertEqual(thread_id, "thread_1")
+        self.assertEqual(agent_client.threads.get.await_count, 1)
+
+        await cache.invalidate("thread_1")
+        await routes.get_or_create_thread(agent_client, "thread_1", "agent_1", agent, cache)
+        self.assertEqual(agent_client.threads.get.await_count, 2)
+
+    async def test_new_thread_cached(self):
+        """Test that the created thread is cached and the thread of another agent is not reused."""
+        agent_client = self._get_agent_client()
+        cache = SessionCache()
+        thread_id = await routes.get_or_create_thread(agent_client, None, None, MagicMock(id="agent_1"), cache)
+        self.assertEqual(thread_id, "thread_new")
+        await routes.get_or_create_thread(agent_client, thread_id, "agent_1", MagicMock(id="agent_1"), cache)
+        agent_client.threads.get.assert_not_awaited()
+
+        await routes.get_or_create_thread(agent_client, thread_id, "agent_2", MagicMock(id="agent_2"), cache)
+        agent_client.threads.get.assert_awaited_once_with("thread_new")
+
+    async def test_thread_not_found(self):
+        """Test that the thread, deleted in the service, is not cached."""
+        agent_client = self._get_agent_client()
+        agent_client.threads.get.side_effect = ResourceNotFoundError("Thread not found")
+        cache = SessionCache()
+        with self.assertRaises(ResourceNotFoundError):
+            await routes.get_or_create_thread(agent_client, "thread_1", "agent_1", MagicMock(id="agent_1"), cache)
+        self.assertIsNone(await cache.get("thread_1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
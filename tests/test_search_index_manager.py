@@ -1,19 +1,24 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license.
 # See LICENSE file in the project root for full license information.
+import asyncio
 import csv
 import json
 import os
 import tempfile
+import time
 import unittest
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from azure.identity.aio import DefaultAzureCredential
 
-from search_index_manager import SearchIndexManager
+from api.cache import TTLCache
+from api.embeddings_store import load_embeddings
+from api.search_index_manager import SearchIndexManager, limit_result_size, reciprocal_rank_fusion
 from azure.ai.projects.aio import AIProjectClient
 from azure.ai.projects.models._enums import ConnectionType
 from azure.core.exceptions import HttpResponseError
 
+import numpy as np
 from ddt import ddt, data
 
 connection_string = os.environ.get("AZURE_EXISTING_AIPROJECT_CONNECTION_STRING") if os.environ.get("AZURE_EXISTING_AIPROJECT_CONNECTION_STRING") else os.environ.get("AZURE_AIPROJECT_CONNECTION_STRING")
@@ -29,18 +34,23 @@ class MockAsyncIterator:
             yield dt
 
 
+async def mock_upload_succeeded(batch):
+    """Return the results of the upload, in which all the documents have succeeded."""
+    return [MagicMock(key=document['embedId'], succeeded=True, status_code=201) for document in batch]
+
+
 @ddt
 class TestSearchIndexManager(unittest.IsolatedAsyncioTestCase):
     """Tests for the RAG helper."""
 
     INPUT_DIR = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'files')
+                os.path.dirname(os.path.dirname(__file__)), 'src', 'files')
     # INPUT_DIR = os.path.join(
     #     os.path.dirname(
     #         os.path.dirname(
     #             os.path.dirname(os.path.dirname(__file__)))), 'data_')
-    EMBEDDINGS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                                   'data', 'embeddings.csv')
+    EMBEDDINGS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                                   'src', 'data', 'embeddings.csv')
 
     @classmethod
     def setUpClass(cls) -> None:
@@ -58,7 +68,7 @@ class TestSearchIndexManager(unittest.IsolatedAsyncioTestCase):
         mock_ix_client = AsyncMock()
         mock_aenter = AsyncMock()
         with patch(
-            'search_index_manager.SearchIndexClient',
+            'api.search_index_manager.SearchIndexClient',
                 return_value=mock_ix_client):
             mock_ix_client.__aenter__.return_value = mock_aenter
             rag = self._get_mock_rag(AsyncMock())
@@ -172,11 +182,12 @@ class TestSearchIndexManager(unittest.IsolatedAsyncioTestCase):
             {'token': 'a', 'title': 'a.txt'},
             {'token': 'b', 'title': 'b.txt'}
         ])
+        mock_serch_client.get_document_count.return_value = 9
         with patch(
-            'search_index_manager.SearchIndexClient',
+            'api.search_index_manager.SearchIndexClient',
                 return_value=mock_ix_client):
             with patch(
-                'search_index_manager.SearchClient',
+                'api.search_index_manager.SearchClient',
                     return_value=mock_serch_client):
                 mock_ix_client.__aenter__.return_value = mock_aenter
                 rag = self._get_mock_rag(AsyncMock())
@@ -192,13 +203,283 @@ class TestSearchIndexManager(unittest.IsolatedAsyncioTestCase):
                 self.assertEqual(search_result,
                                  "a, source: a.txt\n------\nb, source: b.txt")
 
+    async def test_query_cache(self):
+        """Test that the repeated queries are served from cache until the documents are uploaded."""
+        mock_serch_client = AsyncMock()
+        mock_serch_client.search.side_effect = lambda **kwargs: MockAsyncIterator(
+            [{'token': 'a', 'title': 'a.txt'}])
+        mock_serch_client.get_document_count.return_value = 9
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                rag = SearchIndexManager(
+                    endpoint=self.search_endpoint,
+                    credential=AsyncMock(),
+                    index_name=self.index_name,
+                    dimensions=100,
+                    model="mock_embedding_model",
+                    deployment_name="mock_embedding_model",
+                    embedding_endpoint="",
+                    embed_api_key=self.embed_key,
+                    query_cache=TTLCache(max_size=10, ttl=60)
+                )
+                await rag.create_index()
+                self.assertEqual(await rag.search('Price of  TrailMaster'), "a, source: a.txt")
+                self.assertEqual(await rag.search('price of trailmaster '), "a, source: a.txt")
+                self.assertEqual(mock_serch_client.search.await_count, 1)
+                # The search mode is a part of the key.
+                await rag.semantic_search('price of trailmaster')
+                self.assertEqual(mock_serch_client.search.await_count, 2)
+                self.assertEqual(rag.query_cache_stats['hits'], 1)
+                self.assertEqual(rag.query_cache_stats['misses'], 2)
+
+                await rag.upload_documents(TestSearchIndexManager.EMBEDDINGS_FILE)
+                self.assertEqual(rag.query_cache_stats['size'], 0)
+                await rag.search('price of trailmaster')
+                self.assertEqual(mock_serch_client.search.await_count, 3)
+                await rag.delete_index()
+                self.assertEqual(rag.query_cache_stats['size'], 0)
+                self.assertIsNone(self._get_mock_rag(None).query_cache_stats)
+
+    def test_reciprocal_rank_fusion(self):
+        """Test that the documents, found by both rankings, are ranked higher and returned once."""
+        docs = {key: {'embedId': key, 'token': key, 'title': f'{key}.txt'} for key in 'abcd'}
+        fused = reciprocal_rank_fusion([
+            [docs['a'], docs['b'], docs['c']],
+            [docs['c'], docs['a'], docs['d']],
+        ])
+        self.assertListEqual([doc['embedId'] for doc in fused], ['a', 'c', 'b', 'd'])
+        self.assertAlmostEqual(fused[0]['@search.score'], 1 / 61 + 1 / 62)
+        self.assertNotIn('@search.score', docs['a'])
+        self.assertListEqual(reciprocal_rank_fusion([[], []]), [])
+
+    def test_limit_result_size(self):
+        """Test that the less relevant documents, which do not fit into the context, are dropped."""
+        docs = [{'token': 'a' * 10, 'title': 'a.txt'}, {'token': 'b', 'title': 'b.txt'}]
+        # "aaaaaaaaaa, source: a.txt" is 26 characters, the separator is 8.
+        self.assertListEqual(limit_result_size(docs, None), docs)
+        self.assertListEqual(limit_result_size(docs, 26), docs[:1])
+        self.assertListEqual(limit_result_size(docs, 51), docs)
+        self.assertListEqual(limit_result_size(docs, 10), [])
+
+    async def test_hybrid_search_mock(self):
+        """Test that the vector and the full text queries run concurrently and their rankings are fused."""
+        in_flight = 0
+        max_in_flight = 0
+        docs = {key: {'embedId': key, 'token': key, 'title': f'{key}.txt'} for key in 'abc'}
+
+        async def mock_search(**kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if 'search_text' in kwargs and 'vector_queries' in kwargs:
+                return MockAsyncIterator([docs['a'], docs['b']])
+            if 'vector_queries' in kwargs:
+                return MockAsyncIterator([docs['a'], docs['b']])
+            return MockAsyncIterator([docs['b'], docs['c']])
+
+        mock_serch_client = AsyncMock()
+        mock_serch_client.search.side_effect = mock_search
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                rag = self._get_mock_rag(AsyncMock())
+                await rag.create_index()
+                self.assertEqual(
+                    await rag.hybrid_search('test', k=2, candidates=10),
+                    "b, source: b.txt\n------\na, source: a.txt")
+                self.assertEqual(mock_serch_client.search.await_count, 2)
+                self.assertEqual(max_in_flight, 2)
+                for call in mock_serch_client.search.await_args_list:
+                    self.assertEqual(call.kwargs['top'], 10)
+                    self.assertIn('embedId', call.kwargs['select'])
+
+                documents = await rag.hybrid_search_documents('test', k=5)
+                self.assertListEqual([doc['embedId'] for doc in documents], ['b', 'a', 'c'])
+                self.assertEqual(await rag.hybrid_search('test', k=3, max_chars=20), "b, source: b.txt")
+
+                mock_serch_client.search.reset_mock()
+                documents = await rag.hybrid_search_documents('test', k=5, combined=True)
+                self.assertListEqual([doc['embedId'] for doc in documents], ['a', 'b'])
+                mock_serch_client.search.assert_awaited_once()
+
+    async def test_search_does_not_block_event_loop(self):
+        """Test that other coroutines make progress while the uploaded documents are being indexed."""
+        mock_serch_client = AsyncMock()
+        mock_serch_client.upload_documents.side_effect = mock_upload_succeeded
+        mock_serch_client.get_document_count.side_effect = [0, 0, 0, 9]
+
+        async def mock_search(**kwargs):
+            await asyncio.sleep(0.05)
+            return MockAsyncIterator([{'token': 'a', 'title': 'a.txt'}])
+
+        mock_serch_client.search.side_effect = mock_search
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                rag = self._get_mock_rag(AsyncMock())
+                self.assertTrue(await rag.create_index())
+                self.assertTrue(rag.is_consistent)
+                await rag.upload_documents(TestSearchIndexManager.EMBEDDINGS_FILE)
+                self.assertFalse(rag.is_consistent)
+
+                ticker_task = asyncio.create_task(ticker())
+                results = await asyncio.gather(*(rag.search('test') for _ in range(5)))
+                ticker_task.cancel()
+                self.assertListEqual(results, ["a, source: a.txt"] * 5)
+                self.assertTrue(rag.is_consistent)
+                # The concurrent searches share polling of the document count.
+                self.assertEqual(mock_serch_client.get_document_count.await_count, 4)
+                self.assertGreater(ticks, 10)
+
+                # The steady state search does not poll the index.
+                await rag.semantic_search('test')
+                self.assertEqual(mock_serch_client.get_document_count.await_count, 4)
+
+    async def test_upload_documents_batches(self):
+        """Test that the documents are uploaded in bounded concurrent batches and throttling is retried."""
+        in_flight = 0
+        max_in_flight = 0
+        uploaded = []
+        throttled_once = set()
+
+        async def mock_upload(batch):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if batch[0]['embedId'] == '0' and not throttled_once:
+                throttled_once.add('request')
+                error = HttpResponseError('Mock throttling')
+                error.status_code = 429
+                raise error
+            results = []
+            for document in batch:
+                # The service throttles the single document of the second batch once.
+                succeeded = document['embedId'] != '5' or 'document' in throttled_once
+                if not succeeded:
+                    throttled_once.add('document')
+                results.append(MagicMock(key=document['embedId'], succeeded=succeeded, status_code=503))
+                if succeeded:
+                    uploaded.append(document['embedId'])
+            return results
+
+        mock_serch_client = AsyncMock()
+        mock_serch_client.upload_documents.side_effect = mock_upload
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                with patch.object(SearchIndexManager, '_UPLOAD_INITIAL_BACKOFF', 0.01):
+                    rag = self._get_mock_rag(AsyncMock())
+                    await rag.create_index()
+                    await rag.upload_documents(
+                        TestSearchIndexManager.EMBEDDINGS_FILE, batch_size=2, max_concurrency=2)
+        self.assertEqual(max_in_flight, 2)
+        self.assertListEqual(sorted(uploaded, key=int), [str(i) for i in range(9)])
+        # Five batches, one throttled request and one throttled document.
+        self.assertEqual(mock_serch_client.upload_documents.await_count, 7)
+
+    async def test_upload_documents_error(self):
+        """Test that the upload fails on the error, which is not throttling."""
+        mock_serch_client = AsyncMock()
+        mock_serch_client.upload_documents.side_effect = HttpResponseError('Mock http error')
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                rag = self._get_mock_rag(AsyncMock())
+                await rag.create_index()
+                with self.assertRaisesRegex(HttpResponseError, 'Mock http error'):
+                    await rag.upload_documents(TestSearchIndexManager.EMBEDDINGS_FILE, batch_size=2)
+        self.assertTrue(rag.is_consistent)
+
+    async def test_upload_documents_rejected(self):
+        """Test that the rejected documents are not retried and the index is consistent without them."""
+        async def mock_upload(batch):
+            return [
+                MagicMock(key=document['embedId'], succeeded=document['embedId'] != '3',
+                          status_code=400 if document['embedId'] == '3' else 201, error_message='Mock error')
+                for document in batch]
+
+        mock_serch_client = AsyncMock()
+        mock_serch_client.upload_documents.side_effect = mock_upload
+        mock_serch_client.get_document_count.return_value = 8
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                rag = self._get_mock_rag(AsyncMock())
+                await rag.create_index()
+                with self.assertLogs('azureaiapp', level='ERROR') as logs:
+                    await rag.upload_documents(TestSearchIndexManager.EMBEDDINGS_FILE, batch_size=2)
+                self.assertIn("3: 400 Mock error", logs.output[0])
+                self.assertEqual(mock_serch_client.upload_documents.await_count, 5)
+                self.assertTrue(await rag.wait_until_consistent(timeout=0.2))
+
+    async def test_wait_until_consistent_timeout(self):
+        """Test that the wait for consistency gives up after the timeout."""
+        mock_serch_client = AsyncMock()
+        mock_serch_client.upload_documents.side_effect = mock_upload_succeeded
+        mock_serch_client.get_document_count.return_value = 0
+        with patch(
+            'api.search_index_manager.SearchIndexClient',
+                return_value=AsyncMock()):
+            with patch(
+                'api.search_index_manager.SearchClient',
+                    return_value=mock_serch_client):
+                rag = self._get_mock_rag(AsyncMock())
+                await rag.create_index()
+                await rag.upload_documents(TestSearchIndexManager.EMBEDDINGS_FILE)
+                start = time.monotonic()
+                # The concurrent callers give up together instead of polling one after another.
+                results = await asyncio.gather(*(rag.wait_until_consistent(timeout=0.2) for _ in range(3)))
+                self.assertListEqual(results, [False] * 3)
+                self.assertLess(time.monotonic() - start, 0.4)
+                self.assertFalse(rag.is_consistent)
+                # The later callers do not poll until the next upload.
+                polls = mock_serch_client.get_document_count.await_count
+                self.assertFalse(await rag.wait_until_consistent(timeout=0.2))
+                self.assertEqual(mock_serch_client.get_document_count.await_count, polls)
+                await rag.upload_documents(TestSearchIndexManager.EMBEDDINGS_FILE)
+                mock_serch_client.get_document_count.return_value = 9
+                self.assertTrue(await rag.wait_until_consistent(timeout=0.2))
+                self.assertGreater(mock_serch_client.get_document_count.await_count, polls)
+                await rag.delete_index()
+                self.assertTrue(rag.is_consistent)
+
     @data(2, 4)
     async def test_build_embeddings_file_mock(self, sentences_per_embedding):
         """Use this test to build
         the new embeddings file in the data directory."""
         embedding_client = AsyncMock()
-        embedding_client.embed.retun_value = {'data': [[0, 0], [1, 1], [
-            2, 2]] if sentences_per_embedding == 4 else [[0, 0], [1, 1]]}
+        embedding_client.embed.side_effect = self._mock_embed
         rag = SearchIndexManager(
             endpoint=self.search_endpoint,
             credential=AsyncMock(),
@@ -211,34 +492,86 @@ class TestSearchIndexManager(unittest.IsolatedAsyncioTestCase):
             embedding_client=embedding_client
         )
         sentences = [
-            f"This is {v} sentence" for v in [
+            f"This is {v} sentence." for v in [
                 'first', 'second', 'third', 'forth', 'fifth']]
         with tempfile.TemporaryDirectory() as d:
             data = ' '.join(sentences)
-            input_file = os.path.join(d, 'input.csv')
+            input_file = os.path.join(d, 'input.md')
             with open(input_file, 'w') as f:
                 f.write(data)
             out_file = os.path.join(d, 'embeddings.csv')
             await rag.build_embeddings_file(
-                input_directory=input_file,
+                input_directory=d,
                 output_file=out_file,
                 sentences_per_embedding=sentences_per_embedding
             )
-            index = 1
+            index = 0
             with open(out_file, newline='') as fp:
                 reader = csv.DictReader(fp)
                 for row in reader:
-                    self.assertEqual(
-                        ' '.join(
-                            sentences[
-                                index * sentences_per_embedding: (
-                                    index + 1) * sentences_per_embedding]))
+                    token = ' '.join(
+                        sentences[
+                            index * sentences_per_embedding: (
+                                index + 1) * sentences_per_embedding])
+                    self.assertEqual(row['token'], token)
                     self.assertListEqual(
                         json.loads(
                             row['embedding']), [
-                            index, index])
-                    self.assertEqual(row['document_reference'], 'input.csv')
+                            len(token), index])
+                    self.assertEqual(row['title'], 'input.md')
                     index += 1
+            self.assertEqual(index, 3 if sentences_per_embedding == 2 else 2)
+
+    async def test_split_files_across_documents(self):
+        """Test that the sentences of all documents are chunked together, as the chunk may span two documents."""
+        with tempfile.TemporaryDirectory() as d:
+            files = []
+            for name, count in (('a.md', 4), ('b.md', 3)):
+                files.append(os.path.join(d, name))
+                with open(files[-1], 'w') as f:
+                    f.write(' '.join(f"This is {name} sentence {i}." for i in range(count)))
+            chunks = await SearchIndexManager._split_files(files, 3, max_workers=1)
+        self.assertListEqual(chunks, [
+            ("This is a.md sentence 0. This is a.md sentence 1. This is a.md sentence 2.", 'a.md'),
+            ("This is a.md sentence 3. This is b.md sentence 0. This is b.md sentence 1.", 'a.md'),
+            ("This is b.md sentence 2.", 'b.md'),
+        ])
+
+    async def test_build_embeddings_file_incremental(self):
+        """Test that the chunks are aligned with embeddings and the unchanged chunks are not embedded again."""
+        embedding_client = AsyncMock()
+        embedding_client.embed.side_effect = self._mock_embed
+        rag = self._get_mock_rag(embedding_client)
+        chunks = [(f"chunk number {i}", f"doc_{i % 2}.md") for i in range(7)]
+        with tempfile.TemporaryDirectory() as d, patch.object(
+                SearchIndexManager, '_split_files', AsyncMock(return_value=chunks)), patch.dict(
+                'sys.modules', {'nltk': MagicMock()}):
+            out_file = os.path.join(d, 'embeddings.npy')
+            await rag.build_embeddings_file(
+                input_directory=d, output_file=out_file, batch_size=2, max_concurrency=2)
+            self.assertEqual(embedding_client.embed.await_count, 4)
+            embeddings = load_embeddings(out_file)
+            self.assertListEqual(list(embeddings.tokens), [token for token, _ in chunks])
+            self.assertListEqual(list(embeddings.titles), [title for _, title in chunks])
+            self.assertListEqual(embeddings.vectors[:, 0].tolist(), [len(token) for token, _ in chunks])
+
+            # Nothing has changed, the embedding client is not called.
+            embedding_client.embed.reset_mock()
+            await rag.build_embeddings_file(input_directory=d, output_file=out_file, batch_size=2)
+            embedding_client.embed.assert_not_called()
+            np.testing.assert_array_equal(load_embeddings(out_file).vectors, embeddings.vectors)
+
+            # Only the changed chunk is embedded.
+            chunks[3] = ("the changed chunk", "doc_1.md")
+            await rag.build_embeddings_file(input_directory=d, output_file=out_file, batch_size=2)
+            embedding_client.embed.assert_awaited_once()
+            self.assertListEqual(embedding_client.embed.await_args.kwargs['input'], ["the changed chunk"])
+            self.assertEqual(load_embeddings(out_file).vectors[3, 0], len("the changed chunk"))
+
+    @staticmethod
+    def _mock_embed(input, dimensions, model):
+        """Return the embeddings, made of the text length and the position in the request."""
+        return {'data': [{'embedding': [len(text), i]} for i, text in enumerate(input)]}
 
     @unittest.skip("Only for live tests.")
     async def test_build_embeddings_file(self):
@@ -0,0 +1,76 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from api.session_cache import SessionCache, SqliteSessionStore
+
+
+class TestSessionCache(unittest.IsolatedAsyncioTestCase):
+    """Tests for the cache of the known threads."""
+
+    async def test_local(self):
+        """Test that the session is cached until it is invalidated."""
+        cache = SessionCache(max_size=2)
+        self.assertIsNone(await cache.get("thread_1"))
+        await cache.set("thread_1", {'agent_id': "agent_1"})
+        self.assertDictEqual(await cache.get("thread_1"), {'agent_id': "agent_1"})
+        await cache.invalidate("thread_1")
+        self.assertIsNone(await cache.get("thread_1"))
+        await cache.invalidate("thread_1")
+        self.assertEqual(cache.stats['hits'], 1)
+
+    async def test_shared_store(self):
+        """Test that the workers share the sessions and their invalidation through SQLite."""
+        now = [1000.0]
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'sessions.db')
+            worker_1 = SessionCache(store=SqliteSessionStore(path, ttl=60, timer=lambda: now[0]))
+            worker_2 = SessionCache(store=SqliteSessionStore(path, ttl=60, timer=lambda: now[0]))
+            await worker_1.set("thread_1", {'agent_id': "agent_1"})
+            self.assertDictEqual(await worker_2.get("thread_1"), {'agent_id': "agent_1"})
+            self.assertEqual(worker_2.stats['store_hits'], 1)
+
+            await worker_1.invalidate("thread_1")
+            worker_3 = SessionCache(store=SqliteSessionStore(path, ttl=60, timer=lambda: now[0]))
+            self.assertIsNone(await worker_3.get("thread_1"))
+
+            await worker_1.set("thread_2", {'agent_id': "agent_1"})
+            now[0] += 61
+            self.assertIsNone(await worker_2.get("thread_2"))
+            for worker in (worker_1, worker_2, worker_3):
+                worker.close()
+
+    async def test_locked_store_does_not_block_event_loop(self):
+        """Test that the event loop runs while the write waits for the lock, held by another worker."""
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'sessions.db')
+            cache = SessionCache(store=SqliteSessionStore(path, ttl=60))
+            other_worker = sqlite3.connect(path, isolation_level=None)
+            other_worker.execute("BEGIN IMMEDIATE")
+            ticker_task = asyncio.create_task(ticker())
+            write = asyncio.create_task(cache.set("thread_1", {'agent_id': "agent_1"}))
+            await asyncio.sleep(0.3)
+            self.assertFalse(write.done())
+            self.assertGreater(ticks, 10)
+            other_worker.execute("COMMIT")
+            await write
+            ticker_task.cancel()
+            other_worker.close()
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from api.embeddings_store import load_embeddings
+from api.local_search import LocalSearchIndex
+from api.quantization import build_quantization, load_quantization, save_quantization
+from api.shared_store import (
+    SHARED_STORE_ENV,
+    StringTable,
+    create_shared_store,
+    read_shared_store,
+    remove_shared_store,
+    vectors_path,
+)
+
+
+class TestSharedStore(unittest.TestCase):
+    """Tests for the embeddings store, shared by the workers."""
+
+    EMBEDDINGS_FILE = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'src', 'api', 'data', 'embeddings.csv')
+
+    def setUp(self) -> None:
+        self._dir = tempfile.mkdtemp()
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self._dir)
+        unittest.TestCase.tearDown(self)
+
+    def test_string_table(self):
+        """Test that the table returns the encoded strings by index and by slice."""
+        strings = ['a', '', 'Garantía ✓', 'last']
+        table = StringTable(*StringTable.encode(strings))
+        self.assertEqual(len(table), 4)
+        self.assertListEqual(list(table), strings)
+        self.assertEqual(table[-1], 'last')
+        self.assertListEqual(table[1:3], strings[1:3])
+        with self.assertRaises(IndexError):
+            table[4]
+        self.assertEqual(len(StringTable(*StringTable.encode([]))), 0)
+
+    def test_create_and_search(self):
+        """Test that the index over the store finds the same documents as the index over the file."""
+        directory = os.path.join(self._dir, 'store')
+        with patch.dict(os.environ):
+            self.assertEqual(create_shared_store(self.EMBEDDINGS_FILE, directory), directory)
+            self.assertEqual(os.environ[SHARED_STORE_ENV], directory)
+        embeddings = read_shared_store(directory)
+        self.assertIsInstance(embeddings.vectors, np.memmap)
+        self.assertFalse(embeddings.vectors.flags.writeable)
+        np.testing.assert_allclose(np.linalg.norm(embeddings.vectors, axis=-1), 1, atol=1e-5)
+
+        source = load_embeddings(self.EMBEDDINGS_FILE)
+        self.assertListEqual(list(embeddings.tokens), list(source.tokens))
+        self.assertListEqual(list(embeddings.titles), list(source.titles))
+        shared = LocalSearchIndex(
+            embeddings.tokens, embeddings.titles, embeddings.vectors, model="mock_embedding_model")
+        # The normalized matrix of the store is used without copying.
+        self.assertTrue(np.shares_memory(shared.embeddings, embeddings.vectors))
+        index = LocalSearchIndex.from_file(self.EMBEDDINGS_FILE, model="mock_embedding_model")
+        query = source.vectors[42]
+        hits = shared.query(query)
+        expected = index.query(query)
+        self.assertListEqual([row for row, _ in hits], [row for row, _ in expected])
+        np.testing.assert_allclose([score for _, score in hits], [score for _, score in expected], atol=1e-6)
+        self.assertEqual(shared.get_documents(hits)[0]['token'], index.get_documents(expected)[0]['token'])
+
+        remove_shared_store(directory)
+        self.assertFalse(os.path.exists(directory))
+        remove_shared_store(directory)
+
+    def test_quantization(self):
+        """Test that the codes are built in the store, unless they were built next to the embeddings file."""
+        directory = os.path.join(self._dir, 'store')
+        with patch.dict(os.environ):
+            create_shared_store(self.EMBEDDINGS_FILE, directory, quantization='pq', pq_subspaces=10)
+        quantizer, codes = load_quantization(vectors_path(directory), 'pq')
+        self.assertIsInstance(codes, np.memmap)
+        self.assertEqual(codes.shape, (10, 953))
+        embeddings = read_shared_store(directory)
+        index = LocalSearchIndex(
+            embeddings.tokens, embeddings.titles, embeddings.vectors, model="mock_embedding_model",
+            quantized=(quantizer, codes))
+        self.assertAlmostEqual(index.query(embeddings.vectors[42], top_k=1)[0][1], 1.0, places=5)
+        del codes
+
+        embeddings_file = os.path.join(self._dir, 'embeddings.npy')
+        np.save(embeddings_file, embeddings.vectors)
+        save_quantization(embeddings_file, 'int8', *build_quantization(embeddings.vectors, 'int8'))
+        with patch('api.shared_store.load_embeddings', return_value=embeddings), patch.dict(os.environ):
+            create_shared_store(embeddings_file, directory, quantization='int8')
+        self.assertIsNone(load_quantization(vectors_path(directory), 'int8'))
+
+    def test_replace(self):
+        """Test that the store replaces the existing one and leaves no staging directory."""
+        directory = os.path.join(self._dir, 'store')
+        os.makedirs(directory)
+        with patch.dict(os.environ):
+            create_shared_store(self.EMBEDDINGS_FILE, directory)
+        self.assertListEqual(os.listdir(self._dir), ['store'])
+        self.assertEqual(len(read_shared_store(directory).tokens), 953)
+
+
+if __name__ == "__main__":
+    unittest.main()
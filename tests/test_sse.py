@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import asyncio
+import json
+import unittest
+
+from api.sse import CoalescingStats, coalesce_deltas, serialize_message_delta, serialize_sse_event
+
+
+class TestSSE(unittest.TestCase):
+    """Tests for the server-sent events encoding."""
+
+    TEXTS = ["Hello", " world", "", 'quote " and \\ backslash', "line\nbreak\t", "emoji 😀 and ünïcode", " "]
+
+    def test_message_delta(self):
+        """Test that the fast path gives the same event as the generic serialization."""
+        for text in self.TEXTS:
+            event = serialize_message_delta(text)
+            self.assertEqual(event, serialize_sse_event({'content': text, 'type': "message"}))
+            self.assertTrue(event.startswith("data: "))
+            self.assertTrue(event.endswith("\n\n"))
+            self.assertDictEqual(json.loads(event[len("data: "):]), {'content': text, 'type': "message"})
+
+
+
+async def generate_events(events, log=None):
+    """Yield the (delta text, frame) pairs, sleeping for the numbers in the events."""
+    for event in events:
+        if isinstance(event, float):
+            await asyncio.sleep(event)
+            continue
+        if log is not None:
+            log.append(f"source {event}")
+        if event.startswith("delta:"):
+            text = event[len("delta:"):]
+            yield text, serialize_message_delta(text)
+        else:
+            yield None, serialize_sse_event({'type': event})
+
+
+class TestCoalesceDeltas(unittest.IsolatedAsyncioTestCase):
+    """Tests for merging the message deltas."""
+
+    @staticmethod
+    def _parse(frame):
+        return json.loads(frame[len("data: "):])
+
+    async def test_flush_before_other_events(self):
+        """Test that the deltas are merged and flushed before the other events."""
+        stats = CoalescingStats()
+        frames = [self._parse(frame) async for frame in coalesce_deltas(generate_events(
+            ["delta:Hello", "delta: world", "completed_message", "delta:!", "thread_run", "stream_end"]),
+            window=10, max_bytes=1024, stats=stats)]
+        self.assertListEqual(frames, [
+            {'content': "Hello world", 'type': "message"},
+            {'type': "completed_message"},
+            {'content': "!", 'type': "message"},
+            {'type': "thread_run"},
+            {'type': "stream_end"},
+        ])
+        self.assertEqual(stats.as_dict()['frames_saved'], 1)
+
+    async def test_byte_budget(self):
+        """Test that the buffer is flushed when it reaches the byte budget and at the end of the stream."""
+        frames = [self._parse(frame)['content'] async for frame in coalesce_deltas(generate_events(
+            ["delta:abc", "delta:de", "delta:f", "delta:g"]), window=10, max_bytes=5)]
+        self.assertListEqual(frames, ["abcde", "fg"])
+
+    async def test_window(self):
+        """Test that the buffered deltas are sent when the window expires, without waiting for the next event."""
+        log = []
+        stats = CoalescingStats()
+        async for frame in coalesce_deltas(generate_events(
+                ["delta:a", "delta:b", 0.5, "delta:c"], log), window=0.02, max_bytes=1024, stats=stats):
+            log.append(self._parse(frame)['content'])
+        self.assertListEqual(log, ["source delta:a", "source delta:b", "ab", "source delta:c", "c"])
+        self.assertEqual(stats.frames_saved, 1)
+        self.assertLess(stats.max_delay, 0.4)
+
+
+if __name__ == "__main__":
+    unittest.main()
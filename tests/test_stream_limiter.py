@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import asyncio
+import unittest
+
+from api.stream_limiter import StreamLimiter, StreamLimitMiddleware
+
+
+class TestStreamLimiter(unittest.IsolatedAsyncioTestCase):
+    """Tests for the limit of the concurrent chat streams."""
+
+    def setUp(self):
+        self.finish = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await self.finish.wait()
+            await send({"type": "http.response.body", "body": b"data: {}\n\n"})
+
+        self.limiter = StreamLimiter(limit=2)
+        self.middleware = StreamLimitMiddleware(app, self.limiter, retry_after=3)
+
+    async def call(self, path="/chat", method="POST"):
+        """Call the middleware and return the sent messages."""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await self.middleware({"type": "http", "method": method, "path": path}, None, send)
+        return messages
+
+    async def test_limit(self):
+        """Test that the streams over the limit are rejected until a stream is finished."""
+        streams = [asyncio.create_task(self.call()) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.limiter.active, 2)
+
+        rejected = await self.call()
+        self.assertEqual(rejected[0]["status"], 503)
+        self.assertIn((b"retry-after", b"3"), rejected[0]["headers"])
+        # The other requests are not limited.
+        history = asyncio.create_task(self.call(path="/chat/history", method="GET"))
+        await asyncio.sleep(0)
+        self.assertFalse(history.done())
+
+        self.finish.set()
+        for messages in await asyncio.gather(*streams, history):
+            self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual((await self.call())[0]["status"], 200)
+        self.assertDictEqual(
+            self.limiter.stats, {'limit': 2, 'active': 0, 'max_active': 2, 'accepted': 3, 'rejected': 1})
+
+    async def test_disconnect(self):
+        """Test that the slot of the cancelled stream is returned."""
+        stream = asyncio.create_task(self.call())
+        await asyncio.sleep(0)
+        stream.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await stream
+        self.assertEqual(self.limiter.active, 0)
+
+    async def test_no_limit(self):
+        """Test that the limit 0 accepts all the streams."""
+        self.middleware.limiter = StreamLimiter(limit=0)
+        self.finish.set()
+        for _ in range(5):
+            self.assertEqual((await self.call())[0]["status"], 200)
+        self.assertEqual(self.middleware.limiter.stats['max_active'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
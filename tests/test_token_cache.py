@@ -0,0 +1,151 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license.
+# See LICENSE file in the project root for full license information.
+import asyncio
+import itertools
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from azure.core.credentials import AccessToken
+
+from api.token_cache import CachingTokenCredential, FileTokenCache
+
+SCOPE = "https://ai.azure.com/.default"
+
+
+def get_inner_credential(now, lifetime=3600):
+    """Return the mock credential, issuing the numbered tokens."""
+    counter = itertools.count(1)
+    credential = MagicMock()
+    credential.get_token.side_effect = lambda *scopes, **kwargs: AccessToken(
+        f"token_{next(counter)}", int(now[0] + lifetime))
+    return credential
+
+
+class TestTokenCache(unittest.IsolatedAsyncioTestCase):
+    """Tests for the pre-warmed and shared tokens."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'tokens.json')
+        self.now = [1000.0]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    async def test_prewarm(self):
+        """Test that the requests get the pre-warmed token from memory."""
+        inner = get_inner_credential(self.now)
+        credential = CachingTokenCredential(inner, timer=lambda: self.now[0])
+        self.assertTrue(await credential.prewarm(SCOPE))
+        for _ in range(3):
+            self.assertEqual((await credential.get_token(SCOPE)).token, "token_1")
+        self.assertEqual(inner.get_token.call_count, 1)
+        self.assertEqual(credential.stats['memory_hits'], 3)
+
+        self.now[0] += 3600 - 30
+        self.assertEqual((await credential.get_token(SCOPE)).token, "token_2")
+        self.assertEqual((await credential.get_token(SCOPE, claims='{"access_token": {}}')).token, "token_3")
+
+    async def test_acquire_in_thread(self):
+        """Test that the token, which is not in memory, is acquired under the file lock outside the event loop."""
+        threads = []
+        inner = MagicMock()
+        inner.get_token.side_effect = lambda *scopes, **kwargs: threads.append(
+            threading.current_thread()) or AccessToken("token", int(self.now[0] + 3600))
+        credential = CachingTokenCredential(inner, cache=FileTokenCache(self.path), timer=lambda: self.now[0])
+        self.assertEqual((await credential.get_token(SCOPE)).token, "token")
+        self.assertEqual((await credential.get_token(SCOPE, claims="{}")).token, "token")
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    async def test_prewarm_failed(self):
+        """Test that the failed pre-warming falls back to the acquisition by the request."""
+        inner = MagicMock()
+        inner.get_token.side_effect = [ValueError("No credential"), AccessToken("token", 5000)]
+        credential = CachingTokenCredential(inner, timer=lambda: self.now[0])
+        with self.assertLogs("azureaiapp", level="WARNING"):
+            self.assertFalse(await credential.prewarm(SCOPE))
+        self.assertEqual((await credential.get_token(SCOPE)).token, "token")
+
+    async def test_shared_file(self):
+        """Test that the workers share the token through the file, readable only by the owner."""
+        inner_1 = get_inner_credential(self.now)
+        inner_2 = get_inner_credential(self.now)
+        worker_1 = CachingTokenCredential(inner_1, cache=FileTokenCache(self.path), timer=lambda: self.now[0])
+        worker_2 = CachingTokenCredential(inner_2, cache=FileTokenCache(self.path), timer=lambda: self.now[0])
+        await worker_1.prewarm(SCOPE)
+        await worker_2.prewarm(SCOPE)
+        self.assertEqual((await worker_2.get_token(SCOPE)).token, "token_1")
+        inner_2.get_token.assert_not_called()
+        self.assertEqual(worker_2.stats['file_hits'], 1)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+        # The token, expiring within the refresh margin, is acquired again by the first worker only.
+        self.now[0] += 3600 - 300
+        await worker_2.prewarm(SCOPE)
+        await worker_1.prewarm(SCOPE)
+        self.assertEqual((await worker_1.get_token(SCOPE)).token, "token_1")
+        self.assertEqual(inner_1.get_token.call_count, 1)
+        self.assertEqual(inner_2.get_token.call_count, 1)
+
+    async def test_corrupted_file(self):
+        """Test that the unreadable file is replaced."""
+        with open(self.path, 'w') as f:
+            f.write("[")
+        credential = CachingTokenCredential(get_inner_credential(self.now), cache=FileTokenCache(self.path))
+        await credential.prewarm(SCOPE)
+        self.assertEqual(FileTokenCache(self.path).get(SCOPE).token, "token_1")
+
+    async def test_refresh(self):
+        """Test that the token is refreshed in the background before it expires."""
+        inner = get_inner_credential(self.now, lifetime=600)
+        credential = CachingTokenCredential(inner, refresh_margin=600, retry_delay=0.01, timer=lambda: self.now[0])
+        await credential.prewarm(SCOPE)
+        credential.start_refresh(SCOPE)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            self.now[0] += 1
+            if credential.stats['refreshed'] >= 2:
+                break
+        await credential.stop()
+        self.assertGreaterEqual(credential.stats['refreshed'], 2)
+        self.assertNotEqual((await credential.get_token(SCOPE)).token, "token_1")
+        self.assertEqual(credential.stats['acquired'], inner.get_token.call_count)
+
+    async def test_refresh_same_token(self):
+        """Test that the token, returned again by the wrapped credential, is not counted as refreshed."""
+        inner = MagicMock()
+        inner.get_token.return_value = AccessToken("token", int(self.now[0] + 300))
+        credential = CachingTokenCredential(inner, refresh_margin=600, retry_delay=0.01, timer=lambda: self.now[0])
+        await credential.prewarm(SCOPE)
+        credential.start_refresh(SCOPE)
+        await asyncio.sleep(0.1)
+        self.assertGreater(inner.get_token.call_count, 3)
+        self.assertEqual(credential.stats['refreshed'], 0)
+        inner.get_token.return_value = AccessToken("token_2", int(self.now[0] + 3600))
+        await asyncio.sleep(0.05)
+        await credential.stop()
+        self.assertEqual(credential.stats['refreshed'], 1)
+
+    async def test_refresh_after_failed_prewarm(self):
+        """Test that the token, which was not acquired at startup, is acquired by the refresh."""
+        inner = MagicMock()
+        inner.get_token.side_effect = [ValueError("No credential"), AccessToken("token", int(self.now[0] + 3600))]
+        credential = CachingTokenCredential(inner, retry_delay=0.01, timer=lambda: self.now[0])
+        with self.assertLogs("azureaiapp", level="WARNING"):
+            self.assertFalse(await credential.prewarm(SCOPE))
+        credential.start_refresh(SCOPE)
+        await asyncio.sleep(0.05)
+        await credential.stop()
+        self.assertEqual(credential.stats['refreshed'], 1)
+        self.assertEqual((await credential.get_token(SCOPE)).token, "token")
+        self.assertEqual(inner.get_token.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()